@@ -52,17 +52,12 @@ class GeneratorToFunction(codemod.ContextAwareTransformer):
         original_node: cst.GeneratorExp,
         updated_node: cst.GeneratorExp,
     ) -> typing.Union[cst.BaseList, cst.RemovalSentinel]:
-        return updated_node.deep_replace(
-            updated_node,
-            cst.ListComp(elt=updated_node.elt, for_in=updated_node.for_in),
-        )
+        return cst.ListComp(elt=updated_node.elt, for_in=updated_node.for_in)
 
     def leave_Yield(
         self, original_node: "Yield", updated_node: "Yield"
     ) -> "BaseExpression":
-        return updated_node.deep_replace(
-            updated_node, cst.Return(value=updated_node.value)
-        )
+        return cst.Return(value=updated_node.value)
 
 
 class RewriteTypeChecks(codemod.ContextAwareTransformer):
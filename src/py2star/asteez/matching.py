@@ -0,0 +1,187 @@
+"""
+Cheaper ``@m.call_if_inside``/``@m.visit``/``@m.leave`` evaluation.
+
+:class:`libcst.matchers.MatcherDecoratableTransformer` evaluates every
+gating and ``@m.leave`` matcher of a transformer against every node it
+visits, each time going through ``matches()``/``extract()`` (which builds a
+metadata fetcher) before finding out that, say, a ``m.Call`` matcher can
+never match a ``Name``. :class:`MatcherTransformer` works out which node
+types every matcher could possibly match and only evaluates it on those.
+
+Within :func:`counting`, every evaluation is also counted and timed per
+decorated method, to see where the matcher time goes:
+
+    with matching.counting() as stats:
+        transformer.transform_module(module)
+    matching.report(stats)
+"""
+import contextlib
+import dataclasses
+import sys
+import time
+from typing import Dict, FrozenSet, Optional
+
+import libcst as cst
+import libcst.matchers as m
+from libcst import codemod
+from libcst.matchers import _decorators, _visitors
+from libcst.matchers._matcher_base import _ExtractMatchingNode, _InverseOf
+
+_DECORATOR_ATTRS = {
+    _decorators.VISIT_POSITIVE_MATCHER_ATTR: "call_if_inside",
+    _decorators.VISIT_NEGATIVE_MATCHER_ATTR: "call_if_not_inside",
+    _decorators.CONSTRUCTED_VISIT_MATCHER_ATTR: "visit",
+    _decorators.CONSTRUCTED_LEAVE_MATCHER_ATTR: "leave",
+}
+
+
+@dataclasses.dataclass
+class MatcherStats:
+    evaluations: int = 0
+    hits: int = 0
+    skipped: int = 0  # nodes the type pre-filter ruled out
+    seconds: float = 0.0
+
+
+# decorated method => stats, while counting()
+_stats: Optional[Dict[str, MatcherStats]] = None
+
+
+@contextlib.contextmanager
+def counting():
+    global _stats
+    previous, _stats = _stats, {}
+    try:
+        yield _stats
+    finally:
+        _stats = previous
+
+
+def report(stats: Dict[str, MatcherStats], out=None) -> None:
+    out = out or sys.stdout
+    print(
+        f"{'decorated method':<60} {'evals':>8} {'hits':>6} "
+        f"{'skipped':>8} {'ms':>8}",
+        file=out,
+    )
+    for label, s in sorted(stats.items(), key=lambda kv: -kv[1].seconds):
+        print(
+            f"{label:<60} {s.evaluations:8d} {s.hits:6d} {s.skipped:8d} "
+            f"{s.seconds * 1000:8.2f}",
+            file=out,
+        )
+
+
+def possible_types(matcher) -> Optional[FrozenSet[str]]:
+    """
+    names of the node classes matcher can match (libcst compares class
+    names), or None if it cannot be told without evaluating it
+    """
+    if isinstance(matcher, _ExtractMatchingNode):
+        return possible_types(matcher.matcher)
+    if isinstance(matcher, (m.OneOf, m.TypeOf)):
+        options = [possible_types(o) for o in matcher.options]
+        if any(o is None for o in options):
+            return None
+        return frozenset().union(*options)
+    if isinstance(matcher, m.AllOf):
+        options = [possible_types(o) for o in matcher.options]
+        known = [o for o in options if o is not None]
+        return frozenset.intersection(*known) if known else None
+    if isinstance(matcher, (_InverseOf, m.MatchIfTrue)) or not isinstance(
+        matcher, m.BaseMatcherNode
+    ):
+        return None
+    if isinstance(matcher, (m.MatchMetadata, m.MatchMetadataIfTrue)):
+        return None
+    return frozenset([type(matcher).__name__])
+
+
+class MatcherTransformer(codemod.ContextAwareTransformer):
+    """
+    A ContextAwareTransformer whose matcher decorators are only evaluated
+    on nodes of a type they can match. It mirrors
+    ``MatcherDecoratableTransformer.on_visit``/``on_leave`` of libcst 0.3.
+    """
+
+    # off to measure what the pre-filter saves
+    prefilter = True
+
+    def __init__(self, context):
+        super().__init__(context)
+        matchers = [
+            *self._matchers,
+            *self._extra_visit_funcs,
+            *self._extra_leave_funcs,
+        ]
+        self._possible_types = {mt: possible_types(mt) for mt in matchers}
+        self._leave_funcs = list(reversed(self._extra_leave_funcs.items()))
+        methods: Dict[object, list] = {}
+        for name in dir(type(self)):
+            func = getattr(type(self), name, None)
+            for attr, decorator in _DECORATOR_ATTRS.items():
+                for mt in getattr(func, attr, ()):
+                    methods.setdefault(mt, []).append(
+                        f"{type(self).__name__}.{name} @{decorator}"
+                    )
+        self._labels = {mt: ", ".join(methods.get(mt, ())) for mt in matchers}
+
+    def _matches(self, node: cst.CSTNode, matcher) -> bool:
+        names = self._possible_types[matcher]
+        ruled_out = (
+            self.prefilter
+            and names is not None
+            and type(node).__name__ not in names
+        )
+        if _stats is None:
+            return not ruled_out and self.matches(node, matcher)
+        stats = _stats.setdefault(self._labels[matcher], MatcherStats())
+        if ruled_out:
+            stats.skipped += 1
+            return False
+        started = time.perf_counter()
+        result = self.matches(node, matcher)
+        stats.seconds += time.perf_counter() - started
+        stats.evaluations += 1
+        stats.hits += result
+        return result
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        for matcher, existing_node in self._matchers.items():
+            if existing_node is None and self._matches(node, matcher):
+                self._matchers[matcher] = node
+        for matcher, visit_funcs in self._extra_visit_funcs.items():
+            if self._matches(node, matcher):
+                for visit_func in visit_funcs:
+                    if _visitors._should_allow_visit(
+                        self._matchers, visit_func
+                    ):
+                        visit_func(node)
+        if not _visitors._should_allow_visit(
+            self._matchers, getattr(self, f"visit_{type(node).__name__}", None)
+        ):
+            return True
+        return cst.CSTTransformer.on_visit(self, node)
+
+    def on_leave(self, original_node, updated_node):
+        if _visitors._should_allow_visit(
+            self._matchers,
+            getattr(self, f"leave_{type(original_node).__name__}", None),
+        ):
+            retval = cst.CSTTransformer.on_leave(
+                self, original_node, updated_node
+            )
+        else:
+            retval = updated_node
+        for matcher, leave_funcs in self._leave_funcs:
+            if not self._matches(original_node, matcher):
+                continue
+            for leave_func in leave_funcs:
+                if _visitors._should_allow_visit(
+                    self._matchers, leave_func
+                ) and isinstance(retval, cst.CSTNode):
+                    retval = leave_func(original_node, retval)
+        for matcher, existing_node in self._matchers.items():
+            if existing_node is original_node:
+                self._matchers[matcher] = None
+        return retval
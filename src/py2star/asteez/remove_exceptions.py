@@ -1,4 +1,3 @@
-import functools
 import itertools
 import typing
 from typing import Union
@@ -22,10 +21,17 @@ from libcst import (
 import libcst.matchers as m
 from libcst.codemod import CodemodContext
 from libcst.codemod.visitors import AddImportsVisitor
-from libcst.metadata import ParentNodeProvider
+from libcst.metadata import (
+    ClassScope,
+    GlobalScope,
+    ParentNodeProvider,
+    ScopeProvider,
+)
+
+from py2star.asteez.matching import MatcherTransformer
 
 
-class DesugarDecorators(codemod.ContextAwareTransformer):
+class DesugarDecorators(MatcherTransformer):
     """
     @decorator
     def foo(a, b):
@@ -37,12 +43,23 @@ class DesugarDecorators(codemod.ContextAwareTransformer):
         return True
     foo = decorator(foo)
 
+    With ``desugar_methods=False`` the methods of a class keep their
+    decorators, for a class encoding that hoists them out of the class.
     """
 
-    def __init__(self, context, exclude_decorators=None, noop=False) -> None:
+    METADATA_DEPENDENCIES = (ParentNodeProvider,)
+
+    def __init__(
+        self,
+        context,
+        exclude_decorators=None,
+        noop=False,
+        desugar_methods=True,
+    ) -> None:
         super(DesugarDecorators, self).__init__(context)
         self.excluded = exclude_decorators if exclude_decorators else []
         self.noop = noop
+        self.desugar_methods = desugar_methods
 
     @m.call_if_inside(m.ClassDef(decorators=[m.AtLeastN(n=1)]))
     def leave_ClassDef(
@@ -64,6 +81,8 @@ class DesugarDecorators(codemod.ContextAwareTransformer):
     ) -> Union[
         "BaseStatement", FlattenSentinel["BaseStatement"], RemovalSentinel
     ]:
+        if not self.desugar_methods and self._is_method(original_node):
+            return updated_node
         fn = ensure_type(updated_node.name, cst.Name)
         fn_name = fn
         for d in reversed(updated_node.decorators):
@@ -82,8 +101,13 @@ class DesugarDecorators(codemod.ContextAwareTransformer):
             [undecorated, cst.SimpleStatementLine(body=[result])]
         )
 
+    def _is_method(self, node: cst.FunctionDef) -> bool:
+        block = self.get_metadata(ParentNodeProvider, node, None)
+        parent = self.get_metadata(ParentNodeProvider, block, None)
+        return isinstance(parent, cst.ClassDef)
 
-class AssertStatementRewriter(codemod.ContextAwareTransformer):
+
+class AssertStatementRewriter(MatcherTransformer):
     """
     assert 1 == 1, "what?"
     |_ => if not (1 == 1):
@@ -153,10 +177,10 @@ class AssertStatementRewriter(codemod.ContextAwareTransformer):
                 ],
             ),
         )
-        return updated_node.deep_replace(updated_node, if_stmt)
+        return if_stmt
 
 
-class SwapByteStringPrefixes(codemod.ContextAwareTransformer):
+class SwapByteStringPrefixes(MatcherTransformer):
     @m.call_if_inside(m.SimpleString(value=m.MatchRegex(r"""^br["'].+?""")))
     def leave_SimpleString(
         self, original_node: "SimpleString", updated_node: "SimpleString"
@@ -166,7 +190,7 @@ class SwapByteStringPrefixes(codemod.ContextAwareTransformer):
         )
 
 
-class SubMethodsWithLibraryCallsInstead(codemod.ContextAwareTransformer):
+class SubMethodsWithLibraryCallsInstead(MatcherTransformer):
     """
     str.decode(xxxx) => codecs.decode(xxxx)
     str.encode(xxxx) => codecs.encode(xxxx)
@@ -228,7 +252,7 @@ class SubMethodsWithLibraryCallsInstead(codemod.ContextAwareTransformer):
                 ),
             ],
         )
-        return un.deep_replace(un, expr)
+        return expr
 
     # TODO: I dont' think the below is no longer needed
     @m.call_if_inside(
@@ -246,21 +270,58 @@ class SubMethodsWithLibraryCallsInstead(codemod.ContextAwareTransformer):
     ) -> "BaseExpression":
         AddImportsVisitor.add_needed_import(self.context, "codecs")
         AddImportsVisitor.add_needed_import(self.context, "binascii")
-        return un.deep_replace(
-            un,
-            cst.parse_expression(
-                f"codecs.decode(binascii.hexlify({un.func.value.value}), encoding='utf-8')"
-            ),
+        return cst.parse_expression(
+            f"codecs.decode(binascii.hexlify({un.func.value.value}), encoding='utf-8')"
+        )
+
+
+def _string_kind(node: cst.SimpleString):
+    """plain, bytes or raw (or raw bytes) and the quote used"""
+    prefix = node.prefix.lower()
+    return "b" in prefix, "r" in prefix, node.quote
+
+
+def _fold_strings(
+    left: cst.SimpleString, right: cst.SimpleString
+) -> typing.Optional[cst.SimpleString]:
+    """
+    one literal for ``left right`` if both are of the same kind and gluing
+    their bodies together keeps the value, e.g. ``"\\1" "2"`` does not.
+    """
+    if _string_kind(left) != _string_kind(right):
+        return None
+    end = -len(left.quote)
+    body = (
+        left.value[len(left.prefix) + len(left.quote) : end]
+        + right.value[len(right.prefix) + len(right.quote) : end]
+    )
+    folded = left.with_changes(
+        value=f"{left.prefix}{left.quote}{body}{left.quote}"
+    )
+    try:
+        same = folded.evaluated_value == (
+            left.evaluated_value + right.evaluated_value
         )
+    except (SyntaxError, ValueError):
+        return None
+    return folded if same else None
 
 
 class RewriteImplicitStringConcat(codemod.ContextAwareTransformer):
     """
-    a = (" "
-         " ")
+    Adjacent literals of the same kind are folded at transpile time and
+    ``+`` is only kept around the parts that cannot be folded:
+
+    a = ("foo "
+         "bar")
+    b = ("foo "
+         f"{bar} "
+         "baz")
     ==>
-    a = (" " +
-    " ")
+    a = ("foo bar")
+    b = ("foo " +
+         f"{bar} " +
+         "baz")
     """
 
     METADATA_DEPENDENCIES = (ParentNodeProvider,)
@@ -273,56 +334,66 @@ class RewriteImplicitStringConcat(codemod.ContextAwareTransformer):
         # be a logic error if it's a multi-line string:
         #
         #    a = ("foo"
-        #        "boo"
+        #        f"{boo}"
         #        "zoo")
         #
         #    should be transformed to:
         #
         #    a = ("foo" +
-        #        "boo" +
+        #        f"{boo}" +
         #        "zoo")
         #
         # but it will fail if we only replace the leaf node (i.e.:
         #
         #
         #    a = "foo"   <--- logic error!
-        #        ("boo" +
+        #        (f"{boo}" +
         #        "zoo")
         #
         # so we have to find the parent node first, then traverse down
         # the tree and replace all ConcatenatedString with the binary
-        # operations ("foo" + "boo" + "zoo"), etc.
+        # operations ("foo" + f"{boo}" + "zoo"), etc.
         parent = self.get_metadata(ParentNodeProvider, original)
         if isinstance(parent, (cst.ConcatenatedString,)):
             return updated  # it's not the parent node, so return.
 
-        # ok this is the parent node.
-        ws_between = updated.whitespace_between
+        # ok this is the parent node, flatten it into the pieces and the
+        # whitespace that follows each of them (except the last)
+        pieces, whitespace = [], []
         curr = updated
-
-        # take the left most string
-        # z = [curr.left]
-        z = []
-        # and traverse the right node creating binary operations
-        while (
-            curr is not None
-            and hasattr(curr, "right")
-            and isinstance(curr.right, (cst.ConcatenatedString,))
-        ):
-            z.append(curr.left)
+        while isinstance(curr, cst.ConcatenatedString):
+            pieces.append(curr.left)
+            whitespace.append(curr.whitespace_between)
             curr = curr.right
-        z.append(curr.left)
-        z = z[::-1]
-
-        node = functools.reduce(
-            lambda right, left: cst.BinaryOperation(
-                left=left,
-                operator=cst.Add(whitespace_after=ws_between),
-                right=right,
-            ),
-            z,
-            curr.right,
-        )
+        pieces.append(curr)
+
+        # fold runs of literals, keeping the line breaks between the parts
+        # that are left
+        parts, breaks = [pieces[0]], []
+        for ws, piece in zip(whitespace, pieces[1:]):
+            folded = None
+            if isinstance(parts[-1], cst.SimpleString) and isinstance(
+                piece, cst.SimpleString
+            ):
+                folded = _fold_strings(parts[-1], piece)
+            if folded is not None:
+                parts[-1] = folded
+            else:
+                parts.append(piece)
+                breaks.append(ws)
+
+        if len(parts) == 1:
+            return parts[0].with_changes(lpar=updated.lpar, rpar=updated.rpar)
+
+        node = parts[0]
+        for ws, part in zip(breaks, parts[1:]):
+            node = cst.BinaryOperation(
+                left=node,
+                operator=cst.Add(whitespace_after=ws),
+                right=part,
+            )
+        if updated.lpar:
+            return node.with_changes(lpar=updated.lpar, rpar=updated.rpar)
         return node.with_changes(
             lpar=[
                 cst.LeftParen(
@@ -341,7 +412,7 @@ class RewriteImplicitStringConcat(codemod.ContextAwareTransformer):
         )
 
 
-class UnpackTargetAssignments(codemod.ContextAwareTransformer):
+class UnpackTargetAssignments(MatcherTransformer):
     """
     a = b = "xyz"
 
@@ -401,7 +472,7 @@ class UnpackTargetAssignments(codemod.ContextAwareTransformer):
         return cst.FlattenSentinel(stmts)
 
 
-class DesugarBuiltinOperators(codemod.ContextAwareTransformer):
+class DesugarBuiltinOperators(MatcherTransformer):
     """
     - ** to pow
     """
@@ -419,7 +490,41 @@ class DesugarBuiltinOperators(codemod.ContextAwareTransformer):
         )
 
 
-class DesugarSetSyntax(codemod.ContextAwareTransformer):
+class DesugarSetSyntax(MatcherTransformer):
+    """
+    Set literals become ``Set([...])`` from the ``sets`` module, except for
+    sets that are only ever used in ``in``/``not in`` tests::
+
+        _ALGORITHMS = {"RS256", "ES256"}
+        ==>
+        _ALGORITHMS = {"RS256": True, "ES256": True}
+
+    which keeps the tests as they are, with native dict lookups. Scope
+    analysis makes sure such a set is bound once and never mutated,
+    iterated or passed around in this module. At module level only
+    ``_private`` names not listed in ``__all__`` are lowered, other modules
+    can import a public name and do anything with it.
+    """
+
+    METADATA_DEPENDENCIES = (ScopeProvider, ParentNodeProvider)
+
+    def __init__(self, context):
+        super().__init__(context)
+        self._exported = set()
+
+    def visit_Module(self, node: cst.Module) -> typing.Optional[bool]:
+        dunder_all = m.Assign(
+            targets=[m.AssignTarget(target=m.Name("__all__"))],
+            value=m.List() | m.Tuple(),
+        )
+        for assign in m.findall(node, dunder_all):
+            self._exported.update(
+                e.value.evaluated_value
+                for e in assign.value.elements
+                if m.matches(e.value, m.SimpleString())
+            )
+        return True
+
     @m.call_if_inside(m.Assign(value=m.Set(elements=m.DoNotCare())))
     def leave_Assign(
         self, original_node: "Assign", updated_node: "Assign"
@@ -431,8 +536,68 @@ class DesugarSetSyntax(codemod.ContextAwareTransformer):
         """
         x = {1,2} => x = set([1,2])
         """
+        if self._is_membership_only(original_node):
+            return self.convert_set_expr_to_dict(original_node, updated_node)
         return self.convert_set_expr_to_fn(original_node, updated_node)
 
+    def _is_membership_only(self, node: "Assign") -> bool:
+        if not m.matches(
+            node,
+            m.Assign(
+                targets=[m.AssignTarget(target=m.Name())],
+                value=m.Set(elements=[m.ZeroOrMore(m.Element())]),
+            ),
+        ):
+            return False
+        target = node.targets[0].target
+        try:
+            scope = self.get_metadata(ScopeProvider, node)
+        except KeyError:
+            return False
+        if isinstance(scope, ClassScope) or target.value in self._exported:
+            # reachable through attributes, which scopes do not track
+            return False
+        if isinstance(scope, GlobalScope) and not target.value.startswith("_"):
+            # other modules may import it
+            return False
+        assignments = scope.assignments[target.value]
+        if len(assignments) != 1:
+            return False
+        references = list(assignments)[0].references
+        if not references:
+            return False
+        for access in references:
+            parent = self.get_metadata(ParentNodeProvider, access.node, None)
+            if not m.matches(
+                parent, m.ComparisonTarget(operator=m.In() | m.NotIn())
+            ):
+                return False
+            if parent.comparator is not access.node:
+                return False
+        return True
+
+    def convert_set_expr_to_dict(
+        self, original_node: "Assign", updated_node: "Assign"
+    ) -> "Assign":
+        """
+        x = {1,2} => x = {1: True,2: True}
+        """
+        value = updated_node.value
+        return updated_node.with_changes(
+            value=cst.Dict(
+                elements=[
+                    cst.DictElement(
+                        key=e.value, value=cst.Name("True"), comma=e.comma
+                    )
+                    for e in value.elements
+                ],
+                lbrace=value.lbrace,
+                rbrace=value.rbrace,
+                lpar=value.lpar,
+                rpar=value.rpar,
+            )
+        )
+
     @m.call_if_inside(m.Expr(value=m.Set(elements=m.DoNotCare())))
     def leave_Expr(
         self, original_node: "Expr", updated_node: "Expr"
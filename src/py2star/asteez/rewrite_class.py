@@ -6,8 +6,52 @@ import libcst as cst
 from libcst import codemod, ensure_type
 from libcst import matchers as m
 from libcst.codemod import CodemodContext
+from libcst.codemod.visitors import AddImportsVisitor
 from libcst.metadata import ScopeProvider, ClassScope
 
+# how classes are encoded as functions:
+#   new_class: types.new_class() with the methods of the class body
+#   mutablestruct: a constructor that re-defines every method per instance
+#   shared: methods are defined once at module level, the constructor binds
+#           them to each instance with larky.partial()
+CLASS_ENCODINGS = ("new_class", "mutablestruct", "shared")
+
+
+class _Rename(cst.CSTTransformer):
+    """renames names, but not attributes, keywords or parameters"""
+
+    def __init__(self, names: typing.Mapping[str, str]):
+        super().__init__()
+        self.names = names
+
+    def leave_Name(self, original_node, updated_node):
+        if updated_node.value in self.names:
+            return updated_node.with_changes(
+                value=self.names[updated_node.value]
+            )
+        return updated_node
+
+    def leave_Attribute(self, original_node, updated_node):
+        return updated_node.with_changes(attr=original_node.attr)
+
+    def leave_Arg(self, original_node, updated_node):
+        return updated_node.with_changes(keyword=original_node.keyword)
+
+    def leave_Param(self, original_node, updated_node):
+        return updated_node.with_changes(name=original_node.name)
+
+
+def _rename(node: cst.CSTNode, names: typing.Mapping[str, str]):
+    return node.visit(_Rename(names)) if names else node
+
+
+def _assign(name: str, value: cst.BaseExpression) -> cst.SimpleStatementLine:
+    return cst.SimpleStatementLine(
+        body=[
+            cst.Assign(targets=[cst.AssignTarget(cst.Name(name))], value=value)
+        ]
+    )
+
 
 # class ClassToFunctionRewriter(cst.CSTTransformer):
 
@@ -42,6 +86,13 @@ class ClassToFunctionRewriter(codemod.ContextAwareTransformer):
             default=False,
             action="store_true",
         )
+        arg_parser.add_argument(
+            "--class-encoding",
+            dest="class_encoding",
+            help="How classes are translated (overrides --use-mutablestruct)",
+            default=None,
+            choices=CLASS_ENCODINGS,
+        )
 
     def __init__(
         self,
@@ -49,11 +100,19 @@ class ClassToFunctionRewriter(codemod.ContextAwareTransformer):
         namespace_defs=False,
         remove_decorators=False,
         use_mutablestruct=False,
+        class_encoding=None,
     ) -> None:
         super(ClassToFunctionRewriter, self).__init__(context)
         self.namespace_defs = namespace_defs
         self.remove_decorators = remove_decorators
-        self.use_mutablestruct = use_mutablestruct
+        if class_encoding is None:
+            class_encoding = (
+                "mutablestruct" if use_mutablestruct else "new_class"
+            )
+        if class_encoding not in CLASS_ENCODINGS:
+            raise ValueError(f"unknown class encoding: {class_encoding!r}")
+        self.class_encoding = class_encoding
+        self.use_mutablestruct = class_encoding == "mutablestruct"
         self.stack = []
         # self.parent_class = None
         # self.init_params = None
@@ -123,7 +182,8 @@ class ClassToFunctionRewriter(codemod.ContextAwareTransformer):
         cst.FlattenSentinel[cst.BaseStatement],
         cst.RemovalSentinel,
     ]:
-        if not self.class_name:
+        if not self.class_name or self.class_encoding == "shared":
+            # shared methods are hoisted out in leave_ClassDef
             return updated_node
         if self.use_mutablestruct:
             return self.with_mutablestruct(original_node, updated_node)
@@ -394,6 +454,10 @@ class ClassToFunctionRewriter(codemod.ContextAwareTransformer):
         cst.FlattenSentinel[cst.BaseStatement],
         cst.RemovalSentinel,
     ]:
+        if self.class_encoding == "shared":
+            result = self.create_shared_class(updated_node)
+            self.stack.pop()
+            return result
         # # params.with_changes(params=params)
         # # params = cst.Parameters()
         # params = (
@@ -417,13 +481,10 @@ class ClassToFunctionRewriter(codemod.ContextAwareTransformer):
         new_name = updated_node.name.value
         if not self.use_mutablestruct:
             new_name = "_class_" + new_name
-        result = updated_node.deep_replace(
-            updated_node,
-            cst.FunctionDef(
-                name=cst.Name(value=new_name),
-                params=params,
-                body=body,
-            ),
+        result = cst.FunctionDef(
+            name=cst.Name(value=new_name),
+            params=params,
+            body=body,
         )
         self.stack.pop()
         if self.use_mutablestruct:
@@ -483,6 +544,217 @@ class ClassToFunctionRewriter(codemod.ContextAwareTransformer):
             header=block.header,
         )
 
+    def create_shared_class(self, updated_node: cst.ClassDef):
+        """
+        class Point(object):
+            ORIGIN = (0, 0)
+
+            def __init__(self, x, y=0):
+                self.x = x
+
+            def norm(self):
+                return self.x
+
+        becomes:
+
+        _Point_ORIGIN = (0, 0)
+
+        def _Point___init__(self, x, y=0):
+            self.x = x
+
+        def _Point_norm(self):
+            return self.x
+
+        def Point(x, y=0):
+            self = larky.mutablestruct(__name__='Point', __class__=Point)
+            self.ORIGIN = _Point_ORIGIN
+            self.norm = larky.partial(_Point_norm, self)
+            _Point___init__(self, x, y)
+            return self
+
+        so creating an instance binds the methods instead of re-creating
+        every one of them. Other decorators (``@property``, descriptors) now
+        apply to a module function and bases are not inherited, both get a
+        ``PY2LARKY`` comment.
+        """
+        cls = self.class_name
+        hoisted, binds, docstring, init = [], [], None, None
+        # class body name => module level name, of what is hoisted so far
+        renamed: typing.Dict[str, str] = {}
+        methods = set()
+        for stmt in updated_node.body.body:
+            if isinstance(stmt, cst.FunctionDef):
+                name = stmt.name.value
+                shared = f"_{cls}_{name}"
+                kind = self._method_kind(stmt)
+                decorators = [
+                    d
+                    for d in stmt.decorators
+                    if not m.matches(d, self._BINDING_DECORATOR)
+                ]
+                hoisted.append(
+                    stmt.with_changes(
+                        name=cst.Name(shared),
+                        decorators=[],
+                        leading_lines=[
+                            *stmt.leading_lines,
+                            *self._decorator_notes(decorators),
+                        ],
+                    )
+                )
+                if decorators:
+                    # what is left applies to the module level function
+                    value = cst.Name(shared)
+                    for d in reversed(decorators):
+                        decorator = _rename(d.decorator, renamed)
+                        value = cst.Call(decorator, args=[cst.Arg(value)])
+                    hoisted.append(_assign(shared, value))
+                renamed[name] = shared
+                methods.add(name)
+                if name == "__init__" and kind == "method":
+                    init = stmt
+                elif kind == "staticmethod":
+                    binds.append(f"self.{name} = {shared}")
+                elif kind == "classmethod":
+                    binds.append(
+                        f"self.{name} = larky.partial({shared}, {cls})"
+                    )
+                else:
+                    binds.append(
+                        f"self.{name} = larky.partial({shared}, self)"
+                    )
+            elif m.matches(
+                stmt,
+                m.SimpleStatementLine(
+                    body=[m.Assign(targets=[m.AssignTarget(target=m.Name())])]
+                ),
+            ):
+                assign = stmt.body[0]
+                name = assign.targets[0].target.value
+                shared = f"_{cls}_{name}"
+                if name in methods and m.matches(assign.value, m.Name(name)):
+                    # f = f, left by a desugared @staticmethod
+                    continue
+                # the class body sees what it defined before, the module
+                # sees it under its hoisted name
+                value = _rename(assign.value, renamed)
+                hoisted.append(
+                    _assign(shared, value).with_changes(
+                        leading_lines=stmt.leading_lines
+                    )
+                )
+                if name not in methods:
+                    # else a desugared decorator, name = decorator(name),
+                    # of a method that is already bound
+                    binds.append(f"self.{name} = {shared}")
+                renamed[name] = shared
+            elif docstring is None and m.matches(
+                stmt,
+                m.SimpleStatementLine(body=[m.Expr(value=m.SimpleString())]),
+            ):
+                docstring = stmt
+            # anything else (pass, ...) has no place in the constructor
+
+        params = ""
+        body = [
+            f"self = larky.mutablestruct(__name__='{cls}', __class__={cls})",
+            *binds,
+        ]
+        if init is not None:
+            init_params = init.params.with_changes(
+                params=FunctionParameterStripper.strip_function_params(
+                    init.params, ["self"]
+                )
+            )
+            params = cst.Module([]).code_for_node(init_params)
+            args = ["self", *self._forward_args(init_params)]
+            body.append(f"_{cls}___init__({', '.join(args)})")
+        body.append("return self")
+        constructor = cst.parse_statement(
+            f"def {cls}({params}):\n"
+            + "".join(f"    {line}\n" for line in body)
+        )
+        if docstring is not None:
+            constructor = constructor.with_changes(
+                body=constructor.body.with_changes(
+                    body=[docstring, *constructor.body.body]
+                )
+            )
+        AddImportsVisitor.add_needed_import(self.context, "larky", "larky")
+        constructor = constructor.with_changes(
+            leading_lines=[
+                *([cst.EmptyLine()] if hoisted else []),
+                *self._base_notes(updated_node),
+            ]
+        )
+        statements = [*hoisted, constructor]
+        statements[0] = statements[0].with_changes(
+            leading_lines=[
+                *updated_node.leading_lines,
+                *(
+                    line
+                    for line in statements[0].leading_lines
+                    if line.comment is not None
+                ),
+            ]
+        )
+        return cst.FlattenSentinel(statements)
+
+    _BINDING_DECORATOR = m.Decorator(
+        decorator=m.Name("staticmethod") | m.Name("classmethod")
+    )
+
+    @staticmethod
+    def _note(text: str) -> cst.EmptyLine:
+        return cst.EmptyLine(comment=cst.Comment(f"# PY2LARKY: {text}"))
+
+    def _decorator_notes(self, decorators) -> typing.List[cst.EmptyLine]:
+        if not decorators:
+            return []
+        code = cst.Module([]).code_for_node
+        names = ", ".join(f"@{code(d.decorator)}" for d in decorators)
+        return [
+            self._note(f"{names} decorated a method of {self.class_name}")
+        ]
+
+    def _base_notes(self, node: cst.ClassDef) -> typing.List[cst.EmptyLine]:
+        code = cst.Module([]).code_for_node
+        lost = [
+            code(arg)
+            for arg in (*node.bases, *node.keywords)
+            if not m.matches(arg, m.Arg(value=m.Name("object"), keyword=None))
+        ]
+        if not lost:
+            return []
+        return [
+            self._note(
+                f"{self.class_name} does not inherit from "
+                f"{', '.join(a.rstrip(', ') for a in lost)}"
+            )
+        ]
+
+    @staticmethod
+    def _method_kind(node: cst.FunctionDef) -> str:
+        for d in node.decorators:
+            if m.matches(d.decorator, m.Name("staticmethod")):
+                return "staticmethod"
+            if m.matches(d.decorator, m.Name("classmethod")):
+                return "classmethod"
+        return "method"
+
+    @staticmethod
+    def _forward_args(params: cst.Parameters) -> typing.List[str]:
+        """call arguments passing every parameter of params through"""
+        positional = (*params.posonly_params, *params.params)
+        args = [p.name.value for p in positional]
+        if isinstance(params.star_arg, cst.Param):
+            args.append(f"*{params.star_arg.name.value}")
+        for kw in params.kwonly_params:
+            args.append(f"{kw.name.value}={kw.name.value}")
+        if params.star_kwarg is not None:
+            args.append(f"**{params.star_kwarg.name.value}")
+        return args
+
     @staticmethod
     def append_return_self_to_body(updated_node):
         """literally...adds return self to the end of the function body"""
@@ -13,6 +13,8 @@ from libcst import (
 )
 from libcst.codemod import CodemodContext, ContextAwareTransformer
 
+from py2star.asteez.matching import MatcherTransformer
+
 
 def pairwise(iterable):
     """s -> (s0,s1), (s1,s2), (s2, s3), ..."""
@@ -69,7 +71,7 @@ class UnchainComparison(codemod.ContextAwareTransformer):
         new_node: cst.BooleanOperation = reduce(
             build_comparison_tree, ands[1:], ands[0]
         )
-        return updated_node.deep_replace(updated_node, new_node)
+        return new_node
 
     @staticmethod
     def _is_chained_compare(node: cst.Comparison):
@@ -81,7 +83,7 @@ class UnchainComparison(codemod.ContextAwareTransformer):
         return len(node.comparisons) > 1
 
 
-class IsComparisonTransformer(codemod.ContextAwareTransformer):
+class IsComparisonTransformer(MatcherTransformer):
     def __init__(self, context=None):
         context = context if context else CodemodContext()
         super(IsComparisonTransformer, self).__init__(context)
@@ -113,7 +115,7 @@ class IsComparisonTransformer(codemod.ContextAwareTransformer):
         )
 
 
-class RemoveIfNameEqualsMain(codemod.ContextAwareTransformer):
+class RemoveIfNameEqualsMain(MatcherTransformer):
     def __init__(self, context):
         super(RemoveIfNameEqualsMain, self).__init__(context)
 
@@ -9,7 +9,6 @@ from typing import Dict, Sequence, Set, Union, cast
 import libcst as cst
 import libcst.codemod
 import libcst.matchers as m
-from importanize import utils as importutils
 
 # from libcst.codemod.visitors import AddImportsVisitor
 from libcst import (
@@ -27,6 +26,13 @@ from libcst.metadata import (
     ParentNodeProvider,
     QualifiedNameProvider,
 )
+from py2star.asteez.matching import MatcherTransformer
+from py2star.import_map import ImportMap, default_import_map
+from py2star.module_index import (
+    PackageIndex,
+    StdlibIndex,
+    default_stdlib_index,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -114,12 +120,22 @@ class RemoveUnusedImports(cst.CSTTransformer):
         return self.leave_import_alike(original_node, updated_node)
 
 
-def in_stdlib_namespace(mod_name):
-    if importutils.is_std_lib(mod_name):
-        return True
-    if mod_name.lower() in ("larky", "sets"):
-        return True
-    return False
+def in_stdlib_namespace(mod_name, stdlib_index: StdlibIndex = None):
+    if stdlib_index is None:
+        stdlib_index = default_stdlib_index()
+    return stdlib_index.is_stdlib(mod_name)
+
+
+def _load_arg(import_as, import_name):
+    """import_as="import_name" keyword argument of a load() statement"""
+    return cst.Arg(
+        keyword=cst.Name(import_as),
+        value=cst.SimpleString(value=import_name),
+        equal=cst.AssignEqual(
+            whitespace_before=cst.SimpleWhitespace(""),
+            whitespace_after=cst.SimpleWhitespace(""),
+        ),
+    )
 
 
 # check AddImportsVisitor
@@ -136,12 +152,39 @@ class RewriteImports(codemod.ContextAwareTransformer):
     )
     FUTURE_IMPORT = "__future__"
 
-    def __init__(self, context=None, allowed=None):
+    def __init__(
+        self,
+        context=None,
+        allowed=None,
+        stdlib_index=None,
+        package_index=None,
+        import_map=None,
+    ):
         context = context if context else CodemodContext()
         super(RewriteImports, self).__init__(context)
         if not allowed:
             allowed = []
         self.allowed = allowed
+        if stdlib_index is None:
+            stdlib_index = self.context.scratch.get("stdlib_index")
+        self.stdlib_index = stdlib_index
+        # project wide index of modules, shared across a batch run
+        if package_index is None:
+            package_index = self.context.scratch.get("package_index")
+        self.package_index: typing.Optional[PackageIndex] = package_index
+        # same module => larky module map as fixes.fix_known_imports
+        if import_map is None:
+            import_map = self.context.scratch.get("import_map")
+        self.import_map: ImportMap = import_map or default_import_map()
+
+    def namespace(self, mod_name: str) -> str:
+        if self.package_index and self.package_index.is_project_module(
+            mod_name
+        ):
+            return "vendor"
+        if in_stdlib_namespace(mod_name, self.stdlib_index):
+            return "stdlib"
+        return "vendor"
 
     def remove_future_imports(
         self, updated_node: cst.ImportFrom
@@ -210,22 +253,34 @@ class RewriteImports(codemod.ContextAwareTransformer):
             else:
                 mod_name = import_attr.value
 
-        ns = "stdlib" if in_stdlib_namespace(mod_name) else "vendor"
+        mapped = self.import_map.resolve(mod_name)
         try:
-            pkg = f'"@{ns}//{mod_name.replace(".", "/")}"'
+            if mapped:
+                ns, path = mapped
+            else:
+                ns, path = self.namespace(mod_name), mod_name.replace(".", "/")
         except AttributeError as e:
             # ipdb.set_trace()
             raise AttributeError(
                 f"parent node: {updated_node.names} and child node: {mod_name}"
             ) from e
+        pkg = f'"@{ns}//{path}"'
 
         args = [cst.Arg(value=cst.SimpleString(pkg))]
 
-        try:
+        if type(updated_node.names) == cst.ImportStar:
+            self._compile_star_to_larky_load(args, mod_name)
+        else:
             self._compile_to_larky_load(args, updated_node)
-        except TypeError:
-            if type(updated_node.names) != cst.ImportStar:
-                raise
+
+        if (
+            mapped
+            and type(updated_node) == cst.Import
+            and type(updated_node.names[0].name) == cst.Name
+        ):
+            # import assertpy => load("@vendor//asserts", assertpy="asserts")
+            symbol = cst.SimpleString(f'"{path.rpartition("/")[2]}"')
+            args[1:] = [a.with_changes(value=symbol) for a in args[1:]]
 
         load_function = cst.Call(func=cst.Name(value="load"), args=args)
         return cst.FlattenSentinel([cst.Expr(load_function)])
@@ -240,6 +295,13 @@ class RewriteImports(codemod.ContextAwareTransformer):
                 return mod_name
 
         # we are a relative import!
+        if self.package_index and self.context.filename:
+            resolved = self.package_index.resolve(
+                self.context.filename, relative_imports, mod_name
+            )
+            if resolved is not None:
+                return resolved
+
         if self.context.full_module_name is None and mod_name:
             print(
                 "attempting to rewrite relative import",
@@ -276,6 +338,17 @@ class RewriteImports(codemod.ContextAwareTransformer):
                 name_root = name_root[:-1]
         return f"{name_root}{mod_name}"
 
+    def _compile_star_to_larky_load(self, args, mod_name):
+        """
+        from x import * => load("@vendor//x", a="a", b="b") if the index
+        knows what x exports, otherwise load("@vendor//x")
+        """
+        if not self.package_index:
+            return args
+        for name in self.package_index.exports(mod_name):
+            args.append(_load_arg(name, f'"{name}"'))
+        return args
+
     @staticmethod
     def _compile_to_larky_load(args, updated_node):
         names = cast(Sequence[cst.ImportAlias], updated_node.names)
@@ -295,16 +368,7 @@ class RewriteImports(codemod.ContextAwareTransformer):
                 import_name = f'"{name.value}"'
                 import_as = f"{name.value}"
 
-            args.append(
-                cst.Arg(
-                    keyword=cst.Name(import_as),
-                    value=cst.SimpleString(value=import_name),
-                    equal=cst.AssignEqual(
-                        whitespace_before=cst.SimpleWhitespace(""),
-                        whitespace_after=cst.SimpleWhitespace(""),
-                    ),
-                )
-            )
+            args.append(_load_arg(import_as, import_name))
         return args
 
     def leave_Import(
@@ -328,7 +392,7 @@ class RewriteImports(codemod.ContextAwareTransformer):
     #     return updated_node
 
 
-class RemoveDelKeyword(codemod.ContextAwareTransformer):
+class RemoveDelKeyword(MatcherTransformer):
     METADATA_DEPENDENCIES = (
         cst.metadata.ParentNodeProvider,
         cst.metadata.ScopeProvider,
@@ -392,22 +456,23 @@ class RemoveDelKeyword(codemod.ContextAwareTransformer):
                         subscript.upper.value +
                         ("," + subscript.step.value if subscript.step else "") +
                         ")")
-            un = updated_node.deep_replace(
-                updated_node,
-                cst.helpers.parse_template_statement(
-                    # "operator.delitem({value}.{attr}, {slice})",
-                    "operator.delitem({value}, {slice})",
-                    config=self.module.config_for_parsing,
-                    value=updated_node.body[0].target.value,
-                    # attr=updated_node.target.value.attr,
-                    slice=value,
-                ),
+            return cst.helpers.parse_template_statement(
+                # "operator.delitem({value}.{attr}, {slice})",
+                "operator.delitem({value}, {slice})",
+                config=self.module.config_for_parsing,
+                value=updated_node.body[0].target.value,
+                # attr=updated_node.target.value.attr,
+                slice=value,
             )
-            return un
         return updated_node
 
 
-class LarkyImportSorter(codemod.ContextAwareTransformer):
+def _load_sort_key(name):
+    module, call = name
+    return module.value, cst.Module([]).code_for_node(call)
+
+
+class LarkyImportSorter(MatcherTransformer):
     METADATA_DEPENDENCIES = (
         cst.metadata.ScopeProvider,
         cst.metadata.PositionProvider,
@@ -468,8 +533,9 @@ class LarkyImportSorter(codemod.ContextAwareTransformer):
             else:
                 body.extend(
                     cst.SimpleStatementLine(body=[cst.Expr(value=y)])
-                    # sort imports in lexicographic order
-                    for x, y in sorted(self.names, key=lambda x: x[0].value)
+                    # sort imports in lexicographic order, then by what they
+                    # load: names holds nodes, so set order is not stable
+                    for x, y in sorted(self.names, key=_load_sort_key)
                 )
                 break
 
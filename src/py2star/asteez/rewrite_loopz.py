@@ -1,3 +1,4 @@
+import dataclasses
 import sys
 import typing
 
@@ -5,6 +6,7 @@ import libcst as cst
 import libcst.matchers as m
 from libcst import codemod
 from libcst.codemod.visitors import AddImportsVisitor
+from libcst.metadata import ParentNodeProvider, ScopeProvider
 
 
 def invert(node):
@@ -40,7 +42,95 @@ def invert(node):
     return inverse_node
 
 
-class WhileToForLoop(codemod.ContextAwareTransformer):
+# i < n => range(i, n, k), i <= n => range(i, n + 1, k), ...
+_COUNTING_COMPARISONS = {
+    cst.LessThan: (cst.AddAssign, 0),
+    cst.LessThanEqual: (cst.AddAssign, 1),
+    cst.GreaterThan: (cst.SubtractAssign, 0),
+    cst.GreaterThanEqual: (cst.SubtractAssign, -1),
+}
+
+_INT = m.Integer() | m.UnaryOperation(
+    operator=m.Minus(), expression=m.Integer()
+)
+
+
+def _is_int_expr(node) -> bool:
+    """an expression that certainly evaluates to an int"""
+    if m.matches(node, _INT | m.Call(func=m.Name("len") | m.Name("int"))):
+        return True
+    return m.matches(
+        node,
+        m.BinaryOperation(
+            operator=m.Add() | m.Subtract() | m.Multiply() | m.FloorDivide()
+        ),
+    ) and _is_int_expr(node.left) and _is_int_expr(node.right)
+
+
+class _FindContinue(cst.CSTVisitor):
+    """finds a continue of the loop being visited (not of nested loops)"""
+
+    def __init__(self):
+        self.found = False
+
+    def visit_Continue(self, node):
+        self.found = True
+
+    def visit_For(self, node):
+        return False
+
+    def visit_While(self, node):
+        return False
+
+    def visit_FunctionDef(self, node):
+        return False
+
+
+class _ScopeAwareTransformer(codemod.ContextAwareTransformer):
+    METADATA_DEPENDENCIES = (ScopeProvider, ParentNodeProvider)
+
+    def _ancestors(self, node):
+        while node is not None:
+            yield node
+            node = self.get_metadata(ParentNodeProvider, node, None)
+
+    def _within(self, node, ancestor) -> bool:
+        return any(n is ancestor for n in self._ancestors(node))
+
+    def _before(self, node, stmt, block) -> bool:
+        for ancestor in self._ancestors(node):
+            parent = self.get_metadata(ParentNodeProvider, ancestor, None)
+            if parent is block:
+                return block.body.index(ancestor) < block.body.index(stmt)
+        return False
+
+
+class WhileToForLoop(_ScopeAwareTransformer):
+    """
+    ``while`` loops become ``for`` loops, as there are no while loops in
+    Starlark.
+
+    Counting loops, where the counter is only read in the loop and
+    incremented by a constant at the end of it::
+
+        i = 0
+        while i < n:
+            ...
+            i += 1
+
+    become ``for i in range(0, n, 1):``. Every other loop is emulated with
+    ``for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):`` and a test of
+    the inverted condition at the top of its body.
+
+    Counting loops are only recognized when scope metadata is available,
+    i.e. when the transform runs through ``transform_module()``.
+    """
+
+    def __init__(self, context):
+        super().__init__(context)
+        # init statements of counting loops, replaced by range()'s start
+        self._moved_inits = set()
+
     def leave_While(
         self, original_node: cst.While, updated_node: cst.While
     ) -> typing.Union[
@@ -48,6 +138,9 @@ class WhileToForLoop(codemod.ContextAwareTransformer):
         cst.FlattenSentinel["cst.BaseStatement"],
         cst.RemovalSentinel,
     ]:
+        counting_loop = self._counting_loop(original_node, updated_node)
+        if counting_loop is not None:
+            return counting_loop
         try:
             inverse_node = invert(updated_node.test)
         except (AttributeError, IndexError) as e:
@@ -93,4 +186,450 @@ class WhileToForLoop(codemod.ContextAwareTransformer):
             "larky",
             "WHILE_LOOP_EMULATION_ITERATION",
         )
-        return updated_node.deep_replace(updated_node, as_for)
+        return as_for
+
+    def leave_IndentedBlock(
+        self,
+        original_node: cst.IndentedBlock,
+        updated_node: cst.IndentedBlock,
+    ) -> cst.BaseSuite:
+        return updated_node.with_changes(
+            body=self._remove_moved_inits(original_node, updated_node)
+        )
+
+    def leave_Module(
+        self, original_node: cst.Module, updated_node: cst.Module
+    ) -> cst.Module:
+        return updated_node.with_changes(
+            body=self._remove_moved_inits(original_node, updated_node)
+        )
+
+    def _remove_moved_inits(self, original_node, updated_node):
+        # this transformer never adds or removes statements elsewhere, so
+        # original and updated statements line up
+        body, leading_lines = [], []
+        for original, updated in zip(original_node.body, updated_node.body):
+            if original in self._moved_inits:
+                leading_lines += updated.leading_lines
+                continue
+            if leading_lines:
+                updated = updated.with_changes(
+                    leading_lines=[*leading_lines, *updated.leading_lines]
+                )
+                leading_lines = []
+            body.append(updated)
+        return body
+
+    def _counting_loop(
+        self, original_node: cst.While, updated_node: cst.While
+    ) -> typing.Optional[cst.For]:
+        """for i in range(start, stop, step), if the loop is a counting loop"""
+        test = original_node.test
+        if not m.matches(
+            test,
+            m.Comparison(
+                left=m.Name(),
+                comparisons=[
+                    m.ComparisonTarget(
+                        operator=m.LessThan()
+                        | m.LessThanEqual()
+                        | m.GreaterThan()
+                        | m.GreaterThanEqual()
+                    )
+                ],
+            ),
+        ):
+            return None
+        try:
+            scope = self.get_metadata(ScopeProvider, original_node)
+        except KeyError:
+            return None
+        counter = test.left.value
+        stop = test.comparisons[0].comparator
+        increment_op, stop_offset = _COUNTING_COMPARISONS[
+            type(test.comparisons[0].operator)
+        ]
+
+        body = original_node.body.body
+        if not body or not m.matches(
+            body[-1],
+            m.SimpleStatementLine(
+                body=[
+                    m.AugAssign(
+                        target=m.Name(counter),
+                        operator=m.AddAssign() | m.SubtractAssign(),
+                        value=m.Integer(),
+                    )
+                ]
+            ),
+        ):
+            return None
+        increment = body[-1].body[0]
+        step = int(increment.value.value, 0)
+        if not isinstance(increment.operator, increment_op) or step <= 0:
+            return None
+        finder = _FindContinue()
+        original_node.body.visit(finder)
+        if finder.found:
+            # a continue would skip the increment
+            return None
+        if not self._is_loop_invariant(stop, original_node, scope):
+            return None
+        init = self._counter_init(counter, original_node, increment, scope)
+        if init is None:
+            return None
+
+        self._moved_inits.add(init)
+        start = init.body[0].value
+        if stop_offset and m.matches(stop, m.Integer()):
+            stop = int(stop.value, 0) + stop_offset
+            stop = cst.parse_expression(str(stop))
+        elif stop_offset:
+            stop = cst.BinaryOperation(
+                left=stop,
+                operator=cst.Add() if stop_offset > 0 else cst.Subtract(),
+                right=cst.Integer("1"),
+            )
+        if increment_op is cst.SubtractAssign:
+            step = -step
+        args = [cst.Arg(start), cst.Arg(stop)]
+        if step != 1:
+            args.append(cst.Arg(cst.parse_expression(str(step))))
+        block: cst.IndentedBlock = updated_node.body
+        # without the increment
+        body = block.body[:-1] or [cst.SimpleStatementLine([cst.Pass()])]
+        return cst.For(
+            target=cst.Name(counter),
+            iter=cst.Call(func=cst.Name("range"), args=args),
+            body=block.with_changes(body=body),
+            orelse=updated_node.orelse,
+            leading_lines=updated_node.leading_lines,
+        )
+
+    def _is_loop_invariant(self, stop, loop, scope) -> bool:
+        """the loop cannot change stop, so range() can evaluate it once"""
+        if m.matches(stop, _INT):
+            return True
+        if m.matches(stop, m.Name()):
+            # assigned an int once, outside the loop; a parameter or a
+            # global could be anything, and range() only takes ints
+            assignments = scope.assignments[stop.value]
+            if len(assignments) != 1:
+                return False
+            (assignment,) = assignments
+            target = self.get_metadata(
+                ParentNodeProvider, assignment.node, None
+            )
+            assign = self.get_metadata(ParentNodeProvider, target, None)
+            return (
+                isinstance(target, cst.AssignTarget)
+                and isinstance(assign, cst.Assign)
+                and len(assign.targets) == 1
+                and _is_int_expr(assign.value)
+                and not self._within(assign, loop)
+            )
+        if m.matches(
+            stop, m.Call(func=m.Name("len"), args=[m.Arg(m.Name())])
+        ):
+            # only item reads and writes, which cannot change the length;
+            # a slice assignment can, and so can an alias of the sequence
+            name = stop.args[0].value.value
+            for a in scope.assignments[name]:
+                if self._within(a.node, loop):
+                    return False
+            for access in scope.accesses[name]:
+                if self._is_aliased(access.node):
+                    return False
+                if not self._within(access.node, loop.body):
+                    continue
+                parent = self.get_metadata(ParentNodeProvider, access.node)
+                if not isinstance(parent, cst.Subscript) or any(
+                    isinstance(n, cst.Del) for n in self._ancestors(parent)
+                ):
+                    return False
+                if self._is_stored(parent) and any(
+                    isinstance(e.slice, cst.Slice) for e in parent.slice
+                ):
+                    return False
+            return True
+        return False
+
+    def _is_aliased(self, node) -> bool:
+        """node is (an element of) the value of an assignment"""
+        child = node
+        for parent in self._ancestors(self._parent(node)):
+            if isinstance(parent, (cst.Element, cst.Tuple, cst.List)):
+                child = parent
+                continue
+            return (
+                isinstance(parent, (cst.Assign, cst.AnnAssign, cst.NamedExpr))
+                and parent.value is child
+            )
+        return False
+
+    def _is_stored(self, node) -> bool:
+        """node is (part of) the target of an assignment"""
+        child = node
+        for parent in self._ancestors(self._parent(node)):
+            if isinstance(parent, cst.AssignTarget):
+                return True
+            if isinstance(parent, (cst.AugAssign, cst.AnnAssign)):
+                return parent.target is child
+            if isinstance(parent, cst.BaseStatement):
+                return False
+            child = parent
+        return False
+
+    def _parent(self, node):
+        return self.get_metadata(ParentNodeProvider, node, None)
+
+    def _counter_init(self, counter, loop, increment, scope):
+        """
+        ``counter = <int expression>`` before the loop (right before it,
+        unless the value is a literal), if that and the increment are the
+        only assignments to the counter and it is only read in the loop
+        test and body (not in its else clause), or None.
+        """
+        block = self.get_metadata(ParentNodeProvider, loop)
+        index = block.body.index(loop)
+        assigns_counter = m.SimpleStatementLine(
+            body=[m.Assign(targets=[m.AssignTarget(target=m.Name(counter))])]
+        )
+        for init_index in range(index - 1, -1, -1):
+            init = block.body[init_index]
+            if m.matches(init, assigns_counter):
+                break
+        else:
+            return None
+        value = init.body[0].value
+        if not _is_int_expr(value):
+            # range() only takes ints
+            return None
+        if init_index != index - 1 and not m.matches(value, _INT):
+            # the statements in between could change what it evaluates to
+            return None
+        init_target = init.body[0].targets[0].target
+        assignments = scope.assignments[counter]
+        for assignment in assignments:
+            if assignment.node is init_target:
+                continue
+            if assignment.node is increment.target:
+                continue
+            # another assignment before the init is harmless, anything
+            # else would see (or change) a different value
+            if not self._before(assignment.node, init, block):
+                return None
+        for assignment in assignments:
+            for access in assignment.references:
+                if access.scope is not scope:
+                    # read by a closure, which would see the last value
+                    return None
+                if not (
+                    self._within(access.node, loop.test)
+                    or self._within(access.node, loop.body)
+                ):
+                    # the counter ends up one step earlier after a for
+                    # loop, in its else clause too
+                    return None
+        return init
+
+
+_LOOP = m.For() | m.While()
+_ACCUMULATE = m.AugAssign(target=m.Name(), operator=m.AddAssign())
+
+
+@dataclasses.dataclass
+class _Accumulator:
+    name: str
+    init: cst.SimpleStatementLine
+    join: str  # "" or b""
+    appends: typing.List[cst.AugAssign]
+
+
+class StringAccumulationToJoin(_ScopeAwareTransformer):
+    """
+    Strings (or bytes) built with ``+=`` in a loop are quadratic in
+    Starlark, so they are collected in a list and joined once after the
+    loop::
+
+        out = ""
+        for c in data:
+            out += f(c)
+
+    becomes::
+
+        out = []
+        for c in data:
+            out.append(f(c))
+        out = "".join(out)
+
+    Only accumulators initialized with a literal before the loop, in the same
+    block, are rewritten. If the loop reads the accumulator it is left alone
+    and a ``PY2LARKY`` comment is added to the loop instead.
+    """
+
+    def __init__(self, context):
+        super().__init__(context)
+        self._appends: typing.Set[cst.AugAssign] = set()
+        self._inits: typing.Set[cst.SimpleStatementLine] = set()
+        # loop => accumulators to join after it / left alone
+        self._joins: typing.Dict[cst.BaseStatement, list] = {}
+        self._unsafe: typing.Dict[cst.BaseStatement, list] = {}
+
+    def visit_IndentedBlock(self, node: cst.IndentedBlock):
+        self._find_accumulators(node)
+
+    def visit_Module(self, node: cst.Module):
+        self._find_accumulators(node)
+
+    def _find_accumulators(self, block):
+        for index, loop in enumerate(block.body):
+            if not m.matches(loop, _LOOP):
+                continue
+            try:
+                scope = self.get_metadata(ScopeProvider, loop)
+            except KeyError:
+                return
+            appends = {}
+            for aug in m.findall(loop, _ACCUMULATE):
+                if self.get_metadata(ScopeProvider, aug.target) is scope:
+                    appends.setdefault(aug.target.value, []).append(aug)
+            for name, augs in appends.items():
+                accumulator = self._accumulator(
+                    name, augs, block, index, scope
+                )
+                if accumulator is None:
+                    continue
+                if self._is_read(accumulator, loop, scope):
+                    self._unsafe.setdefault(loop, []).append(name)
+                    continue
+                self._joins.setdefault(loop, []).append(accumulator)
+                self._inits.add(accumulator.init)
+                self._appends.update(augs)
+
+    def _accumulator(self, name, augs, block, index, scope):
+        """the accumulator if it starts out as a literal before the loop"""
+        assigns_name = m.SimpleStatementLine(
+            body=[
+                m.Assign(
+                    targets=[m.AssignTarget(target=m.Name(name))],
+                    value=m.SimpleString() | m.FormattedString(),
+                )
+            ]
+        )
+        for init_index in range(index - 1, -1, -1):
+            init = block.body[init_index]
+            if m.matches(init, assigns_name):
+                break
+        else:
+            return None
+        value = init.body[0].value
+        join = '""'
+        if m.matches(value, m.SimpleString()) and "b" in value.prefix.lower():
+            join = 'b""'
+        loop = block.body[index]
+        between = block.body[init_index + 1 : index]
+        init_target = init.body[0].targets[0].target
+        assignments = scope.assignments[name]
+        if not any(a.node is init_target for a in assignments):
+            # global or nonlocal
+            return None
+        targets = {aug.target for aug in augs}
+        for assignment in assignments:
+            if assignment.node in targets or assignment.node is init_target:
+                continue
+            if any(self._within(assignment.node, s) for s in [loop, *between]):
+                # (re)assigned in the loop, e.g. by an inner loop's init
+                return None
+        for access in _references(assignments):
+            if any(self._within(access.node, s) for s in between):
+                return None
+        return _Accumulator(name, init, join, augs)
+
+    def _is_read(self, accumulator, loop, scope) -> bool:
+        assignments = scope.assignments[accumulator.name]
+        return any(
+            self._within(access.node, loop)
+            for access in _references(assignments)
+        )
+
+    def leave_AugAssign(
+        self, original_node: cst.AugAssign, updated_node: cst.AugAssign
+    ) -> cst.BaseSmallStatement:
+        if original_node not in self._appends:
+            return updated_node
+        return cst.Expr(
+            cst.Call(
+                func=cst.Attribute(
+                    value=updated_node.target, attr=cst.Name("append")
+                ),
+                args=[cst.Arg(updated_node.value)],
+            ),
+            semicolon=updated_node.semicolon,
+        )
+
+    def leave_IndentedBlock(
+        self,
+        original_node: cst.IndentedBlock,
+        updated_node: cst.IndentedBlock,
+    ) -> cst.BaseSuite:
+        return updated_node.with_changes(
+            body=self._rewrite_block(original_node, updated_node)
+        )
+
+    def leave_Module(
+        self, original_node: cst.Module, updated_node: cst.Module
+    ) -> cst.Module:
+        return updated_node.with_changes(
+            body=self._rewrite_block(original_node, updated_node)
+        )
+
+    def _rewrite_block(self, original_node, updated_node):
+        # statements are only added after loops of this block, so original
+        # and updated statements line up
+        body = []
+        for original, updated in zip(original_node.body, updated_node.body):
+            if original in self._inits:
+                assign = updated.body[0]
+                value = assign.value
+                empty = isinstance(value, cst.SimpleString) and not (
+                    value.evaluated_value
+                )
+                updated = updated.with_changes(
+                    body=[
+                        assign.with_changes(
+                            value=cst.List(
+                                [] if empty else [cst.Element(value)]
+                            )
+                        )
+                    ]
+                )
+            if original in self._unsafe:
+                names = ", ".join(self._unsafe[original])
+                updated = updated.with_changes(
+                    leading_lines=[
+                        *updated.leading_lines,
+                        cst.EmptyLine(
+                            comment=cst.Comment(
+                                f"# PY2LARKY: {names} += in this loop is "
+                                "quadratic, but it is read in the loop"
+                            )
+                        ),
+                    ]
+                )
+            body.append(updated)
+            for accumulator in self._joins.get(original, ()):
+                name, join = accumulator.name, accumulator.join
+                body.append(
+                    cst.parse_statement(f"{name} = {join}.join({name})")
+                )
+        return body
+
+
+def _references(assignments):
+    seen = set()
+    for assignment in assignments:
+        for access in assignment.references:
+            if access.node not in seen:
+                seen.add(access.node)
+                yield access
@@ -23,6 +23,7 @@ from libcst import (
 )
 from libcst.codemod.visitors import AddImportsVisitor, RemoveImportsVisitor
 
+from py2star.asteez.matching import MatcherTransformer
 from py2star.asteez.rewrite_class import (
     ClassInstanceVariableRemover,
     ClassToFunctionRewriter,
@@ -261,7 +262,7 @@ def _rand(seed=None):
     return f"_larky_{binascii.crc32(seed)}"
 
 
-class UnittestAssertMethodsRewriter(cst.codemod.ContextAwareTransformer):
+class UnittestAssertMethodsRewriter(MatcherTransformer):
     """
     Converts unittest assert methods to larky asserts, i.e.:
 
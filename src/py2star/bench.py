@@ -0,0 +1,526 @@
+"""
+Micro-benchmarks for the py2star pipeline.
+
+Every benchmark is a ``bench_<name>`` function registered with
+:func:`benchmark`. It takes a ``size`` knob and returns a mapping of
+``label -> seconds`` (best of a few runs), so results can be printed or
+compared run over run. Benchmarks registered with a ``unit`` time ``size``
+operations and are also reported as throughput (``<unit>/s``).
+
+The larkify pipeline as a whole is benchmarked by :func:`measure_corpus`:
+the ``tests/data`` files plus synthetic modules are converted several times
+and the median and median absolute deviation of every stage (and every
+transformer) are kept. ``py2star.cli bench --save`` writes them as a
+baseline and ``--compare`` exits non-zero when a stage got slower than the
+baseline by more than ``--threshold``.
+
+Usage:
+
+    python -m py2star.bench              # run everything
+    python -m py2star.bench reindent -s 5000
+    python -m py2star.cli bench --save baseline.json
+    python -m py2star.cli bench --compare baseline.json --threshold 0.2
+"""
+import argparse
+import dataclasses
+import inspect
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import timeit
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Sequence
+
+from libcst.codemod import CodemodContext
+
+from py2star import larky, utils
+
+BENCHMARKS: Dict[str, Callable[..., Dict[str, float]]] = {}
+# benchmark name => unit of the ``size`` operations it times
+UNITS: Dict[str, str] = {}
+
+_FUNCTION_TEMPLATE = '''
+def function_{n}(a, b=None, *args, **kwargs):
+{i}"""Docstring for function {n}."""
+{i}total = 0
+{i}for x in range(a):
+{i}{i}# accumulate
+{i}{i}if x % 2:
+{i}{i}{i}total += x
+{i}{i}else:
+{i}{i}{i}total -= (x +
+{i}{i}{i}          1)
+{i}return total
+
+
+class Class{n}(object):
+{i}def method(self, value):
+{i}{i}try:
+{i}{i}{i}return self.value == value
+{i}{i}except AttributeError:
+{i}{i}{i}return None
+'''
+
+
+def benchmark(fn=None, *, unit=None):
+    """register ``bench_<name>`` under ``<name>``"""
+    if fn is None:
+        return lambda f: benchmark(f, unit=unit)
+    name = fn.__name__[len("bench_") :]
+    BENCHMARKS[name] = fn
+    if unit:
+        UNITS[name] = unit
+    return fn
+
+
+def synthetic_module(n_functions: int, indent: str = "    ") -> str:
+    """a large, valid python module made of ``n_functions`` repeated blocks"""
+    return "".join(
+        _FUNCTION_TEMPLATE.format(n=n, i=indent) for n in range(n_functions)
+    )
+
+
+def best_of(fn, repeat=5, number=1) -> float:
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+
+@benchmark
+def bench_reindent(size=2000):
+    normalized = synthetic_module(size)
+    tabbed = synthetic_module(size, indent="\t")
+
+    def full_reindent(source):
+        r = utils.ReIndenter(io.StringIO(source))
+        r.run()
+        return r.after
+
+    return {
+        "ReIndenter (4 spaces)": best_of(lambda: full_reindent(normalized)),
+        "needs_reindent (4 spaces)": best_of(
+            lambda: utils.needs_reindent(normalized)
+        ),
+        "reindent (4 spaces)": best_of(lambda: utils.reindent(normalized)),
+        "reindent (tabs)": best_of(lambda: utils.reindent(tabbed)),
+    }
+
+
+@benchmark(unit="structs")
+def bench_struct(size=10000):
+    fields = [{"a": n, "b": n + 1, "c": str(n)} for n in range(size)]
+
+    def uncached():
+        for kw in fields:
+            namedtuple("struct", " ".join(kw.keys()))(**kw)
+
+    def cached():
+        for kw in fields:
+            larky.struct(**kw)
+
+    return {
+        "namedtuple per struct": best_of(uncached, repeat=3),
+        "larky.struct": best_of(cached),
+    }
+
+
+_KEY_CLASS = """
+class Key(object):
+    def __init__(self, key, size=16):
+        self.key = key
+        self.size = size
+{methods}
+"""
+
+
+@benchmark(unit="ops")
+def bench_class_encoding(size=10000, methods=8):
+    import libcst
+
+    from py2star.asteez import rewrite_class
+    from py2star.larky import compile_star
+
+    source = _KEY_CLASS.format(
+        methods="".join(
+            f"\n    def m{i}(self, data):\n        return self.key + data\n"
+            for i in range(methods)
+        )
+    )
+    results = {}
+    for encoding in ("mutablestruct", "shared"):
+        rewriter = rewrite_class.ClassToFunctionRewriter(
+            CodemodContext(), class_encoding=encoding
+        )
+        code = rewriter.transform_module(libcst.parse_module(source)).code
+        namespace = {"larky": larky}
+        exec(compile_star(code), namespace)
+        key_cls = namespace["Key"]
+
+        def instantiate():
+            for n in range(size):
+                key_cls(n)
+
+        key = key_cls(1)
+
+        def call():
+            for n in range(size):
+                key.m0(n)
+
+        results[f"{encoding}: instantiate"] = best_of(instantiate)
+        results[f"{encoding}: call a method"] = best_of(call)
+    return results
+
+
+_COUNTING_LOOP = """
+def checksum(data):
+    total = 0
+    i = 0
+    while i < len(data):
+        total = (total + data[i]) % 65521
+        i += 1
+    return total
+"""
+
+
+@benchmark(unit="iterations")
+def bench_while_loop(size=100000):
+    """counting loop as for-range vs the generic while loop emulation"""
+    import libcst
+
+    from py2star.asteez import rewrite_loopz
+    from py2star.larky import compile_star
+
+    data = list(range(size))
+    module = libcst.parse_module(_COUNTING_LOOP)
+    counting = rewrite_loopz.WhileToForLoop(CodemodContext())
+    # without scope metadata every loop gets the generic emulation
+    emulated = module.visit(rewrite_loopz.WhileToForLoop(CodemodContext()))
+    results = {}
+    for label, code in [
+        ("for range()", counting.transform_module(module).code),
+        ("while emulation", emulated.code),
+    ]:
+        namespace = {"WHILE_LOOP_EMULATION_ITERATION": size + 1}
+        exec(compile_star(code), namespace)
+        checksum = namespace["checksum"]
+        results[label] = best_of(lambda: checksum(data))
+    return results
+
+
+# the files every pipeline benchmark converts, in a source checkout
+CORPUS_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "tests", "data"
+)
+BASELINE_VERSION = 1
+
+
+def corpus_files(dirs: Sequence[str] = ()) -> List[str]:
+    """
+    the .py files of dirs (or of tests/data); a missing or empty directory
+    is a ValueError, a smaller corpus would pass for a speed-up
+    """
+    files = []
+    for d in dirs or [CORPUS_DIR]:
+        if not os.path.isdir(d):
+            raise ValueError(f"{d}: no such corpus directory")
+        found = sorted(
+            os.path.join(d, name)
+            for name in os.listdir(d)
+            if name.endswith(".py")
+        )
+        if not found:
+            raise ValueError(f"{d}: no .py files to benchmark")
+        files += found
+    return files
+
+
+def measure_corpus(
+    filenames: Sequence[str], repeat: int = 3, synthetic: int = 10
+) -> Dict[str, List[float]]:
+    """
+    larkify filenames plus a synthetic module of ``synthetic`` blocks
+    ``repeat`` times: stage (or transformer) name => seconds of every run.
+    The whole run is reported as ``total``.
+    """
+    from py2star import cli, metrics
+
+    runs: Dict[str, List[float]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filenames = list(filenames)
+        if synthetic:
+            path = os.path.join(tmp, "synthetic.py")
+            with open(path, "w") as f:
+                f.write(synthetic_module(synthetic))
+            filenames.append(path)
+        args = cli.make_parser().parse_args(["larkify", *filenames])
+        for _ in range(repeat):
+            batch = cli.Batch.from_args(args)
+            for filename in batch.filenames:
+                cli.larkify(filename, args, batch)
+            seconds = {"total": 0.0}
+            for (name, labels), value in batch.metrics.values.items():
+                if name == metrics.STAGE_SECONDS:
+                    seconds[dict(labels)["stage"]] = value
+            for (name, _), histogram in batch.metrics.histograms.items():
+                if name == metrics.FILE_SECONDS:
+                    seconds["total"] += histogram.sum
+            for stage, value in seconds.items():
+                runs.setdefault(stage, []).append(value)
+    return runs
+
+
+@dataclasses.dataclass
+class StageTiming:
+    median: float
+    mad: float  # median absolute deviation, the dispersion between runs
+    runs: List[float]
+
+    @classmethod
+    def of(cls, runs: Sequence[float]) -> "StageTiming":
+        median = statistics.median(runs)
+        mad = statistics.median(abs(r - median) for r in runs)
+        return cls(median, mad, list(runs))
+
+
+def summarize(runs: Dict[str, List[float]]) -> Dict[str, StageTiming]:
+    return {stage: StageTiming.of(r) for stage, r in sorted(runs.items())}
+
+
+def save_baseline(path: str, timings: Dict[str, StageTiming]) -> None:
+    import libcst
+
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "version": BASELINE_VERSION,
+                "python": sys.version,
+                "libcst": getattr(libcst, "__version__", None),
+                "stages": {
+                    stage: dataclasses.asdict(t)
+                    for stage, t in timings.items()
+                },
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_baseline(path: str) -> Dict[str, StageTiming]:
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != BASELINE_VERSION:
+        raise ValueError(f"{path}: not a version {BASELINE_VERSION} baseline")
+    return {
+        stage: StageTiming(**timing)
+        for stage, timing in data["stages"].items()
+    }
+
+
+@dataclasses.dataclass
+class Comparison:
+    stage: str
+    baseline: Optional[StageTiming]
+    current: Optional[StageTiming]
+    regressed: bool = False
+
+    @property
+    def ratio(self) -> Optional[float]:
+        if not (self.baseline and self.current and self.baseline.median):
+            return None
+        return self.current.median / self.baseline.median
+
+
+def compare(
+    baseline: Dict[str, StageTiming],
+    current: Dict[str, StageTiming],
+    threshold: float = 0.2,
+    min_seconds: float = 0.005,
+) -> List[Comparison]:
+    """
+    A stage regressed when its median grew by more than ``threshold``
+    (a fraction of the baseline median), by more than ``min_seconds``, and
+    by more than the dispersion of both sides, so noise in tiny stages
+    does not fail the gate.
+    """
+    comparisons = []
+    for stage in sorted(set(baseline) | set(current)):
+        c = Comparison(stage, baseline.get(stage), current.get(stage))
+        if c.baseline and c.current:
+            delta = c.current.median - c.baseline.median
+            c.regressed = (
+                delta > threshold * c.baseline.median
+                and delta > min_seconds
+                and delta > c.baseline.mad + c.current.mad
+            )
+        comparisons.append(c)
+    return comparisons
+
+
+def _ms(timing: Optional[StageTiming]) -> str:
+    if timing is None:
+        return f"{'-':>18}"
+    return f"{timing.median * 1000:9.2f} ±{timing.mad * 1000:7.2f}"
+
+
+def report(comparisons: List[Comparison], out=None) -> None:
+    out = out or sys.stdout
+    print(
+        f"{'stage':<40} {'baseline ms':>18} {'current ms':>18} {'ratio':>7}",
+        file=out,
+    )
+    for c in sorted(
+        comparisons, key=lambda c: (not c.regressed, -(c.ratio or 0))
+    ):
+        ratio = f"{c.ratio:7.2f}" if c.ratio is not None else f"{'-':>7}"
+        flag = "  REGRESSED" if c.regressed else ""
+        print(
+            f"{c.stage:<40} {_ms(c.baseline)} {_ms(c.current)} {ratio}{flag}",
+            file=out,
+        )
+
+
+@benchmark
+def bench_matchers(size=200, repeat=5):
+    """
+    matcher-decorated rewriters with and without the type pre-filter: the
+    whole traversal, and the time spent evaluating matchers in it
+    """
+    import libcst
+
+    from py2star.asteez import (
+        matching,
+        remove_exceptions,
+        rewrite_comparisons,
+        rewrite_imports,
+    )
+
+    # metadata is resolved once, so only the traversal (and with it the
+    # matcher evaluation) is timed
+    module = libcst.parse_module(synthetic_module(size))
+    wrapper = libcst.MetadataWrapper(module)
+    context = CodemodContext(wrapper=wrapper)
+    transformers = (
+        remove_exceptions.SwapByteStringPrefixes,
+        remove_exceptions.SubMethodsWithLibraryCallsInstead,
+        remove_exceptions.AssertStatementRewriter,
+        remove_exceptions.UnpackTargetAssignments,
+        rewrite_comparisons.RemoveIfNameEqualsMain,
+        rewrite_imports.RemoveDelKeyword,
+    )
+    results = {}
+    for cls in transformers:
+        for prefilter in (False, True):
+            transformer = cls(context)
+            transformer.prefilter = prefilter
+
+            def visit():
+                with transformer.resolve(wrapper):
+                    wrapper.module.visit(transformer)
+
+            label = "type pre-filter" if prefilter else "every node"
+            name = f"{cls.__name__}: visit ({label})"
+            results[name] = best_of(visit, repeat)
+            matcher_seconds = []
+            for _ in range(repeat):
+                with matching.counting() as stats:
+                    visit()
+                matcher_seconds.append(
+                    sum(s.seconds for s in stats.values())
+                )
+            results[f"{cls.__name__}: matchers ({label})"] = min(
+                matcher_seconds
+            )
+    return results
+
+
+def _nested_sources(depth):
+    generators = "(x for x in " * depth + "y" + ")" * depth
+    comparisons = " < ".join(f"x{n}" for n in range(depth))
+    loops = "".join(
+        f"{'    ' * (n + 1)}while i{n} < n:\n" for n in range(depth)
+    )
+    return {
+        "GeneratorToFunction": f"g = {generators}\n",
+        "UnchainComparison": f"c = {comparisons}\n",
+        "WhileToForLoop": f"def f(n):\n{loops}{'    ' * (depth + 1)}pass\n",
+    }
+
+
+def _replacing_via_deep_replace(cls):
+    """cls, but every node its leave hooks replace goes through deep_replace"""
+    import libcst
+
+    class DeepReplacing(cls):
+        def on_leave(self, original_node, updated_node):
+            result = super().on_leave(original_node, updated_node)
+            if isinstance(result, libcst.CSTNode) and (
+                result is not updated_node
+            ):
+                return updated_node.deep_replace(updated_node, result)
+            return result
+
+    return DeepReplacing
+
+
+@benchmark
+def bench_nested_rewrites(size=40):
+    """leave hooks returning their replacement vs going through deep_replace"""
+    import libcst
+
+    from py2star.asteez import functionz, rewrite_comparisons, rewrite_loopz
+
+    transformers = {
+        "GeneratorToFunction": functionz.GeneratorToFunction,
+        "UnchainComparison": rewrite_comparisons.UnchainComparison,
+        "WhileToForLoop": rewrite_loopz.WhileToForLoop,
+    }
+    results = {}
+    for name, source in _nested_sources(size).items():
+        module = libcst.parse_module(source)
+        for label, cls in [
+            ("return", transformers[name]),
+            ("deep_replace", _replacing_via_deep_replace(transformers[name])),
+        ]:
+            transformer = cls(CodemodContext())
+            results[f"{name} ({label})"] = best_of(
+                lambda: transformer.transform_module(module), repeat=3
+            )
+    return results
+
+
+def _default_size(fn):
+    return inspect.signature(fn).parameters["size"].default
+
+
+def run(names=None, size=None, out=sys.stdout):
+    results = {}
+    for name in names or BENCHMARKS:
+        kwargs = {"size": size} if size else {}
+        results[name] = BENCHMARKS[name](**kwargs)
+        unit = UNITS.get(name)
+        ops = size or _default_size(BENCHMARKS[name])
+        for label, seconds in results[name].items():
+            line = f"{name:>12} : {label:<40} {seconds * 1000:10.3f} ms"
+            if unit:
+                line += f" {ops / seconds:14,.0f} {unit}/s"
+            print(line, file=out)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="py2star micro-benchmarks")
+    parser.add_argument(
+        "names", nargs="*", help=f"one of: {', '.join(BENCHMARKS)}"
+    )
+    parser.add_argument("-s", "--size", type=int, default=None)
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    run(args.names, args.size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
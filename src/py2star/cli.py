@@ -1,12 +1,24 @@
 import argparse
 import ast
-import io
+import contextlib
+import dataclasses
+import functools
+import json
 import logging
+import os
 import re
 import sys
-import tokenize
+import time
 from lib2to3 import refactor
-from typing import Optional, Pattern
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+)
 
 import ipdb
 import lib3to6 as three2six
@@ -14,8 +26,17 @@ import libcst
 from lib3to6 import common as three2six_common
 from libcst.codemod import CodemodContext
 from libcst.codemod.visitors import AddImportsVisitor, RemoveImportsVisitor
+from py2star import (
+    bench,
+    definition_index,
+    find_pattern,
+    metrics,
+    profiling,
+    workers,
+)
 from py2star.asteez import (
     functionz,
+    matching,
     remove_exceptions,
     remove_types,
     rewrite_class,
@@ -24,8 +45,13 @@ from py2star.asteez import (
     rewrite_loopz,
     rewrite_tests,
 )
+from py2star.import_map import ImportMap
+from py2star.metrics import Metrics
+from py2star.module_index import STDLIB, VENDOR, PackageIndex, StdlibIndex
+from py2star.sources import SourceStats, read_source
 from py2star.tokenizers import find_definitions
-from py2star.utils import ReIndenter
+from py2star.tracing import Tracer
+from py2star.utils import reindent
 
 logger = logging.getLogger(__name__)
 
@@ -101,39 +127,53 @@ def _add_common(p: argparse.ArgumentParser) -> argparse.ArgumentParser:
     return p
 
 
-def detect_encoding(filename):
-    with open(filename, "rb") as f:
-        try:
-            encoding, _ = tokenize.detect_encoding(f.readline)
-        except SyntaxError as se:
-            logger.exception("%s: SyntaxError: %s", filename, se)
-            return
-    return encoding
+def _add_import_map(p: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    p.add_argument(
+        "--import-map",
+        default=None,
+        metavar="PATH",
+        help="JSON or TOML file mapping modules to (stdlib|vendor, target), "
+        "extending the built-in import map",
+    )
+    return p
 
 
-def fixup_indentation(fileobj):
-    # return f.read()
-    r = ReIndenter(fileobj)
-    r.run()  # ensure spaces vs tabs
+def _import_map(path: Optional[str]) -> Optional[ImportMap]:
+    return ImportMap.load(path) if path else None
 
-    with io.StringIO() as o:
-        o.writelines(r.after)
-        o.flush()
-        return o.getvalue()
 
+def _stdlib_override(value: str) -> Tuple[str, str]:
+    """``MODULE=stdlib|vendor``, for argparse"""
+    mod_name, sep, ns = value.partition("=")
+    if not sep or not all(p.isidentifier() for p in mod_name.split(".")):
+        raise argparse.ArgumentTypeError(
+            f"{value!r} is not MODULE={STDLIB}|{VENDOR}"
+        )
+    if ns not in (STDLIB, VENDOR):
+        raise argparse.ArgumentTypeError(
+            f"{mod_name}: namespace must be {STDLIB} or {VENDOR}, not {ns!r}"
+        )
+    return mod_name, ns
 
-def safe_read(filename):
-    encoding = detect_encoding(filename)
+
+def _read(filename, stats=None):
     try:
-        with open(filename, encoding=encoding) as f:
-            out = fixup_indentation(f)
+        return read_source(filename, stats)
     except IOError as msg:
         logger.exception("%s: I/O Error: %s", filename, msg)
         raise msg
-    return out
 
 
-def onfixes(out, fixers, doprint=True):
+def safe_read(filename, stats=None):
+    # ensure spaces vs tabs, skipping the tokenize pass if it is a no-op
+    return reindent(_read(filename, stats))
+
+
+def _no_span(name):
+    return contextlib.nullcontext()
+
+
+def onfixes(out, fixers, doprint=True, import_map=None, span=_no_span):
     if not fixers:
         _fixers = refactor.get_fixers_from_package("py2star.fixes")
     else:
@@ -145,14 +185,16 @@ def onfixes(out, fixers, doprint=True):
         ]
 
     # out = _lib3to6(filename, out)
+    options = {"import_map": import_map} if import_map else None
 
     for f in _fixers:
         logger.debug("running fixer: %s", f)
         # if not f.endswith("fix_asserts"):
         #     continue
-        tool = refactor.RefactoringTool([f])
-        out = tool.refactor_string(out, "simple_class.py")
-        out = str(out)
+        with span(f.rsplit(".", 1)[-1]):
+            tool = refactor.RefactoringTool([f], options)
+            out = tool.refactor_string(out, "simple_class.py")
+            out = str(out)
     if doprint:
         print(out)
     return out
@@ -181,21 +223,211 @@ def _lib3to6(filename, source_text, install_requires=None, mode="enabled"):
     return fixed_source_text
 
 
-def larkify(filename, args):
+@dataclasses.dataclass
+class Batch:
+    """State shared by every file converted in a single larkify run."""
+
+    stats: SourceStats = dataclasses.field(default_factory=SourceStats)
+    stdlib_index: Optional[StdlibIndex] = None
+    package_index: Optional[PackageIndex] = None
+    import_map: Optional[ImportMap] = None
+    # transformer class name => seconds spent in it, in pipeline order
+    stage_seconds: Dict[str, float] = dataclasses.field(default_factory=dict)
+    # what the file being converted is going through, and who to tell
+    current_stage: Optional[str] = None
+    on_stage: Optional[Callable[[str], None]] = dataclasses.field(
+        default=None, repr=False, compare=False
+    )
+    current_file: Optional[str] = None
+    # set with --trace
+    tracer: Optional[Tracer] = None
+    metrics: Metrics = dataclasses.field(default_factory=Metrics)
+    # transformer class names (or "all") to cProfile, and where to
+    profile: FrozenSet[str] = frozenset()
+    profile_dir: str = "."
+    # (profiler, prefix) to save once the file is converted, untimed
+    profiles: List = dataclasses.field(default_factory=list, repr=False)
+
+    def enter(self, name: str) -> None:
+        self.current_stage = name
+        if self.on_stage is not None:
+            self.on_stage(name)
+
+    @contextlib.contextmanager
+    def converting(self, filename):
+        self.current_file = filename
+        index = self.stdlib_index
+        lookups = (index.hits, index.misses) if index else (0, 0)
+        started = time.perf_counter()
+        try:
+            with self.span(filename, cat="file", filename=filename):
+                yield
+        except Exception:
+            self.metrics.inc(metrics.FILES_FAILED, reason="error")
+            raise
+        else:
+            self.metrics.inc(metrics.FILES_CONVERTED)
+            self.metrics.observe(
+                metrics.FILE_SECONDS, time.perf_counter() - started
+            )
+        finally:
+            if index:
+                hits, misses = lookups
+                self.metrics.inc(
+                    metrics.CACHE_LOOKUPS, index.hits - hits, result="hit"
+                )
+                self.metrics.inc(
+                    metrics.CACHE_LOOKUPS,
+                    index.misses - misses,
+                    result="miss",
+                )
+            while self.profiles:
+                profiling.save(*self.profiles.pop(0))
+
+    def span(self, name: str, cat: str = "stage", filename=None):
+        """a traced span of the current file, if there is a tracer"""
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(
+            name, cat, file=filename or self.current_file
+        )
+
+    @contextlib.contextmanager
+    def step(self, name: str, cat: str = "stage"):
+        """enter stage name of the current file, for its duration"""
+        self.enter(name)
+        started = time.perf_counter()
+        try:
+            with self.span(name, cat):
+                yield
+        finally:
+            self.metrics.inc(
+                metrics.STAGE_SECONDS,
+                time.perf_counter() - started,
+                stage=name,
+            )
+
+    @contextlib.contextmanager
+    def stage(self, transformer):
+        name = type(transformer).__name__
+        started = time.perf_counter()
+        try:
+            with self.step(name, cat="transformer"):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stage_seconds[name] = (
+                self.stage_seconds.get(name, 0.0) + elapsed
+            )
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "Batch":
+        overrides = dict(args.stdlib_override)
+        if args.stdlib_index:
+            stdlib_index = StdlibIndex.load(args.stdlib_index, overrides)
+        else:
+            stdlib_index = StdlibIndex(overrides=overrides)
+        # a single walk of every input, reused by every file in the run
+        package_index = PackageIndex.build(args.filenames)
+        return cls(
+            stdlib_index=stdlib_index,
+            package_index=package_index,
+            import_map=_import_map(args.import_map),
+            profile=frozenset(args.profile_transformer),
+            profile_dir=args.profile_dir,
+        )
+
+    def profiling(self, transformer):
+        """cProfile transformer, if it was asked for"""
+        name = type(transformer).__name__
+        if not self.profile & {name, "all"}:
+            return contextlib.nullcontext()
+        prefix = self.output_path(self.profile_dir, self.current_file)
+        return profiling.profiled(
+            f"{os.path.splitext(prefix)[0]}.{name}", self.profiles
+        )
+
+    @property
+    def filenames(self):
+        return self.package_index.sources if self.package_index else []
+
+    def module_name(self, pkg_path, filename):
+        if pkg_path or not self.package_index:
+            return _full_module_name(pkg_path, filename)
+        return self.package_index.module_name(filename)
+
+    def output_path(self, output_dir, filename):
+        """mirror the package layout of filename below output_dir"""
+        info = self.package_index.get(filename) if self.package_index else None
+        relpath = (
+            os.path.relpath(info.path, info.root)
+            if info
+            else os.path.basename(filename)
+        )
+        return os.path.join(output_dir, os.path.splitext(relpath)[0] + ".star")
+
+
+def get_class_encoding(args):
+    if getattr(args, "class_encoding", None):
+        return args.class_encoding
+    return "mutablestruct" if args.use_mutablestruct else "new_class"
+
+
+# off by default, turned on with --asteez NAME
+OPTIONAL_TRANSFORMERS = {
+    t.__name__: t for t in (rewrite_loopz.StringAccumulationToJoin,)
+}
+
+
+def _optional(context, args):
+    names = getattr(args, "asteez", None) or ()
+    return [OPTIONAL_TRANSFORMERS[name](context) for name in names]
+
+
+def _enabled(transformers, args):
+    skip = set(getattr(args, "skip_transformer", None) or ())
+    return [t for t in transformers if type(t).__name__ not in skip]
+
+
+def larkify(filename, args, batch=None):
+    if batch is None:
+        batch = Batch()
+    with batch.converting(filename):
+        return _larkify(filename, args, batch)
+
+
+def _larkify(filename, args, batch):
     # TODO: select larkifiers dynamically? maybe look into instagram/fixers?
+    class_encoding = get_class_encoding(args)
     fixers = args.fixers
-    out = safe_read(filename)
+    with batch.step("read"):
+        out = _read(filename, batch.stats)
+    with batch.step("reindent"):
+        out = reindent(out)
     if fixers:
+        batch.enter("fixers")
         doprint = args.log_level.lower() == "debug"
-        out = onfixes(out, fixers, doprint=doprint)
+        out = onfixes(
+            out,
+            fixers,
+            doprint=doprint,
+            import_map=batch.import_map,
+            span=functools.partial(batch.step, cat="fixer"),
+        )
 
-    program = libcst.parse_module(out)
+    with batch.step("parse"):
+        program = libcst.parse_module(out)
     wrapper = libcst.MetadataWrapper(program)
     context = CodemodContext(
         wrapper=wrapper,
         filename=filename,
-        full_module_name=_full_module_name(args.pkg_path, filename),
-        scratch={"config": {"use_error_not_fail": args.use_error_not_fail}},
+        full_module_name=batch.module_name(args.pkg_path, filename),
+        scratch={
+            "config": {"use_error_not_fail": args.use_error_not_fail},
+            "stdlib_index": batch.stdlib_index,
+            "package_index": batch.package_index,
+            "import_map": batch.import_map,
+        },
     )
     transformers = [
         rewrite_comparisons.RemoveIfNameEqualsMain(context),
@@ -209,13 +441,16 @@ def larkify(filename, args):
                 "staticmethod",
                 "classmethod",
             )
-            if args.use_mutablestruct
+            if class_encoding != "new_class"
             else None,
+            # hoisted methods are desugared by ClassToFunctionRewriter
+            desugar_methods=class_encoding != "shared",
         ),
         remove_exceptions.DesugarBuiltinOperators(context),
         remove_exceptions.DesugarSetSyntax(context),
         remove_exceptions.CommentTopLevelTryBlocks(context),
         rewrite_imports.RemoveDelKeyword(context),
+        *_optional(context, args),
         rewrite_loopz.WhileToForLoop(context),
         functionz.RewriteTypeChecks(context),
         functionz.GeneratorToFunction(context),
@@ -241,13 +476,16 @@ def larkify(filename, args):
             rewrite_class.ClassToFunctionRewriter(
                 context,
                 remove_decorators=False,
-                use_mutablestruct=args.use_mutablestruct,
+                class_encoding=class_encoding,
             ),
         ]
-    for t in transformers:
+    for t in _enabled(transformers, args):
         logger.debug("running transformer: %s", t)
-        with t.resolve(wrapper):
-            program = t.transform_module(program)
+        with batch.stage(t), contextlib.ExitStack() as stack:
+            with batch.span("metadata"):
+                stack.enter_context(t.resolve(wrapper))
+            with batch.profiling(t):
+                program = t.transform_module(program)
 
     transformers = [
         AddImportsVisitor(context),
@@ -257,17 +495,21 @@ def larkify(filename, args):
     ]
 
     wrapper = libcst.MetadataWrapper(program)
-    for t in transformers:
-        wrapper.resolve_many(t.get_inherited_dependencies())
-        logger.debug("running transformer: %s", t)
-        with t.resolve(wrapper):
-            program = t.transform_module(program)
-
-    print(program.code)
+    for t in _enabled(transformers, args):
+        with batch.stage(t):
+            with batch.span("metadata"):
+                wrapper.resolve_many(t.get_inherited_dependencies())
+            logger.debug("running transformer: %s", t)
+            with t.resolve(wrapper), batch.profiling(t):
+                program = t.transform_module(program)
+
+    with batch.step("codegen"):
+        out = program.code
     if args.for_tests:
         tree = ast.parse(program.code)
         s = functionz.testsuite_generator(tree)
-        print(s)
+        out += s + "\n"
+    return out
 
 
 DOT_PY: Pattern[str] = re.compile(r"(__init__)?\.py$")
@@ -290,7 +532,16 @@ def _full_module_name(pkg_path, filename):
 
 
 def execute(args: argparse.Namespace) -> None:
-    if args.command == "defs":
+    if args.command == "defs" and getattr(args, "index", None):
+        index = definition_index.build_index(
+            [args.filename], args.index, args.jobs
+        )
+        print(
+            f"indexed {len(index)} definitions in {len(index.files)} files "
+            f"({len(index.parsed)} parsed)",
+            file=sys.stderr,
+        )
+    elif args.command == "defs":
         gen = find_definitions(args.filename)
         for definition in gen:
             print(definition.rstrip())
@@ -298,13 +549,117 @@ def execute(args: argparse.Namespace) -> None:
         tree = ast.parse(open(args.filename).read())
         s = functionz.testsuite_generator(tree)
         print(s)
+    elif args.command == "fixpattern":
+        tree = find_pattern.driver.parse_string(args.statement + "\n")
+        print(find_pattern.synthesize(tree, args.match))
+    elif args.command == "bench":
+        _bench(args)
     elif args.command == "fixers":
-        onfixes(args.filename, fixers=args.fixers)
+        onfixes(
+            args.filename,
+            fixers=args.fixers,
+            import_map=_import_map(args.import_map),
+        )
     elif args.command == "larkify":
-        larkify(args.filename, args)
+        started = time.perf_counter()
+        batch = Batch.from_args(args)
+        if args.trace:
+            batch.tracer = Tracer()
+        write = functools.partial(_write_output, args, batch)
+        limits = _limits(args)
+        if args.matcher_stats and (args.jobs or limits):
+            sys.exit("--matcher-stats only counts in-process runs")
+        if args.matcher_stats:
+            with matching.counting() as stats:
+                for filename in batch.filenames:
+                    write(filename, larkify(filename, args, batch))
+            matching.report(stats, sys.stderr)
+        elif args.jobs or limits:
+            retries = workers.run(
+                batch.filenames,
+                functools.partial(larkify, args=args),
+                batch,
+                write,
+                jobs=args.jobs or 1,
+                limits=limits,
+            )
+            _report_retries(args, retries)
+            if args.retry_serially:
+                for retry in retries:
+                    # the retry counts the file again, converted or failed
+                    batch.metrics.inc(
+                        metrics.FILES_FAILED, -1, reason=retry.reason
+                    )
+                    write(retry.filename, larkify(retry.filename, args, batch))
+        else:
+            for filename in batch.filenames:
+                write(filename, larkify(filename, args, batch))
+        print(batch.stats, file=sys.stderr)
+        if batch.tracer:
+            batch.tracer.save(args.trace)
+        batch.metrics.inc(metrics.BYTES_READ, batch.stats.bytes_read)
+        batch.metrics.finish(time.perf_counter() - started)
+        for path in args.metrics:
+            batch.metrics.save(path)
+
+
+def _bench(args):
+    try:
+        filenames = bench.corpus_files(args.corpus)
+        # before --save, which may be the same path
+        baseline = bench.load_baseline(args.compare) if args.compare else {}
+    except (OSError, ValueError) as e:
+        sys.exit(f"bench: {e}")
+    current = bench.summarize(
+        bench.measure_corpus(filenames, args.repeat, args.synthetic)
+    )
+    if args.save:
+        bench.save_baseline(args.save, current)
+    comparisons = bench.compare(
+        baseline, current, args.threshold, args.min_seconds
+    )
+    bench.report(comparisons)
+    regressed = [c.stage for c in comparisons if c.regressed]
+    if regressed:
+        print(
+            f"{len(regressed)} stages regressed by more than "
+            f"{args.threshold:.0%}: {', '.join(regressed)}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
 
+def _write_output(args, batch, filename, out):
+    batch.metrics.inc(metrics.BYTES_WRITTEN, len(out.encode("utf-8")))
+    if not args.output_dir:
+        print(out)
+        return
+    with batch.span("write", filename=filename):
+        output_path = batch.output_path(args.output_dir, filename)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w") as f:
+            f.write(out)
+
+
+def _limits(args) -> workers.Limits:
+    return workers.Limits(
+        deadline=args.file_timeout,
+        max_rss=args.max_rss << 20 if args.max_rss else None,
+        max_files=args.max_files_per_worker,
+    )
+
+
+def _report_retries(args, retries):
+    if args.retry_list:
+        with open(args.retry_list, "w") as f:
+            json.dump([dataclasses.asdict(r) for r in retries], f, indent=2)
+    if retries:
+        print(f"{len(retries)} files to retry serially:", file=sys.stderr)
+    for retry in retries:
+        print(f"  {retry}", file=sys.stderr)
 
-def main():
+
+def make_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="", add_help=False)
     parser.add_argument(
         "-h",
@@ -322,7 +677,24 @@ def main():
     defs = subparsers.add_parser(
         "defs", help="function definitions", parents=[base]
     )
-    defs.add_argument("filename")
+    defs.add_argument(
+        "filename", help="python file, or with --index a directory too"
+    )
+    defs.add_argument(
+        "--index",
+        default=None,
+        metavar="PATH",
+        help="Index every definition below filename into PATH (.json, or "
+        ".sqlite/.db), only re-parsing files whose hash changed",
+    )
+    defs.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Parse this many files at a time with --index "
+        "(default: #cpus)",
+    )
 
     # subcommand 2 -- tests command
     tests = subparsers.add_parser(
@@ -339,6 +711,59 @@ def main():
         parents=[base],
     )
     fixpattern.add_argument("statement")
+    fixpattern.add_argument(
+        "--match",
+        default=None,
+        help="Print the pattern of the subtree with this text instead of "
+        "the whole statement",
+    )
+
+    bench_parser = subparsers.add_parser(
+        "bench",
+        help="Time every larkify stage over the benchmark corpus, "
+        "optionally against a saved baseline",
+        parents=[base],
+    )
+    bench_parser.add_argument(
+        "--save", default=None, metavar="PATH", help="Save the timings"
+    )
+    bench_parser.add_argument(
+        "--compare",
+        default=None,
+        metavar="PATH",
+        help="Compare with a saved baseline and exit with 1 on regressions",
+    )
+    bench_parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs over the corpus"
+    )
+    bench_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Slowdown of a stage median, as a fraction, that fails "
+        "--compare (default: %(default)s)",
+    )
+    bench_parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.005,
+        help="Slowdowns smaller than this never fail --compare",
+    )
+    bench_parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Also convert a synthetic module of N functions and classes",
+    )
+    bench_parser.add_argument(
+        "--corpus",
+        default=[],
+        action="append",
+        metavar="DIR",
+        help="Convert the .py files of DIR instead of tests/data "
+        "(repeatable)",
+    )
 
     # subcommand 3 -- pattern finders
     fixers = subparsers.add_parser(
@@ -348,6 +773,7 @@ def main():
     )
     fixers.add_argument("filename")
     fixers.add_argument("--fixers", default=[], required=False, action="append")
+    _add_import_map(fixers)
 
     larkify = subparsers.add_parser(
         "larkify",
@@ -355,12 +781,29 @@ def main():
         parents=[base],
     )
     # larkify.add_argument("filename", type=argparse.FileType("r"), default="-")
-    larkify.add_argument("filename")
+    larkify.add_argument(
+        "filenames",
+        metavar="filename",
+        nargs="+",
+        help="python files, or directories to convert every .py file in",
+    )
+    larkify.add_argument(
+        "-o",
+        "--output-dir",
+        default=None,
+        help="Write <module>.star files below this directory instead of "
+        "printing them",
+    )
     larkify.add_argument(
         "--fixers", default=[], required=False, action="append"
     )
     larkify.add_argument(
-        "--asteez", default=[], required=False, action="append"
+        "--asteez",
+        default=[],
+        required=False,
+        action="append",
+        choices=sorted(OPTIONAL_TRANSFORMERS),
+        help="Also run this optional transformer",
     )
     larkify.add_argument(
         "--aggressive-codecs", action="store_true", default=False
@@ -377,11 +820,126 @@ def main():
         default=False,
         help="Uses mutablestruct instead of types.new_class for class translation",
     )
+    larkify.add_argument(
+        "--class-encoding",
+        default=None,
+        choices=rewrite_class.CLASS_ENCODINGS,
+        help="How classes are translated: types.new_class (new_class), "
+        "a constructor re-defining its methods (mutablestruct) or one "
+        "binding methods defined once at module level (shared). "
+        "Overrides --use-mutablestruct",
+    )
     larkify.add_argument(
         "-for-tests", "-t", default=False, action="store_true", help="for tests"
     )
+    _add_import_map(larkify)
+    larkify.add_argument(
+        "--stdlib-index",
+        default=None,
+        metavar="PATH",
+        help="Persist the stdlib module index to PATH and reuse it across runs",
+    )
+    larkify.add_argument(
+        "--stdlib-override",
+        default=[],
+        action="append",
+        type=_stdlib_override,
+        metavar="MODULE=stdlib|vendor",
+        help="Force MODULE (and its submodules) into the given load namespace",
+    )
+
+    larkify.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Convert files in this many worker processes",
+    )
+    larkify.add_argument(
+        "--file-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Give up on a file after this long (implies a worker)",
+    )
+    larkify.add_argument(
+        "--max-rss",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="Give up on a file when its worker grows beyond this "
+        "(implies a worker)",
+    )
+    larkify.add_argument(
+        "--max-files-per-worker",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Replace a worker with a fresh process after N files",
+    )
+    larkify.add_argument(
+        "--retry-list",
+        default=None,
+        metavar="PATH",
+        help="Write the files that hit a limit (or failed) to PATH as JSON",
+    )
+    larkify.add_argument(
+        "--retry-serially",
+        action="store_true",
+        default=False,
+        help="Convert the files that hit a limit again, without limits, "
+        "once the rest is done",
+    )
+    larkify.add_argument(
+        "--trace",
+        default=None,
+        metavar="PATH",
+        help="Write a Chrome trace-event file with a span per file and "
+        "stage, for chrome://tracing or ui.perfetto.dev",
+    )
+    larkify.add_argument(
+        "--metrics",
+        default=[],
+        action="append",
+        metavar="PATH",
+        help="Write run metrics to PATH, as JSON for a .json path and in "
+        "the Prometheus textfile format otherwise (repeatable)",
+    )
+    larkify.add_argument(
+        "--profile-transformer",
+        default=[],
+        action="append",
+        metavar="NAME",
+        help="cProfile the transformer class NAME (or all of them) and "
+        "write .pstats and collapsed stack files (repeatable)",
+    )
+    larkify.add_argument(
+        "--profile-dir",
+        default=".",
+        metavar="DIR",
+        help="Where --profile-transformer writes, mirroring the package "
+        "layout (default: .)",
+    )
+    larkify.add_argument(
+        "--matcher-stats",
+        default=False,
+        action="store_true",
+        help="Count and time the matcher decorator evaluations of every "
+        "decorated method (not with --jobs or limits)",
+    )
+    larkify.add_argument(
+        "--skip-transformer",
+        default=[],
+        action="append",
+        metavar="NAME",
+        help="Leave out the transformer with this class name "
+        "(for debugging and benchmarks)",
+    )
+    return parser
+
 
-    args = parser.parse_args()
+def main(argv=None):
+    args = make_parser().parse_args(argv)
     set_log_lvl(args)
     logger.debug(args)
     execute(args)
@@ -0,0 +1,288 @@
+"""
+Project-wide index of every ``def`` and ``class``, the structured
+counterpart of :func:`py2star.tokenizers.find_definitions`.
+
+Every definition is recorded with its qualified name (``pkg.mod.Class.meth``),
+kind, signature, line span and docstring, so porting tools (and the import
+rewriter) can look symbols up without tokenizing sources again. The index
+is saved as JSON or, for a ``.sqlite``/``.db`` path, as a SQLite database,
+and updated incrementally: only files whose hash changed are parsed again,
+on a process pool.
+
+Usage:
+
+    python -m py2star.cli defs src/ --index defs.json
+"""
+import ast
+import concurrent.futures
+import contextlib
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import typing
+
+import astunparse
+
+from py2star.module_index import PackageIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+_unparse = getattr(ast, "unparse", None) or astunparse.unparse
+
+
+@dataclasses.dataclass(frozen=True)
+class Definition:
+    qualname: str
+    name: str
+    kind: str  # class, function or method
+    signature: str
+    lineno: int
+    end_lineno: int
+    docstring: typing.Optional[str]
+    path: str
+
+
+# column order of the saved index, for both formats
+COLUMNS = tuple(f.name for f in dataclasses.fields(Definition))[:-1]
+
+
+def _signature(node) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = [_unparse(b).strip() for b in node.bases]
+        bases += [_unparse(k).strip() for k in node.keywords]
+        return f"class {node.name}({', '.join(bases)})"
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    signature = f"{prefix} {node.name}({_unparse(node.args).strip()})"
+    if node.returns is not None:
+        signature += f" -> {_unparse(node.returns).strip()}"
+    return signature
+
+
+def definitions(
+    source: typing.Union[str, bytes], path: str, module: str
+) -> typing.List[Definition]:
+    """every def and class of a module, in source order"""
+    found = []
+
+    def visit(body, prefix, in_class):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "method" if in_class else "function"
+                children, child_prefix = node.body, f"{node.name}.<locals>"
+            elif isinstance(node, ast.ClassDef):
+                kind, children, child_prefix = "class", node.body, node.name
+            else:
+                # defs inside if/try/with blocks are still module level
+                for field in ("body", "orelse", "finalbody", "handlers"):
+                    visit(getattr(node, field, ()), prefix, in_class)
+                continue
+            qualname = ".".join(p for p in (module, prefix, node.name) if p)
+            found.append(
+                Definition(
+                    qualname=qualname,
+                    name=node.name,
+                    kind=kind,
+                    signature=_signature(node),
+                    lineno=node.lineno,
+                    end_lineno=node.end_lineno,
+                    docstring=ast.get_docstring(node),
+                    path=path,
+                )
+            )
+            visit(
+                children,
+                ".".join(p for p in (prefix, child_prefix) if p),
+                kind == "class",
+            )
+
+    visit(ast.parse(source, path).body, "", False)
+    return found
+
+
+def _index_file(path, module, source):
+    try:
+        return definitions(source, path, module)
+    except (SyntaxError, ValueError) as e:
+        logger.warning("%s: cannot index: %s", path, e)
+        return []
+
+
+@dataclasses.dataclass
+class _File:
+    module: str
+    sha256: str
+    definitions: typing.List[Definition]
+
+
+class DefinitionIndex:
+    def __init__(self):
+        self.files: typing.Dict[str, _File] = {}
+        self._by_qualname: typing.Optional[dict] = None
+        self.parsed: typing.List[str] = []  # files parsed by the last update
+
+    def __len__(self):
+        return sum(len(f.definitions) for f in self.files.values())
+
+    def __iter__(self) -> typing.Iterator[Definition]:
+        for f in self.files.values():
+            yield from f.definitions
+
+    def get(self, qualname) -> typing.Optional[Definition]:
+        if self._by_qualname is None:
+            self._by_qualname = {d.qualname: d for d in self}
+        return self._by_qualname.get(qualname)
+
+    def find(self, name) -> typing.List[Definition]:
+        """every definition called name, or whose qualified name ends so"""
+        return [
+            d
+            for d in self
+            if d.name == name or d.qualname.endswith(f".{name}")
+        ]
+
+    def update(self, paths: typing.Iterable[str], jobs=None) -> None:
+        """
+        (re)index every python file below paths, parsing only the files
+        whose hash changed. Files that are gone are dropped.
+        """
+        package_index = PackageIndex.build(paths)
+        files, changed = {}, []
+        for path in package_index.sources:
+            with open(path, "rb") as f:
+                source = f.read()
+            sha256 = hashlib.sha256(source).hexdigest()
+            module = package_index.module_name(path) or ""
+            previous = self.files.get(path)
+            if previous and (previous.sha256, previous.module) == (
+                sha256,
+                module,
+            ):
+                files[path] = previous
+            else:
+                files[path] = _File(module, sha256, [])
+                changed.append((path, module, source))
+
+        jobs = jobs or os.cpu_count() or 1
+        if jobs > 1 and len(changed) > 1:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                results = list(executor.map(_index_file, *zip(*changed)))
+        else:
+            results = [_index_file(*args) for args in changed]
+        for (path, _, _), found in zip(changed, results):
+            files[path].definitions = found
+        self.files = files
+        self.parsed = [path for path, _, _ in changed]
+        self._by_qualname = None
+
+    @classmethod
+    def load(cls, path: str) -> "DefinitionIndex":
+        """a saved index, or an empty one if there is none (yet)"""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        try:
+            if path.endswith(SQLITE_SUFFIXES):
+                index._load_sqlite(path)
+            else:
+                index._load_json(path)
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            logger.debug("%s: rebuilding definition index: %s", path, e)
+            index.files = {}
+        return index
+
+    def save(self, path: str) -> None:
+        if path.endswith(SQLITE_SUFFIXES):
+            self._save_sqlite(path)
+        else:
+            self._save_json(path)
+
+    def _load_json(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data["version"] != INDEX_VERSION or data["columns"] != list(
+            COLUMNS
+        ):
+            raise ValueError("index was written by another version")
+        for filename, entry in data["files"].items():
+            self.files[filename] = _File(
+                entry["module"],
+                entry["sha256"],
+                [Definition(*row, filename) for row in entry["definitions"]],
+            )
+
+    def _save_json(self, path):
+        files = {
+            filename: {
+                "module": f.module,
+                "sha256": f.sha256,
+                "definitions": [
+                    dataclasses.astuple(d)[:-1] for d in f.definitions
+                ],
+            }
+            for filename, f in self.files.items()
+        }
+        with open(path, "w") as f:
+            json.dump(
+                {"version": INDEX_VERSION, "columns": COLUMNS, "files": files},
+                f,
+                separators=(",", ":"),
+            )
+
+    def _load_sqlite(self, path):
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            (version,) = db.execute("PRAGMA user_version").fetchone()
+            if version != INDEX_VERSION:
+                raise ValueError("index was written by another version")
+            for filename, module, sha256 in db.execute(
+                "SELECT path, module, sha256 FROM files"
+            ):
+                self.files[filename] = _File(module, sha256, [])
+            for row in db.execute(
+                f"SELECT {', '.join(COLUMNS)}, path FROM definitions "
+                "ORDER BY path, lineno"
+            ):
+                self.files[row[-1]].definitions.append(Definition(*row))
+
+    def _save_sqlite(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        with contextlib.closing(sqlite3.connect(path)) as db, db:
+            db.executescript(
+                f"""
+                PRAGMA user_version = {INDEX_VERSION};
+                CREATE TABLE files (
+                    path TEXT PRIMARY KEY, module TEXT, sha256 TEXT
+                );
+                CREATE TABLE definitions (
+                    qualname TEXT, name TEXT, kind TEXT, signature TEXT,
+                    lineno INTEGER, end_lineno INTEGER, docstring TEXT,
+                    path TEXT REFERENCES files(path)
+                );
+                CREATE INDEX definitions_qualname ON definitions(qualname);
+                CREATE INDEX definitions_name ON definitions(name);
+                """
+            )
+            db.executemany(
+                "INSERT INTO files VALUES (?, ?, ?)",
+                [(p, f.module, f.sha256) for p, f in self.files.items()],
+            )
+            db.executemany(
+                "INSERT INTO definitions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [dataclasses.astuple(d) for d in self],
+            )
+
+
+def build_index(
+    paths: typing.Iterable[str], index_path: str, jobs=None
+) -> DefinitionIndex:
+    """load the index at index_path, bring it up to date and save it"""
+    index = DefinitionIndex.load(index_path)
+    index.update(paths, jobs)
+    index.save(index_path)
+    return index
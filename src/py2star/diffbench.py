@@ -0,0 +1,341 @@
+"""
+Differential runtime benchmark: a python module vs its larkify output.
+
+The module's functions are called with the same expressions in both the
+original module and the transpiled one (executed under the
+:mod:`py2star.larky` shim) and the runtimes are compared per call.
+
+For calls that got slower than ``--threshold``, the module is transpiled
+again with each transformer that changed the output left out (and with the
+other class encodings), and the transformations whose removal recovers the
+most time are flagged.
+
+Calls come from ``--call EXPR`` or, if there are none, from a module level
+``BENCH_CALLS`` list of expression strings.
+
+Usage:
+
+    python -m py2star.diffbench module.py --call 'fib(20)' --class-encoding shared
+"""
+import argparse
+import ast
+import dataclasses
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+import timeit
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from py2star import cli, larky
+from py2star.asteez.rewrite_class import CLASS_ENCODINGS
+
+logger = logging.getLogger(__name__)
+
+# seconds one timing sample should take
+SAMPLE_SECONDS = 0.02
+# ratio a transformation has to recover to be flagged, below is noise
+MIN_RECOVERED = 0.05
+
+
+@dataclasses.dataclass
+class Timing:
+    call: str
+    python: float  # seconds per call
+    larky: Optional[float] = None  # None if the transpiled call failed
+    same: Optional[bool] = None  # results compare equal
+    error: Optional[str] = None
+    # transformation => ratio recovered when it is left out
+    flagged: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    @property
+    def ratio(self) -> Optional[float]:
+        return self.larky / self.python if self.larky is not None else None
+
+
+def transpile(filename, larkify_args=()) -> Tuple[str, cli.Batch]:
+    args = cli.make_parser().parse_args(
+        ["larkify", filename, *larkify_args]
+    )
+    batch = cli.Batch.from_args(args)
+    return cli.larkify(filename, args, batch), batch
+
+
+_loaded = 0
+
+
+def _load(name, path, loader=None):
+    spec = importlib.util.spec_from_file_location(name, path, loader=loader)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_python(filename):
+    global _loaded
+    _loaded += 1
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return _load(f"_diffbench_py_{stem}_{_loaded}", filename)
+
+
+def load_larky(source, workdir, stem):
+    global _loaded
+    _loaded += 1
+    name = f"_diffbench_star_{stem}_{_loaded}"
+    path = os.path.join(workdir, f"{name}.star")
+    with open(path, "w") as f:
+        f.write(source)
+    return _load(name, path, larky.StarLoader(name, path))
+
+
+def _time(call, namespace, number, repeat):
+    timer = timeit.Timer(call, globals=namespace)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _number(call, namespace):
+    timer = timeit.Timer(call, globals=namespace)
+    seconds = timer.timeit(number=1)
+    return max(1, int(SAMPLE_SECONDS / seconds)) if seconds else 1000
+
+
+def _same(call, py_ns, star_ns):
+    try:
+        return eval(call, py_ns) == eval(call, star_ns)
+    except Exception:
+        return False
+
+
+def _names(node) -> set:
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+
+
+def _definitions(source) -> Dict[str, List[ast.stmt]]:
+    """top level name => the statement(s) binding it"""
+    defs = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            defs.setdefault(node.name, []).append(node)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                for name in _names(target):
+                    defs.setdefault(name, []).append(node)
+    return defs
+
+
+def _reachable(call, defs) -> set:
+    """top level names a call expression can end up running"""
+    seen, todo = set(), _names(ast.parse(call, mode="eval"))
+    while todo:
+        name = todo.pop()
+        if name in seen or name not in defs:
+            continue
+        seen.add(name)
+        for node in defs[name]:
+            todo |= _names(node)
+    return seen
+
+
+def _changed(defs, other_defs) -> set:
+    return {
+        name
+        for name in defs.keys() | other_defs.keys()
+        if [ast.dump(n) for n in defs.get(name, ())]
+        != [ast.dump(n) for n in other_defs.get(name, ())]
+    }
+
+
+def _larkify_args(larkify_args):
+    return cli.make_parser().parse_args(["larkify", "-", *larkify_args])
+
+
+def _ablations(larkify_args, batch) -> Iterator[Tuple[str, List[str]]]:
+    """(label, larkify args) for every transformation to leave out"""
+    args = list(larkify_args)
+    encoding = cli.get_class_encoding(_larkify_args(args))
+    for other in CLASS_ENCODINGS:
+        if other != encoding:
+            yield (
+                f"{encoding} class encoding (vs {other})",
+                args + ["--class-encoding", other],
+            )
+    for name in batch.stage_seconds:
+        yield name, args + ["--skip-transformer", name]
+
+
+class DiffBench:
+    def __init__(
+        self,
+        filename: str,
+        calls: Sequence[str] = (),
+        larkify_args: Sequence[str] = (),
+        repeat: int = 5,
+    ):
+        self.filename = os.path.abspath(filename)
+        self.larkify_args = list(larkify_args)
+        self.repeat = repeat
+        self.python = load_python(self.filename)
+        self.calls = list(calls or getattr(self.python, "BENCH_CALLS", ()))
+        if not self.calls:
+            raise ValueError(
+                f"{filename}: no --call given and no BENCH_CALLS defined"
+            )
+        self._numbers = {}
+        self._workdir = tempfile.TemporaryDirectory(prefix="diffbench")
+
+    def __enter__(self):
+        # sibling modules of the benchmarked one stay importable
+        sys.path.insert(0, os.path.dirname(self.filename))
+        larky.install()
+        return self
+
+    def __exit__(self, *exc):
+        sys.path.remove(os.path.dirname(self.filename))
+        larky.uninstall()
+        self._workdir.cleanup()
+
+    def _number(self, call):
+        if call not in self._numbers:
+            self._numbers[call] = _number(call, vars(self.python))
+        return self._numbers[call]
+
+    def _time_larky(self, source, calls) -> Dict[str, float]:
+        stem = os.path.splitext(os.path.basename(self.filename))[0]
+        try:
+            module = load_larky(source, self._workdir.name, stem)
+        except Exception as e:
+            logger.debug("transpiled module failed to load: %r", e)
+            return {}
+        times = {}
+        for call in calls:
+            try:
+                times[call] = _time(
+                    call, vars(module), self._number(call), self.repeat
+                )
+            except Exception as e:
+                logger.debug("%s: failed when transpiled: %r", call, e)
+        return times
+
+    def compare(self, threshold=1.2, top=3) -> List[Timing]:
+        source, batch = transpile(self.filename, self.larkify_args)
+        stem = os.path.splitext(os.path.basename(self.filename))[0]
+        try:
+            star = load_larky(source, self._workdir.name, stem)
+        except Exception as e:
+            star, load_error = None, f"{type(e).__name__}: {e}"
+        timings = []
+        for call in self.calls:
+            number = self._number(call)
+            timing = Timing(
+                call, _time(call, vars(self.python), number, self.repeat)
+            )
+            if star is None:
+                timing.error = load_error
+            else:
+                try:
+                    timing.larky = _time(call, vars(star), number, self.repeat)
+                    timing.same = _same(call, vars(self.python), vars(star))
+                except Exception as e:
+                    timing.error = f"{type(e).__name__}: {e}"
+            timings.append(timing)
+
+        slow = {t.call: t for t in timings if t.ratio and t.ratio > threshold}
+        if slow:
+            self._attribute(source, batch, slow, top)
+        return timings
+
+    def _attribute(self, source, batch, slow: Dict[str, Timing], top):
+        defs = _definitions(source)
+        reachable = {call: _reachable(call, defs) for call in slow}
+        for label, args in _ablations(self.larkify_args, batch):
+            try:
+                ablated, _ = transpile(self.filename, args)
+                changed = _changed(defs, _definitions(ablated))
+            except Exception as e:
+                logger.debug("%s: cannot transpile without it: %r", label, e)
+                continue
+            # only time the calls that run code this transformation touched
+            calls = [c for c in slow if reachable[c] & changed]
+            if not calls:
+                continue
+            times = self._time_larky(ablated, calls)
+            for call, seconds in times.items():
+                timing = slow[call]
+                recovered = timing.ratio - seconds / timing.python
+                if recovered > MIN_RECOVERED:
+                    timing.flagged[label] = recovered
+        for timing in slow.values():
+            worst = sorted(timing.flagged.items(), key=lambda kv: -kv[1])
+            timing.flagged = dict(worst[:top])
+
+
+def report(timings: Sequence[Timing], out=sys.stdout):
+    width = max([len(t.call) for t in timings] + [4])
+    print(
+        f"{'call':<{width}} {'python ms':>10} {'larky ms':>10} "
+        f"{'ratio':>7}  same  slowed down by",
+        file=out,
+    )
+    for t in timings:
+        if t.larky is None:
+            print(
+                f"{t.call:<{width}} {t.python * 1000:10.4f} "
+                f"{'-':>10} {'-':>7}  -     error: {t.error}",
+                file=out,
+            )
+            continue
+        flagged = ", ".join(f"{k} (+{v:.2f}x)" for k, v in t.flagged.items())
+        print(
+            f"{t.call:<{width}} {t.python * 1000:10.4f} "
+            f"{t.larky * 1000:10.4f} {t.ratio:6.2f}x  "
+            f"{'yes' if t.same else 'no':<5} {flagged}",
+            file=out,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="compare a module's runtime with its larkify output"
+    )
+    parser.add_argument("filename")
+    parser.add_argument(
+        "-c",
+        "--call",
+        dest="calls",
+        default=[],
+        action="append",
+        metavar="EXPR",
+        help="expression to time in both modules, e.g. 'fib(20)'",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="larky/python ratio above which slowdowns are attributed",
+    )
+    parser.add_argument(
+        "--top", type=int, default=3, help="transformations flagged per call"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    # passed on to larkify
+    parser.add_argument("--class-encoding", choices=CLASS_ENCODINGS)
+    parser.add_argument("--use-mutablestruct", action="store_true")
+    parser.add_argument("--use-error-not-fail", action="store_true")
+    args = parser.parse_args(argv)
+    larkify_args = [
+        f"--{flag.replace('_', '-')}"
+        for flag in ("use_mutablestruct", "use_error_not_fail")
+        if getattr(args, flag)
+    ]
+    if args.class_encoding:
+        larkify_args += ["--class-encoding", args.class_encoding]
+    with DiffBench(
+        args.filename, args.calls, larkify_args, args.repeat
+    ) as bench:
+        report(bench.compare(args.threshold, args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -37,17 +37,36 @@ which is exactly what I was after.
 
 Larger snippets can be placed in a file (as opposed to a command-line
 arg) and processed with the -f option.
+
+To script it, pick the subtree instead of stepping through them:
+
+    python find_pattern.py --batch "g.throw(E, V, T)"
+    python find_pattern.py --match "throw(E, V, T)" "g.throw(E, V, T)"
+    python find_pattern.py --path 0.0 "g.throw(E, V, T)"
+    python find_pattern.py --all "g.throw(E, V, T)"
+
+--batch takes the deepest subtree spanning the whole snippet, --match the
+deepest one spanning the given text, --path walks child indexes down from
+the root and --all prints every candidate with its path.
+
+The PATTERN of every fixer in py2star.fixes can be profiled over a corpus,
+reporting match attempts, hits and time per fixer, most expensive first:
+
+    python find_pattern.py --profile src/ [--fixer fix_asserts]
 """
 
 __author__ = "Collin Winter <collinw@gmail.com>"
 
 # Python imports
+import dataclasses
 import optparse
 import sys
+import time
 from io import StringIO
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 # Local imports
-from lib2to3 import pytree
+from lib2to3 import pytree, refactor
 from lib2to3.pgen2 import driver
 from lib2to3.pygram import python_symbols, python_grammar
 
@@ -62,9 +81,45 @@ def main(args):
         action="store",
         help="Read a code snippet from the specified file",
     )
+    parser.add_option(
+        "-b",
+        "--batch",
+        action="store_true",
+        help="Print the pattern of the whole snippet without prompting",
+    )
+    parser.add_option(
+        "-m", "--match", help="Print the pattern of the subtree with this text"
+    )
+    parser.add_option(
+        "-p",
+        "--path",
+        help="Print the pattern of the subtree at this path of child "
+        "indexes, e.g. 0.1",
+    )
+    parser.add_option(
+        "-a",
+        "--all",
+        action="store_true",
+        help="Print every candidate subtree, its path and its pattern",
+    )
+    parser.add_option(
+        "--profile",
+        action="store_true",
+        help="Profile the fixers' patterns over the files and directories "
+        "given as arguments",
+    )
+    parser.add_option(
+        "--fixer",
+        action="append",
+        default=[],
+        help="Only profile the fixers whose name ends with this",
+    )
 
     # Parse command line arguments
     options, args = parser.parse_args(args)
+    if options.profile:
+        report(profile_patterns(args[1:], options.fixer))
+        return 0
     if options.file:
         tree = driver.parse_file(options.file)
     elif len(args) > 1:
@@ -73,7 +128,21 @@ def main(args):
         print("You must specify an input file or an input string", file=sys.stderr)
         return 1
 
-    examine_tree(tree)
+    try:
+        if options.all:
+            for path, node in candidates(tree):
+                print(format_path(path), repr(str(node)), find_pattern(node))
+        elif options.path is not None:
+            print(find_pattern(node_at(tree, options.path)))
+        elif options.match is not None:
+            print(synthesize(tree, options.match))
+        elif options.batch:
+            print(synthesize(tree))
+        else:
+            examine_tree(tree)
+    except LookupError as e:
+        print(e, file=sys.stderr)
+        return 1
     return 0
 
 
@@ -88,6 +157,46 @@ def examine_tree(tree):
             return
 
 
+def candidates(tree) -> Iterator[Tuple[Tuple[int, ...], pytree.Node]]:
+    """(path, node) of every subtree that is not a leaf, in post order"""
+
+    def walk(node, path):
+        for i, child in enumerate(node.children):
+            yield from walk(child, path + (i,))
+        if not isinstance(node, pytree.Leaf):
+            yield path, node
+
+    yield from walk(tree, ())
+
+
+def format_path(path: Sequence[int]) -> str:
+    return ".".join(map(str, path)) or "."
+
+
+def node_at(tree, path: str):
+    node = tree
+    for index in filter(None, path.split(".")):
+        try:
+            node = node.children[int(index)]
+        except (IndexError, ValueError):
+            raise LookupError(f"no subtree at {path!r}") from None
+    return node
+
+
+def synthesize(tree, text: Optional[str] = None) -> str:
+    """
+    PATTERN of the deepest subtree spanning text, or the whole snippet if
+    there is no text
+    """
+    if text is None:
+        text = str(tree)
+    text = text.strip()
+    for _, node in candidates(tree):
+        if str(node).strip() == text:
+            return find_pattern(node)
+    raise LookupError(f"no subtree spans {text!r}")
+
+
 def find_pattern(node):
     if isinstance(node, pytree.Leaf):
         return repr(node.value)
@@ -106,5 +215,85 @@ def find_symbol(sym):
             return n
 
 
+@dataclasses.dataclass
+class PatternStats:
+    fixer: str
+    compile_seconds: float = 0.0
+    attempts: int = 0
+    hits: int = 0
+    seconds: float = 0.0
+
+    @property
+    def per_attempt(self) -> float:
+        return self.seconds / self.attempts if self.attempts else 0.0
+
+
+def profile_patterns(
+    paths: Sequence[str], fixers: Sequence[str] = (), options=None
+) -> List[PatternStats]:
+    """
+    Compile the PATTERN of every fixer in py2star.fixes (or the ones whose
+    name ends with one of fixers) and match it against every node of every
+    python file below paths.
+
+    This is what RefactoringTool does for fixers that are not BM_compatible;
+    the bottom matcher only tries the others on candidate nodes, so their
+    attempts are an upper bound.
+    """
+    from py2star.module_index import PackageIndex
+
+    names = [
+        name
+        for name in refactor.get_fixers_from_package("py2star.fixes")
+        if not fixers or any(name.endswith(f) for f in fixers)
+    ]
+    instances, stats = [], []
+    for name in names:
+        tool = refactor.RefactoringTool([name], options, explicit=[name])
+        for fixer in tool.pre_order + tool.post_order:
+            # the tool compiled it already, along with loading the fixer
+            # and building the bottom matcher; time the pattern on its own
+            started = time.perf_counter()
+            if fixer.PATTERN:
+                fixer.compile_pattern()
+            elapsed = time.perf_counter() - started
+            instances.append(fixer)
+            stats.append(PatternStats(type(fixer).__name__, elapsed))
+
+    for filename in PackageIndex.build(paths).sources:
+        try:
+            tree = driver.parse_file(filename)
+        except Exception as e:
+            print(f"{filename}: cannot parse: {e}", file=sys.stderr)
+            continue
+        for fixer in instances:
+            fixer.start_tree(tree, filename)
+        nodes = list(tree.pre_order())
+        for fixer, stat in zip(instances, stats):
+            match = fixer.match
+            started = time.perf_counter()
+            hits = sum(1 for node in nodes if match(node))
+            stat.seconds += time.perf_counter() - started
+            stat.attempts += len(nodes)
+            stat.hits += hits
+    return sorted(stats, key=lambda s: -s.seconds)
+
+
+def report(stats: Sequence[PatternStats], out=sys.stdout):
+    width = max([len(s.fixer) for s in stats] + [5])
+    print(
+        f"{'fixer':<{width}} {'compile ms':>10} {'attempts':>9} "
+        f"{'hits':>6} {'match ms':>9} {'us/attempt':>10}",
+        file=out,
+    )
+    for s in stats:
+        print(
+            f"{s.fixer:<{width}} {s.compile_seconds * 1000:10.2f} "
+            f"{s.attempts:9d} {s.hits:6d} {s.seconds * 1000:9.2f} "
+            f"{s.per_attempt * 1e6:10.2f}",
+            file=out,
+        )
+
+
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
\ No newline at end of file
@@ -1,49 +1,32 @@
 # -*- coding: utf-8 -*-
 # Local imports
 from lib2to3 import fixer_base
-from lib2to3.fixer_util import BlankLine, Name, attr_chain
+from lib2to3.fixer_util import BlankLine, Comma, Name, attr_chain, syms
+from lib2to3.pgen2 import token
+from lib2to3.pytree import Node
 
 from py2star import utils
-
-MAPPING = {
-    "json": ("stdlib", "json"),
-    "builtins": ("stdlib", "json"),
-    "unittest": ("stdlib", "unittest"),
-    "escapes": ("vendor", "escapes"),
-    "assertpy": ("vendor", "asserts"),
-}
-
-
-def alternates(members):
-    return "(" + "|".join(map(repr, members)) + ")"
-
-
-def build_pattern(mapping=None):
-    if mapping is None:
-        mapping = MAPPING
-    mod_list = " | ".join(["module_name='%s'" % key for key in mapping])
-    bare_names = alternates(mapping.keys())
-
-    yield """name_import=import_name< 'import' ((%s) |
-               multiple_imports=dotted_as_names< any* (%s) any* >) >
-          """ % (
-        mod_list,
-        mod_list,
-    )
-    yield """import_from< 'from' (%s) 'import' ['(']
-              ( any | import_as_name< any 'as' any > |
-                import_as_names< any* >)  [')'] >
-          """ % mod_list
-    yield """import_name< 'import' (dotted_as_name< (%s) 'as' any > |
-               multiple_imports=dotted_as_names<
-                 any* dotted_as_name< (%s) 'as' any > any* >) >
-          """ % (
-        mod_list,
-        mod_list,
-    )
-
-    # Find usages of module members in code e.g. thread.foo(bar)
-    yield "power< bare_with_attr=(%s) trailer<'.' any > any* >" % bare_names
+from py2star.import_map import DEFAULT_MAPPING, ImportMap, default_import_map
+
+# kept for backwards compatibility, see py2star.import_map
+MAPPING = DEFAULT_MAPPING
+
+# Match the *shape* of an import (or of a module attribute access) for any
+# module name and resolve the name through the import map in ``match``, so
+# the pattern does not grow with the map.
+PATTERN = """
+    name_import=import_name< 'import' module_name=NAME >
+    |
+    import_name< 'import' multiple_imports=dotted_as_names< any* > >
+    |
+    import_from< 'from' module_name=NAME 'import' ['(']
+        ( any | import_as_name< any 'as' any > | import_as_names< any* >)
+    [')'] >
+    |
+    import_name< 'import' dotted_as_name< module_name=NAME 'as' any > >
+    |
+    power< bare_with_attr=NAME trailer< '.' any > any* >
+"""
 
 
 class FixKnownImports(fixer_base.BaseFix):
@@ -56,19 +39,16 @@ class FixKnownImports(fixer_base.BaseFix):
     # everything up
     run_order = 9
 
+    PATTERN = PATTERN
+
     def __init__(self, options, log):
         super().__init__(options, log)
         self.replace = {}
 
-    @staticmethod
-    def build_pattern():
-        return "|".join(build_pattern(MAPPING))
-
-    def compile_pattern(self):
-        # We override this, so MAPPING can be pragmatically altered and the
-        # changes will be reflected in PATTERN.
-        self.PATTERN = self.build_pattern()
-        super(FixKnownImports, self).compile_pattern()
+    @property
+    def mapping(self) -> ImportMap:
+        # pass a different map with RefactoringTool(options={"import_map": ..})
+        return self.options.get("import_map") or default_import_map()
 
     # Don't match the node if it's within another match.
     def match(self, node):
@@ -76,6 +56,15 @@ class FixKnownImports(fixer_base.BaseFix):
         results = match(node)
         if not results:
             return False
+        if "multiple_imports" in results:
+            names = results["multiple_imports"].children
+            if not any(self._mapped_name(n) for n in names):
+                return False
+        elif "bare_with_attr" in results:
+            if results["bare_with_attr"].value not in self.mapping:
+                return False
+        elif results["module_name"].value not in self.mapping:
+            return False
         # Module usage could be in the trailer of an attribute lookup, so we
         # might have nested matches when "bare_with_attr" is present.
         if "bare_with_attr" not in results and any(
@@ -84,46 +73,74 @@ class FixKnownImports(fixer_base.BaseFix):
             return False
         return results
 
+    def _mapped_name(self, node):
+        """the NAME leaf of ``x`` or ``x as y`` if x is in the mapping"""
+        if node.type == syms.dotted_as_name:
+            node = node.children[0]
+        if node.type == token.NAME and node.value in self.mapping:
+            return node
+        return None
+
     def start_tree(self, tree, filename):
         super(FixKnownImports, self).start_tree(tree, filename)
 
     def transform(self, node, results):
-        import_mod = results.get("module_name")
-        if not import_mod:
+        if "bare_with_attr" in results:
             # Replace usage of the module.
-            bare_name = results["bare_with_attr"][0]
+            bare_name = results["bare_with_attr"]
             new_name = self.replace.get(bare_name.value)
             if new_name:
                 bare_name.replace(Name(new_name, prefix=bare_name.prefix))
             return
 
-        mod_name = import_mod.value
-        try:
-            package, new_name = MAPPING[mod_name]
-        except KeyError:
-            self.warning(node, f"Cannot find mapping for {mod_name}. skipping")
-            return
+        if "multiple_imports" in results:
+            return self._transform_multiple_imports(
+                node, results["multiple_imports"]
+            )
+
+        import_mod = results["module_name"]
+        self._add_import(import_mod.value, node, "name_import" in results)
+        return self._import_replace(import_mod)
 
+    def _add_import(self, mod_name, node, name_import):
+        package, new_name = self.mapping[mod_name]
         # add new Larky import to the file
         utils.add_larky_import(package, new_name, node)
-
-        import_mod = self._import_replace(import_mod)
-        # import_mod = self._import_rename(new_name, import_mod)
-        if "name_import" in results:
+        if name_import:
             # If it's not a "from x import x, y" or "import x as y" import,
             # marked its usage to be replaced.
             self.replace[mod_name] = new_name
 
-        if "multiple_imports" in results:
-            # This is a nasty hack to fix multiple imports on a line (e.g.,
-            # "import StringIO, urlparse"). The problem is that I can't
-            # figure out an easy way to make a pattern recognize the keys of
-            # MAPPING randomly sprinkled in an import statement.
-            results = self.match(node)
-            if bool(results):
-                self.transform(node, results)
+    def _transform_multiple_imports(self, node, names):
+        """
+        import os, json, assertpy as a => import os
 
-        return import_mod
+        every mapped module is loaded, the rest stays a python import
+        """
+        kept = []
+        for child in names.children:
+            if child.type == token.COMMA:
+                continue
+            mapped = self._mapped_name(child)
+            if mapped is None:
+                kept.append(child.clone())
+                continue
+            self._add_import(
+                mapped.value, node, child.type != syms.dotted_as_name
+            )
+        if not kept:
+            return self._import_replace(node)
+        new_names = []
+        for i, child in enumerate(kept):
+            child.prefix = " "
+            if i:
+                new_names.append(Comma())
+            new_names.append(child)
+        if len(new_names) == 1:
+            names.replace(new_names[0])
+        else:
+            names.replace(Node(syms.dotted_as_names, new_names))
+        return None
 
     @staticmethod
     def _import_replace(import_mod):
@@ -1,41 +1,541 @@
-import os
-import base64
+"""
+Pack a directory of test fixtures (binary test vectors, keys, ...) into
+``.star`` files, base64 encoded, so Larky tests can load them.
+
+Files are streamed one at a time, so memory does not grow with the corpus.
+By default the output is a single dict of file name => base64 blob, like::
+
+    {'key.pem': b'LS0tLS1CRUdJTi...', ...}
+
+With ``--shard-size`` or ``--compress`` an index is written instead, which
+maps every file to the shard holding its blob::
+
+    COMPRESSION = "zlib"
+    SHARDS = [
+        "data_test_fixtures_0.star",
+    ]
+    FIXTURES = {
+        "key.pem": (0, "<sha256 of the file>"),
+    }
+
+and every shard holds the blobs, keyed by their hash (so identical files are
+stored once), one per line::
+
+    BLOBS = {
+        "<sha256 of the file>": b"eJzLSM3JyVcozy/KSQEAGgQEXQ==",
+    }
+
+so a test only loads the shard it needs.
+
+Repacking is incremental: a sidecar manifest records the size, mtime and
+hash of every packed file. Files whose size and mtime did not change are
+not read again, files whose hash did not change are not encoded again (their
+blobs are copied from the previous shards) and output files are only
+replaced when their contents change. Hashing and encoding run on a thread
+pool (``--processes`` for a process pool).
+
+Usage:
+
+    python -m py2star.fixturepacker tests/data out/ --shard-size 1000000 -z
+"""
 import argparse
+import ast
+import base64
+import collections
+import concurrent.futures
+import filecmp
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sys
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 # root_dir = "/Users/mahmoud/src/py/OpenPGP-Python/tests/data"
 # output_dir = (
 #     "/Users/mahmoud/src/starlarky/larky/src/test/resources/vendor_tests/OpenPGP"
 # )
-fixtures = {}
+DEFAULT_FIXTURE_NAME = "data_test_fixtures.star"
+ZLIB = "zlib"
+MANIFEST_VERSION = 1
+
+
+def fixture_files(root_dir) -> Iterator[str]:
+    for filename in sorted(os.listdir(root_dir)):
+        path = os.path.join(root_dir, filename)
+        if os.path.isfile(path):
+            yield path
+
+
+def encode(data: bytes, compress=False) -> bytes:
+    if compress:
+        data = zlib.compress(data, 9)
+    return base64.b64encode(data)
+
+
+def decode(blob: bytes, compression: Optional[str] = None) -> bytes:
+    data = base64.b64decode(blob)
+    return zlib.decompress(data) if compression == ZLIB else data
+
+
+def shard_name(fixture_name, index) -> str:
+    stem, ext = os.path.splitext(fixture_name)
+    return f"{stem}_{index}{ext or '.star'}"
+
+
+def manifest_name(fixture_name) -> str:
+    return f"{os.path.splitext(fixture_name)[0]}.manifest.json"
+
+
+def encode_fixture(path, compress=False) -> Tuple[str, bytes]:
+    """(sha256, blob) of the file at path"""
+    with open(path, "rb") as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), encode(data, compress)
+
+
+def encode_changed(
+    path, known=None, compress=False
+) -> Tuple[str, Optional[bytes]]:
+    """(sha256, blob) of the file at path, without the blob if it is known"""
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == known:
+        return digest, None
+    return digest, encode(data, compress)
+
+
+def _ordered(executor, fn, items: Iterable[tuple], window) -> Iterator:
+    """fn(*item) for every item, in order, with at most window in flight"""
+    pending = collections.deque()
+    for item in items:
+        pending.append(executor.submit(fn, *item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 
+def _read_blobs(path) -> Iterator[Tuple[str, bytes]]:
+    """(digest, blob) of every line of a shard"""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('"'):
+                continue
+            digest, _, blob = line.partition('": b"')
+            yield digest[1:], blob.rstrip(",").rstrip('"').encode("ascii")
 
-def add_fixture(filename):
-    with open(filename, "rb") as fixture:
-        fixtures[os.path.basename(filename)] = base64.b64encode(fixture.read())
 
+class _PackedBlobs:
+    """the blobs of a previous pack, read back one shard at a time"""
 
-def serialize_fixture_to_file(output_dir, fixture_name):
-    output_dir = os.path.join(output_dir, fixture_name)
-    with open(output_dir, "w+") as larky_fixture:
-        larky_fixture.write(repr(fixtures))
-        larky_fixture.flush()
+    def __init__(self, output_dir, index):
+        self.output_dir = output_dir
+        self.shards = index["SHARDS"]
+        self.where = {d: shard for shard, d in index["FIXTURES"].values()}
+        self._shard = None
+        self._blobs: Dict[str, bytes] = {}
 
+    def __contains__(self, digest):
+        return digest in self.where
 
-def pack_fixture(root_dir, output_dir, fixture_name="data_test_fixtures.star"):
-    for filename in os.listdir(root_dir):
-        add_fixture(os.path.join(root_dir, filename))
+    def get(self, digest) -> bytes:
+        shard = self.where[digest]
+        if shard != self._shard:
+            path = os.path.join(self.output_dir, self.shards[shard])
+            self._blobs = dict(_read_blobs(path))
+            self._shard = shard
+        return self._blobs[digest]
 
-    serialize_fixture_to_file(output_dir, fixture_name)
+
+class FixturePacker:
+    """
+    Streams fixtures into ``output_dir/fixture_name``, as a single dict or,
+    if ``shard_size`` (encoded bytes per shard) or ``compress`` is given,
+    as an index plus shards.
+
+    Every file is written next to its destination first and only replaces
+    it, once everything is packed, if its contents changed.
+    """
+
+    def __init__(
+        self,
+        output_dir,
+        fixture_name=DEFAULT_FIXTURE_NAME,
+        shard_size: Optional[int] = None,
+        compress=False,
+        jobs: Optional[int] = None,
+        processes=False,
+    ):
+        self.output_dir = output_dir
+        self.fixture_name = fixture_name
+        self.shard_size = shard_size
+        self.compress = compress
+        self.indexed = shard_size is not None or compress
+        self.jobs = jobs or os.cpu_count() or 1
+        self.processes = processes
+        # file name => (shard, digest)
+        self.fixtures: Dict[str, Tuple[int, str]] = {}
+        self.shards: List[str] = []
+        # file name => size, mtime and hash, saved as the manifest
+        self.files: Dict[str, dict] = {}
+        self.encoded: List[str] = []  # names of the files (re)encoded
+        self.written: List[str] = []  # output files replaced or removed
+        self._blobs: Dict[str, int] = {}  # digest => shard
+        self._out = None
+        self._shard_bytes = 0
+        self._pending: List[str] = []  # output files written so far
+        self._previous = self._load_previous()
+
+    @property
+    def options(self) -> dict:
+        return {"shard_size": self.shard_size, "compress": self.compress}
+
+    def _path(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def _load_previous(self) -> dict:
+        """the previous manifest and blobs, if they can be reused"""
+        try:
+            with open(self._path(manifest_name(self.fixture_name))) as f:
+                manifest = json.load(f)
+            if manifest["version"] != MANIFEST_VERSION:
+                return {}
+            previous = {"manifest": manifest}
+            if not any(manifest["options"].values()):
+                # a single dict, which is not worth parsing
+                return previous
+            index = load_index(self._path(self.fixture_name))
+            previous["shards"] = index["SHARDS"]
+        except (OSError, ValueError, KeyError, SyntaxError) as e:
+            logger.debug("%s: packing from scratch: %s", self.output_dir, e)
+            return {}
+        compression = ZLIB if self.compress else None
+        if self.indexed and index["COMPRESSION"] == compression:
+            previous["blobs"] = _PackedBlobs(self.output_dir, index)
+        return previous
+
+    def __enter__(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not self.indexed:
+            self._out = self._open(self.fixture_name)
+            self._out.write("{")
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            if self._out is not None:
+                self._out.close()
+            for name in self._pending:
+                os.remove(self._path(name) + ".tmp")
+            return
+        if not self.indexed:
+            self._out.write("}")
+            self._out.close()
+        else:
+            self._close_shard()
+            self._write_index()
+        self._write_manifest()
+        self._commit()
+
+    def _open(self, name):
+        self._pending.append(name)
+        return open(self._path(name) + ".tmp", "w")
+
+    def _commit(self):
+        for name in self._pending:
+            path = self._path(name)
+            if os.path.isfile(path) and filecmp.cmp(
+                path + ".tmp", path, shallow=False
+            ):
+                os.remove(path + ".tmp")
+            else:
+                os.replace(path + ".tmp", path)
+                self.written.append(name)
+        for name in self._previous.get("shards", ()):
+            if name not in self.shards and os.path.isfile(self._path(name)):
+                os.remove(self._path(name))
+                self.written.append(name)
+
+    def _stat(self, name, filename, digest) -> None:
+        st = os.stat(filename)
+        self.files[name] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": digest,
+        }
+
+    def add(self, filename, name=None) -> None:
+        name = name or os.path.basename(filename)
+        digest, blob = encode_fixture(filename, self.compress)
+        self._stat(name, filename, digest)
+        self._add(name, digest, blob)
+
+    def _add(self, name, digest, blob: Optional[bytes] = None) -> None:
+        """add a fixture, blob can be left out if it was packed before"""
+        if blob is not None:
+            self.encoded.append(name)
+        if not self.indexed:
+            if self.fixtures:
+                self._out.write(", ")
+            self._out.write(f"{name!r}: {blob!r}")
+            self.fixtures[name] = (0, "")
+            return
+        if digest not in self._blobs:
+            if blob is None:
+                blob = self._previous["blobs"].get(digest)
+            self._add_blob(digest, blob)
+        self.fixtures[name] = (self._blobs[digest], digest)
+
+    def _add_blob(self, digest, blob: bytes):
+        full = (
+            self.shard_size is not None
+            and self._shard_bytes
+            and self._shard_bytes + len(blob) > self.shard_size
+        )
+        if self._out is None or full:
+            self._close_shard()
+            self.shards.append(shard_name(self.fixture_name, len(self.shards)))
+            self._out = self._open(self.shards[-1])
+            self._out.write("BLOBS = {\n")
+            self._shard_bytes = 0
+        self._out.write(f'    "{digest}": b"{blob.decode("ascii")}",\n')
+        self._shard_bytes += len(blob)
+        self._blobs[digest] = len(self.shards) - 1
+
+    def _close_shard(self):
+        if self._out is not None:
+            self._out.write("}\n")
+            self._out.close()
+            self._out = None
+
+    def _write_index(self):
+        with self._open(self.fixture_name) as index:
+            compression = json.dumps(ZLIB) if self.compress else "None"
+            index.write(f"COMPRESSION = {compression}\n")
+            index.write("SHARDS = [\n")
+            for shard in self.shards:
+                index.write(f"    {json.dumps(shard)},\n")
+            index.write("]\nFIXTURES = {\n")
+            for name, (shard, digest) in self.fixtures.items():
+                name = json.dumps(name)
+                index.write(f'    {name}: ({shard}, "{digest}"),\n')
+            index.write("}\n")
+
+    def _write_manifest(self):
+        with self._open(manifest_name(self.fixture_name)) as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "options": self.options,
+                    "files": self.files,
+                },
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+
+    def _executor(self) -> concurrent.futures.Executor:
+        if self.processes:
+            return concurrent.futures.ProcessPoolExecutor(self.jobs)
+        return concurrent.futures.ThreadPoolExecutor(self.jobs)
+
+    def pack(self, root_dir) -> "FixturePacker":
+        """pack every file of root_dir, re-encoding only what changed"""
+        filenames = {os.path.basename(f): f for f in fixture_files(root_dir)}
+        manifest = self._previous.get("manifest", {})
+        known = manifest.get("files", {})
+        if manifest.get("options") != self.options:
+            known = {}
+        digests, stale = {}, []
+        for name, filename in filenames.items():
+            st = os.stat(filename)
+            entry = known.get(name)
+            if entry and (entry["size"], entry["mtime_ns"]) == (
+                st.st_size,
+                st.st_mtime_ns,
+            ):
+                digests[name] = entry["sha256"]
+            else:
+                stale.append(name)
+
+        with self._executor() as executor:
+            # every stale file is read once, to hash and encode it: if no
+            # file was added or removed the pack may be unchanged, so only
+            # the files that changed are encoded, else they are hashed as
+            # they are encoded below
+            blobs = {}
+            if set(filenames) == set(known):
+                results = executor.map(
+                    encode_changed,
+                    [filenames[n] for n in stale],
+                    # a single dict needs every blob
+                    [
+                        known[n]["sha256"] if self.indexed else None
+                        for n in stale
+                    ],
+                    itertools.repeat(self.compress),
+                )
+                for name, (digest, blob) in zip(stale, results):
+                    digests[name] = digest
+                    if blob is not None:
+                        blobs[name] = blob
+            for name, filename in filenames.items():
+                self._stat(name, filename, digests.get(name))
+
+            outputs = [self.fixture_name, *self._previous.get("shards", ())]
+            unchanged = (
+                known
+                and digests == {n: e["sha256"] for n, e in known.items()}
+                and all(os.path.isfile(self._path(n)) for n in outputs)
+            )
+            if unchanged:
+                logger.debug("%s: fixtures did not change", root_dir)
+                self.shards = list(self._previous.get("shards", ()))
+                self._write_unchanged()
+                return self
+
+            # only files whose blob is not in the previous pack are encoded
+            previous = self._previous.get("blobs") or ()
+            to_encode, seen = [], set()
+            for name in filenames:
+                digest = digests.get(name)
+                if name not in blobs and (
+                    digest is None
+                    or (digest not in previous and digest not in seen)
+                ):
+                    to_encode.append(name)
+                if self.indexed and digest is not None:
+                    seen.add(digest)
+            encoded = _ordered(
+                executor,
+                encode_fixture,
+                [(filenames[n], self.compress) for n in to_encode],
+                window=2 * self.jobs,
+            )
+            to_encode = set(to_encode)
+            with self:
+                for name in filenames:
+                    blob = blobs.pop(name, None)
+                    if name in to_encode:
+                        digest, blob = next(encoded)
+                        digests[name] = self.files[name]["sha256"] = digest
+                    digest = digests[name]
+                    if digest in previous or digest in self._blobs:
+                        # packed before, or by a copy of this file
+                        blob = None
+                    self._add(name, digest, blob)
+        return self
+
+    def _write_unchanged(self):
+        """only the manifest, for the new mtimes"""
+        self._pending = []
+        self._write_manifest()
+        self._commit()
+
+
+def pack_fixture(
+    root_dir,
+    output_dir,
+    fixture_name=DEFAULT_FIXTURE_NAME,
+    shard_size=None,
+    compress=False,
+    jobs=None,
+    processes=False,
+) -> FixturePacker:
+    return FixturePacker(
+        output_dir, fixture_name, shard_size, compress, jobs, processes
+    ).pack(root_dir)
+
+
+def load_index(path) -> dict:
+    """the assignments of a packed index (or single dict) file"""
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    if len(tree.body) == 1 and isinstance(tree.body[0], ast.Expr):
+        return {"FIXTURES": ast.literal_eval(tree.body[0].value)}
+    return {
+        node.targets[0].id: ast.literal_eval(node.value)
+        for node in tree.body
+        if isinstance(node, ast.Assign)
+    }
+
+
+def load_fixture(path, name) -> bytes:
+    """the contents of fixture ``name``, only reading the shard it is in"""
+    index = load_index(path)
+    entry = index["FIXTURES"][name]
+    if isinstance(entry, bytes):
+        return decode(entry)
+    shard, digest = entry
+    shard_path = os.path.join(os.path.dirname(path), index["SHARDS"][shard])
+    for other, blob in _read_blobs(shard_path):
+        if other == digest:
+            return decode(blob, index["COMPRESSION"])
+    raise KeyError(f"{name}: blob {digest} missing from {shard_path}")
 
 
 def execute(args):
-    pack_fixture(args.root_dir, args.output_dir, args.fixture_name)
+    packer = pack_fixture(
+        args.root_dir,
+        args.output_dir,
+        args.fixture_name,
+        args.shard_size,
+        args.compress,
+        args.jobs,
+        args.processes,
+    )
+    print(
+        f"packed {len(packer.files)} fixtures, encoded {len(packer.encoded)}, "
+        f"updated {len(packer.written)} files",
+        file=sys.stderr,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="pack a directory of fixtures into .star files"
+    )
+    parser.add_argument("root_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument(
+        "fixture_name", nargs="?", default=DEFAULT_FIXTURE_NAME
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        metavar="BYTES",
+        help="Write an index and start a new shard after this many "
+        "encoded bytes",
+    )
+    parser.add_argument(
+        "-z",
+        "--compress",
+        action="store_true",
+        help="zlib compress every blob (implies an index)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Hash and encode this many files at a time (default: #cpus)",
+    )
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="Use a process pool instead of a thread pool",
+    )
+    execute(parser.parse_args(argv))
+    return 0
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="", add_help=False)
-    parser.add_argument("root-dir", dest="root_dir")
-    parser.add_argument("output-dir", dest="output_dir")
-    parser.add_argument("fixture-filename", dest="fixture_name", required=False, default="data_test_fixtures.star")
-    args = parser.parse_args()
-    execute(args)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
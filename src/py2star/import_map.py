@@ -0,0 +1,120 @@
+"""
+Map python modules to the Larky module that replaces them.
+
+The map is shared by ``fixes.fix_known_imports`` and
+``asteez.rewrite_imports.RewriteImports`` and can be extended (or
+overridden) with a JSON or TOML file:
+
+.. code-block:: toml
+
+    [imports]
+    json = ["stdlib", "json"]
+    assertpy = { namespace = "vendor", target = "asserts" }
+
+Every lookup is a dict access, no matter how many modules are mapped.
+"""
+import json
+import typing
+
+try:
+    import tomllib as toml  # python 3.11+
+except ImportError:
+    try:
+        import tomli as toml
+    except ImportError:
+        toml = None
+
+NAMESPACES = ("stdlib", "vendor")
+
+DEFAULT_MAPPING = {
+    "json": ("stdlib", "json"),
+    "builtins": ("stdlib", "builtins"),
+    "unittest": ("stdlib", "unittest"),
+    "escapes": ("vendor", "escapes"),
+    "assertpy": ("vendor", "asserts"),
+}
+
+
+class ImportMap(typing.Mapping[str, typing.Tuple[str, str]]):
+    """module name => (namespace, larky module path)"""
+
+    def __init__(self, mapping: typing.Mapping = None):
+        if mapping is None:
+            mapping = DEFAULT_MAPPING
+        self._mapping = {}
+        for mod_name, entry in mapping.items():
+            self._mapping[mod_name] = _parse_entry(mod_name, entry)
+
+    def __getitem__(self, mod_name):
+        return self._mapping[mod_name]
+
+    def __iter__(self):
+        return iter(self._mapping)
+
+    def __len__(self):
+        return len(self._mapping)
+
+    def resolve(
+        self, mod_name: str
+    ) -> typing.Optional[typing.Tuple[str, str]]:
+        """
+        (namespace, larky path) for mod_name, or its longest mapped parent
+        package with the rest of the dotted name appended to the path.
+        """
+        if not mod_name:
+            return None
+        prefix, rest = mod_name, []
+        while prefix:
+            entry = self._mapping.get(prefix)
+            if entry is not None:
+                ns, target = entry
+                return ns, "/".join([target, *reversed(rest)])
+            prefix, _, last = prefix.rpartition(".")
+            rest.append(last)
+        return None
+
+    def updated(self, mapping: typing.Mapping) -> "ImportMap":
+        return ImportMap({**self._mapping, **mapping})
+
+    @classmethod
+    def load(cls, path: str, extend_defaults=True) -> "ImportMap":
+        if path.endswith(".toml"):
+            if toml is None:
+                raise ImportError(
+                    f"{path}: reading TOML needs python 3.11+ or tomli, "
+                    "use a .json import map instead"
+                )
+            with open(path, "rb") as f:
+                data = toml.load(f)
+        else:
+            with open(path) as f:
+                data = json.load(f)
+        mapping = data.get("imports", data)
+        base = cls() if extend_defaults else cls({})
+        return base.updated(mapping)
+
+
+def _parse_entry(mod_name, entry) -> typing.Tuple[str, str]:
+    if isinstance(entry, typing.Mapping):
+        entry = (entry.get("namespace"), entry.get("target", mod_name))
+    try:
+        ns, target = entry
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"{mod_name}: expected (namespace, target), got {entry!r}"
+        ) from None
+    if ns not in NAMESPACES:
+        raise ValueError(
+            f"{mod_name}: namespace must be one of {NAMESPACES}, not {ns!r}"
+        )
+    return ns, target.replace(".", "/")
+
+
+_default_import_map: typing.Optional[ImportMap] = None
+
+
+def default_import_map() -> ImportMap:
+    global _default_import_map
+    if _default_import_map is None:
+        _default_import_map = ImportMap()
+    return _default_import_map
@@ -0,0 +1,303 @@
+"""
+If we import this file _first_, we can run any larky script without modification
+in a local python interpreter.
+
+This is pretty critical to emulating a fantastic local repl experience.
+
+The submodules stand in for the Larky modules py2star emits ``load()``s for
+(``types``, ``sets``, ``asserts``, ``option/result``), so transpiled code can
+run without a Larky runtime. Everything else is loaded from CPython.
+"""
+import warnings
+from collections import namedtuple
+import functools
+from types import MethodType
+from pprint import pprint
+from typing import Any
+import ast
+import hashlib
+import importlib.abc
+import importlib.util
+import marshal
+import os
+import sys
+
+MIN_PY_VERSION = 0x30900F0  # python 3.9
+unparse_available = False
+
+if sys.hexversion < MIN_PY_VERSION:
+    try:
+        from astunparse import unparse
+
+        unparse_available = True
+    except (ImportError, ModuleNotFoundError) as e:
+        warnings.warn(
+            e.msg
+            + ": Either install astunparse or upgrade python to 3.9 if "
+            + "you want to use unparse commands"
+        )
+else:
+    from ast import unparse
+
+    unparse_available = True
+
+
+# struct classes interned by field names, namedtuple() exec()s a new class
+# on every call which dominates struct heavy code.
+_STRUCT_TYPES = {}
+
+
+def _struct_type(fields):
+    try:
+        return _STRUCT_TYPES[fields]
+    except KeyError:
+        cls = _STRUCT_TYPES[fields] = namedtuple("struct", fields)
+        return cls
+
+
+def struct(**kwargs):
+    return _struct_type(tuple(kwargs))(**kwargs)
+
+
+class mutablestruct:
+    """a struct whose fields can be (re)assigned, e.g. ``self.x = 1``"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __eq__(self, other):
+        if not isinstance(other, mutablestruct):
+            return NotImplemented
+        return self.__dict__ == other.__dict__
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.__dict__.items())
+        return f"mutablestruct({fields})"
+
+
+def partial(function, *args, **kwargs):
+    """
+    functools.partial, binding a single argument (the instance, for the
+    shared methods of --class-encoding=shared classes) as a method object,
+    which is smaller and cheaper to call.
+    """
+    if len(args) == 1 and not kwargs:
+        return MethodType(function, args[0])
+    return functools.partial(function, *args, **kwargs)
+
+# upper bound of the `for _while_ in range(...)` loops while loops become
+WHILE_LOOP_EMULATION_ITERATION = 4096
+
+
+class EvalError(Exception):
+    """raised by fail(), which stops evaluation in Larky"""
+
+
+def fail(*args, sep=" "):
+    raise EvalError(sep.join(str(a) for a in args))
+
+
+# names every Larky module can use without loading them; the rest of this
+# package (mutablestruct, WHILE_LOOP_EMULATION_ITERATION, ...) is only
+# there through load("@stdlib//larky", ...)
+BUILTINS = {"fail": fail}
+
+
+# larky modules (by repository) implemented by a module of this package
+SHIMS = {
+    "@stdlib": {
+        "larky": "py2star.larky",
+        "sets": "py2star.larky.sets",
+        "types": "py2star.larky.types",
+    },
+    "@vendor": {
+        "asserts": "py2star.larky.asserts",
+        "option.result": "py2star.larky.result",
+    },
+}
+
+
+def _module_name(label):
+    """python module for a load() label, ``@stdlib//a/b.star`` => ``a.b``"""
+    repo, sep, path = label.rpartition("//")
+    if not sep:  # @stdlib/json
+        repo, _, path = label.partition("/")
+    if path.endswith(".star"):
+        path = path[: -len(".star")]
+    module = path.strip("/").replace("/", ".")
+    return SHIMS.get(repo, {}).get(module, module)
+
+
+def _transform_load(call):
+    """
+    ``load(label, "name", alias="name")`` => one import per bound symbol.
+
+    Loading the symbol named after the module (``json="json"``) imports the
+    module itself, unless the python module has an attribute of that name.
+    """
+    module = _module_name(call.args[0].value)
+    bindings = [(arg.value, arg.value) for arg in call.args[1:]]
+    bindings += [(kw.arg, kw.value.value) for kw in call.keywords]
+    stmts = []
+    for asname, name in bindings:
+        import_from = ast.ImportFrom(
+            module=module, names=[ast.alias(name=name, asname=asname)], level=0
+        )
+        if name != module.rpartition(".")[2]:
+            stmts.append(import_from)
+            continue
+        stmts.append(
+            ast.Try(
+                body=[import_from],
+                handlers=[
+                    ast.ExceptHandler(
+                        type=ast.Name(id="ImportError", ctx=ast.Load()),
+                        name=None,
+                        body=[
+                            ast.Import(
+                                names=[ast.alias(name=module, asname=asname)]
+                            )
+                        ],
+                    )
+                ],
+                orelse=[],
+                finalbody=[],
+            )
+        )
+    return stmts
+
+
+class _LoadToImports(ast.NodeTransformer):
+    def visit_Expr(self, node: ast.Expr):
+        # transform python expressions containing a load() call to
+        # import statements
+        inner_node = node.value
+        if not (
+            isinstance(inner_node, ast.Call)
+            and isinstance(inner_node.func, ast.Name)
+            and inner_node.func.id == "load"
+        ):
+            return node
+        return [ast.copy_location(s, node) for s in _transform_load(inner_node)]
+
+
+def compile_star(source, filename="<star>"):
+    """parse larky source, turn its load()s into imports and compile it"""
+    tree = _LoadToImports().visit(ast.parse(source, filename))
+    ast.fix_missing_locations(tree)
+    return compile(tree, filename, "exec", dont_inherit=True)
+
+
+# bump whenever compile_star() changes, so stale cached code is ignored;
+# SHIMS is part of the key on its own
+_CACHE_VERSION = b"2"
+_CACHE_HEADER = importlib.util.MAGIC_NUMBER + _CACHE_VERSION
+
+
+def _cache_key(source: bytes) -> bytes:
+    shims = repr(sorted((r, sorted(m.items())) for r, m in SHIMS.items()))
+    return (
+        _CACHE_HEADER
+        + hashlib.sha256(shims.encode()).digest()
+        + hashlib.sha256(source).digest()
+    )
+
+
+def cache_from_source(path):
+    """``a/b.star`` => ``a/__pycache__/b.cpython-39-star.pyc``"""
+    head, tail = os.path.split(path)
+    stem = tail[: -len(".star")] if tail.endswith(".star") else tail
+    tag = sys.implementation.cache_tag
+    return os.path.join(head, "__pycache__", f"{stem}.{tag}-star.pyc")
+
+
+class StarLoader(importlib.abc.FileLoader, importlib.abc.SourceLoader):
+    """
+    Loads ``.star`` modules, caching their code in ``__pycache__`` keyed by
+    a hash of the source, so unchanged files are not parsed again.
+    """
+
+    def get_code(self, fullname):
+        source = self.get_data(self.path)
+        key = _cache_key(source)
+        cache = cache_from_source(self.path)
+        try:
+            with open(cache, "rb") as f:
+                data = f.read()
+        except OSError:
+            pass
+        else:
+            if data[: len(key)] == key:
+                try:
+                    return marshal.loads(data[len(key) :])
+                except (EOFError, ValueError, TypeError):
+                    pass
+        code = self.source_to_code(source, self.path)
+        if not sys.dont_write_bytecode:
+            _write_cache(cache, key + marshal.dumps(code))
+        return code
+
+    def source_to_code(self, data, path="<star>"):
+        return compile_star(data, path)
+
+    def exec_module(self, module):
+        for name, value in BUILTINS.items():
+            module.__dict__.setdefault(name, value)
+        super().exec_module(module)
+
+
+def _write_cache(cache, data):
+    tmp = f"{cache}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, cache)
+    except OSError:
+        # read only source tree, just don't cache
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+class StarFinder(importlib.abc.MetaPathFinder):
+    """finds ``<name>.star`` and ``<name>/__init__.star`` on the import path"""
+
+    def find_spec(self, fullname, path=None, target=None):
+        name = fullname.rpartition(".")[2]
+        for entry in sys.path if path is None else path:
+            entry = entry or os.getcwd()
+            if not isinstance(entry, str) or not os.path.isdir(entry):
+                continue
+            package = os.path.join(entry, name)
+            init = os.path.join(package, "__init__.star")
+            if os.path.isfile(init):
+                return importlib.util.spec_from_file_location(
+                    fullname,
+                    init,
+                    loader=StarLoader(fullname, init),
+                    submodule_search_locations=[package],
+                )
+            filename = package + ".star"
+            if os.path.isfile(filename):
+                return importlib.util.spec_from_file_location(
+                    fullname, filename, loader=StarLoader(fullname, filename)
+                )
+        return None
+
+
+_finder = StarFinder()
+
+
+def install():
+    """make ``.star`` files importable, after regular python modules"""
+    if _finder not in sys.meta_path:
+        sys.meta_path.append(_finder)
+
+
+def uninstall():
+    if _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
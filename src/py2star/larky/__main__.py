@@ -0,0 +1,30 @@
+"""
+python -m py2star.larky [script.star [args...]]
+"""
+import os
+import sys
+
+from py2star.larky import BUILTINS, StarLoader, compile_star, install
+
+DEMO = r"""
+load("@stdlib/json", "json")
+print(json.loads('{"one": 1, "two": 2}'))
+print(json.loads('"\\ud83d\\ude39\\ud83d\\udc8d"'))
+"""
+
+
+def main():
+    install()
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+        sys.argv[:] = sys.argv[1:]
+        sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+        code = StarLoader("__main__", path).get_code("__main__")
+    else:
+        code = compile_star(DEMO)
+    # noinspection BuiltinExec
+    exec(code, {**BUILTINS, "__name__": "__main__"})
+
+
+if __name__ == "__main__":
+    main()
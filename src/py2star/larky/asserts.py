@@ -0,0 +1,127 @@
+"""
+``load("@vendor//asserts", "asserts")``: the assertpy style assertions that
+unittest assertions are rewritten to.
+"""
+import re
+
+
+class _Assertion:
+    __slots__ = ("val",)
+
+    def __init__(self, val):
+        self.val = val
+
+    def _check(self, ok, msg, *args):
+        if not ok:
+            raise AssertionError(msg % ((self.val,) + args))
+        return self
+
+    def is_equal_to(self, other):
+        return self._check(
+            self.val == other, "Expected <%r> to be equal to <%r>.", other
+        )
+
+    def is_not_equal_to(self, other):
+        return self._check(
+            self.val != other, "Expected <%r> to be not equal to <%r>.", other
+        )
+
+    def is_greater_than(self, other):
+        return self._check(
+            self.val > other, "Expected <%r> to be greater than <%r>.", other
+        )
+
+    def is_gte_to(self, other):
+        return self._check(
+            self.val >= other,
+            "Expected <%r> to be greater than or equal to <%r>.",
+            other,
+        )
+
+    def is_less_than(self, other):
+        return self._check(
+            self.val < other, "Expected <%r> to be less than <%r>.", other
+        )
+
+    def is_lte_to(self, other):
+        return self._check(
+            self.val <= other,
+            "Expected <%r> to be less than or equal to <%r>.",
+            other,
+        )
+
+    def is_in(self, items):
+        return self._check(
+            self.val in items, "Expected <%r> to be in <%r>.", items
+        )
+
+    def is_not_in(self, items):
+        return self._check(
+            self.val not in items, "Expected <%r> to not be in <%r>.", items
+        )
+
+    def contains(self, item):
+        return self._check(
+            item in self.val, "Expected <%r> to contain <%r>.", item
+        )
+
+    def is_instance_of(self, cls):
+        return self._check(
+            isinstance(self.val, cls),
+            "Expected <%r> to be instance of %r.",
+            cls,
+        )
+
+    def is_not_instance_of(self, cls):
+        return self._check(
+            not isinstance(self.val, cls),
+            "Expected <%r> to not be instance of %r.",
+            cls,
+        )
+
+    def is_true(self):
+        return self._check(bool(self.val), "Expected <%r> to be true.")
+
+    def is_false(self):
+        return self._check(not self.val, "Expected <%r> to be false.")
+
+    def is_none(self):
+        return self._check(self.val is None, "Expected <%r> to be None.")
+
+    def is_not_none(self):
+        return self._check(
+            self.val is not None, "Expected <%r> to not be None."
+        )
+
+
+def assert_that(val):
+    return _Assertion(val)
+
+
+def eq(actual, expected, msg=None):
+    if actual != expected:
+        raise AssertionError(msg or f"{actual!r} != {expected!r}")
+
+
+def assert_true(condition, msg="Expected condition to be true."):
+    if not condition:
+        raise AssertionError(msg)
+
+
+def assert_false(condition, msg="Expected condition to be false."):
+    if condition:
+        raise AssertionError(msg)
+
+
+def assert_fails(fn, pattern):
+    """fn() must fail with an error whose ``<type>: <message>`` matches"""
+    try:
+        fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if not re.search(pattern, error):
+            raise AssertionError(
+                f"Expected failure matching {pattern!r}, got {error!r}"
+            ) from e
+    else:
+        raise AssertionError(f"Expected failure matching {pattern!r}")
@@ -0,0 +1,62 @@
+"""
+``load("@vendor//option/result", "Ok", "Error", "Result")``: rust style
+results that raised exceptions are rewritten to return.
+"""
+from py2star.larky import fail
+
+
+class Result:
+    __slots__ = ("_value", "_ok")
+
+    def __init__(self, value, ok):
+        self._value = value
+        self._ok = ok
+
+    def is_ok(self):
+        return self._ok
+
+    def is_err(self):
+        return not self._ok
+
+    def unwrap(self):
+        if not self._ok:
+            fail(self._value)
+        return self._value
+
+    def unwrap_err(self):
+        if self._ok:
+            fail("called unwrap_err() on", self)
+        return self._value
+
+    def unwrap_or(self, default):
+        return self._value if self._ok else default
+
+    def expect(self, msg):
+        if not self._ok:
+            fail(msg + ":", self._value)
+        return self._value
+
+    def map(self, fn):
+        return Ok(fn(self._value)) if self._ok else self
+
+    def map_err(self, fn):
+        return self if self._ok else Error(fn(self._value))
+
+    def __eq__(self, other):
+        if not isinstance(other, Result):
+            return NotImplemented
+        return (self._ok, self._value) == (other._ok, other._value)
+
+    def __hash__(self):
+        return hash((self._ok, self._value))
+
+    def __repr__(self):
+        return f"{'Ok' if self._ok else 'Error'}({self._value!r})"
+
+
+def Ok(value):
+    return Result(value, True)
+
+
+def Error(error):
+    return Result(error, False)
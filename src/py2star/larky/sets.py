@@ -0,0 +1,5 @@
+"""
+``load("@stdlib//sets", "Set")``: ``Set([1, 2])`` is what set literals and
+``set()`` calls are rewritten to, the builtin set type implements it.
+"""
+Set = set
@@ -0,0 +1,9 @@
+"""
+``load("@stdlib//types", "types")``: python's ``types`` (``new_class``,
+which class rewriting emits, included) plus Larky's type predicates.
+"""
+from types import *  # noqa: F401,F403
+from types import new_class  # noqa: F401
+
+is_callable = callable
+is_instance = isinstance
@@ -0,0 +1,221 @@
+"""
+Counters and histograms collected by a larkify run, for trend graphs.
+
+The pipeline counts files converted and failed, bytes in and out, seconds
+per stage and per file, and stdlib index cache lookups; at the end of the
+run the peak RSS and wall time are added. ``--metrics PATH`` saves them in
+the Prometheus textfile format (for node_exporter's textfile collector) or,
+for a ``.json`` path, as JSON with a summary for scripts.
+
+Usage:
+
+    python -m py2star.cli larkify src/ -o out/ \\
+        --metrics /var/lib/node_exporter/py2star.prom --metrics run.json
+"""
+import bisect
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+FILES_CONVERTED = "py2star_files_converted_total"
+FILES_FAILED = "py2star_files_failed_total"
+BYTES_READ = "py2star_bytes_read_total"
+BYTES_WRITTEN = "py2star_bytes_written_total"
+STAGE_SECONDS = "py2star_stage_seconds_total"
+FILE_SECONDS = "py2star_file_seconds"
+CACHE_LOOKUPS = "py2star_stdlib_index_lookups_total"
+RUN_SECONDS = "py2star_run_seconds"
+PEAK_RSS = "py2star_peak_rss_bytes"
+
+METRICS = {
+    FILES_CONVERTED: (COUNTER, "Files converted"),
+    FILES_FAILED: (COUNTER, "Files that failed or hit a limit, by reason"),
+    BYTES_READ: (COUNTER, "Bytes of python source read"),
+    BYTES_WRITTEN: (COUNTER, "Bytes of larky output produced"),
+    STAGE_SECONDS: (COUNTER, "Seconds spent in each pipeline stage"),
+    FILE_SECONDS: (HISTOGRAM, "Seconds to convert a file"),
+    CACHE_LOOKUPS: (COUNTER, "Stdlib index lookups, by cache result"),
+    RUN_SECONDS: (GAUGE, "Wall-clock seconds of the whole run"),
+    PEAK_RSS: (GAUGE, "Peak resident set size of any process of the run"),
+}
+
+# upper bounds of the FILE_SECONDS buckets
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, count) pairs, as prometheus wants them"""
+        bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        total, pairs = 0, []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class Metrics:
+    def __init__(self):
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    @staticmethod
+    def _key(name, labels) -> Tuple[str, Labels]:
+        if name not in METRICS:
+            raise KeyError(f"unknown metric {name}")
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.values[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def get(self, name: str, **labels) -> float:
+        return self.values.get(self._key(name, labels), 0)
+
+    def total(self, name: str) -> float:
+        """the sum of a metric over all its labels"""
+        return sum(v for (n, _), v in self.values.items() if n == name)
+
+    def merge(self, other: "Metrics") -> None:
+        for key, value in other.values.items():
+            if METRICS[key[0]][0] == GAUGE:
+                self.values[key] = max(self.values.get(key, value), value)
+            else:
+                self.values[key] = self.values.get(key, 0) + value
+        for key, histogram in other.histograms.items():
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(histogram.buckets)
+            self.histograms[key].merge(histogram)
+
+    def finish(self, seconds: float) -> None:
+        """add what is only known at the end of a run"""
+        self.set(RUN_SECONDS, seconds)
+        rss = peak_rss()
+        if rss:
+            self.set(PEAK_RSS, rss)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        hits = self.get(CACHE_LOOKUPS, result="hit")
+        lookups = self.total(CACHE_LOOKUPS)
+        return {
+            "files_converted": self.total(FILES_CONVERTED),
+            "files_failed": self.total(FILES_FAILED),
+            "bytes_read": self.total(BYTES_READ),
+            "bytes_written": self.total(BYTES_WRITTEN),
+            "seconds": self.get(RUN_SECONDS),
+            "stage_seconds": {
+                dict(labels)["stage"]: value
+                for (name, labels), value in sorted(self.values.items())
+                if name == STAGE_SECONDS
+            },
+            "cache_hit_rate": hits / lookups if lookups else None,
+            "peak_rss_bytes": self.get(PEAK_RSS) or None,
+        }
+
+    def to_json(self) -> dict:
+        metrics = []
+        for (name, labels), value in sorted(self.values.items()):
+            metrics.append(
+                {"name": name, "labels": dict(labels), "value": value}
+            )
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            metrics.append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "buckets": dict(histogram.cumulative()),
+                    "sum": histogram.sum,
+                    "count": histogram.count,
+                }
+            )
+        return {"summary": self.summary(), "metrics": metrics}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, (kind, help_) in METRICS.items():
+            samples = []
+            for (n, labels), value in sorted(self.values.items()):
+                if n == name:
+                    samples.append(f"{name}{_labels(labels)} {value!r}")
+            for (n, labels), histogram in sorted(self.histograms.items()):
+                if n != name:
+                    continue
+                for le, count in histogram.cumulative():
+                    bucket = _labels(labels + (("le", le),))
+                    samples.append(f"{name}_bucket{bucket} {count}")
+                suffix = _labels(labels)
+                samples.append(f"{name}_sum{suffix} {histogram.sum!r}")
+                samples.append(f"{name}_count{suffix} {histogram.count}")
+            if samples:
+                lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+                lines += samples
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str) -> None:
+        if path.endswith(".json"):
+            text = json.dumps(self.to_json(), indent=2)
+        else:
+            text = self.to_prometheus()
+        # the textfile collector must never see a half written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def peak_rss() -> int:
+    """peak RSS in bytes of this process and of its largest waited child"""
+    if resource is None:
+        return 0
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,304 @@
+"""
+Indexes of module names used when rewriting imports to Larky ``load()``s.
+
+:class:`StdlibIndex` classifies module names as ``@stdlib`` or ``@vendor``.
+The set of standard library names is computed once per interpreter (and can
+be persisted to disk), so every lookup afterwards is a memoized set
+membership test on the top level package name.
+
+:class:`PackageIndex` maps the modules of the project being converted to
+their dotted names, built from a single walk of the input directories.
+"""
+import ast
+import dataclasses
+import json
+import logging
+import os
+import pkgutil
+import sys
+import sysconfig
+import typing
+
+logger = logging.getLogger(__name__)
+
+# modules that only exist in the Larky standard library
+LARKY_STDLIB = frozenset({"larky", "sets"})
+
+STDLIB = "stdlib"
+VENDOR = "vendor"
+
+
+def python_stdlib_names() -> typing.FrozenSet[str]:
+    """top level module names of the running interpreter's standard library"""
+    names = getattr(sys, "stdlib_module_names", None)  # python 3.10+
+    if names is not None:
+        return frozenset(names)
+    paths = sysconfig.get_paths()
+    stdlib_dirs = {paths["stdlib"], paths["platstdlib"]}
+    stdlib_dirs |= {os.path.join(d, "lib-dynload") for d in stdlib_dirs}
+    names = {name for _, name, _ in pkgutil.iter_modules(list(stdlib_dirs))}
+    names.update(sys.builtin_module_names)
+    return frozenset(n for n in names if n != "site-packages")
+
+
+class StdlibIndex:
+    """
+    Answers "is this module part of the (Python or Larky) stdlib?".
+
+    ``overrides`` maps a module name, or any of its parent packages, to
+    ``"stdlib"`` or ``"vendor"`` and takes precedence over the index; the
+    longest matching prefix wins.
+    """
+
+    def __init__(
+        self,
+        names: typing.Iterable[str] = None,
+        overrides: typing.Mapping[str, str] = None,
+    ):
+        if names is None:
+            names = python_stdlib_names()
+        self.names = frozenset(names)
+        self.overrides = dict(overrides or {})
+        for mod_name, ns in self.overrides.items():
+            if ns not in (STDLIB, VENDOR):
+                raise ValueError(
+                    f"{mod_name}: namespace must be {STDLIB} or {VENDOR}, "
+                    f"not {ns!r}"
+                )
+        self._memo: typing.Dict[str, bool] = {}
+        # memo lookups, for the run metrics
+        self.hits = self.misses = 0
+
+    def is_stdlib(self, mod_name: str) -> bool:
+        if not mod_name:
+            return False
+        try:
+            result = self._memo[mod_name]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self._classify(mod_name)
+        self._memo[mod_name] = result
+        return result
+
+    def namespace(self, mod_name: str) -> str:
+        return STDLIB if self.is_stdlib(mod_name) else VENDOR
+
+    def _classify(self, mod_name: str) -> bool:
+        if self.overrides:
+            prefix = mod_name
+            while prefix:
+                if prefix in self.overrides:
+                    return self.overrides[prefix] == STDLIB
+                prefix = prefix.rpartition(".")[0]
+        top_level = mod_name.partition(".")[0]
+        return top_level in self.names or top_level.lower() in LARKY_STDLIB
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(
+                {"python": sys.version, "names": sorted(self.names)}, f
+            )
+
+    @classmethod
+    def load(cls, path: str, overrides=None) -> "StdlibIndex":
+        """
+        Load a persisted index, (re)building and saving it when it is missing
+        or was written by a different interpreter.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data["python"] == sys.version:
+                return cls(data["names"], overrides)
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug("%s: rebuilding stdlib index: %s", path, e)
+        index = cls(overrides=overrides)
+        index.save(path)
+        return index
+
+
+_default_index: typing.Optional[StdlibIndex] = None
+
+
+def default_stdlib_index() -> StdlibIndex:
+    global _default_index
+    if _default_index is None:
+        _default_index = StdlibIndex()
+    return _default_index
+
+
+@dataclasses.dataclass(frozen=True)
+class ModuleInfo:
+    path: str  # absolute path to the .py file
+    name: str  # dotted module name, packages are named after their dir
+    root: str  # directory the dotted name is relative to
+    is_package: bool  # path is an __init__.py
+
+
+class PackageIndex:
+    """
+    Index of every python module below a set of files and directories,
+    built with a single walk and shared by every file of a batch run.
+
+    Maps module paths to dotted names (and back), so relative imports can be
+    resolved without the ``-p`` flag, and knows which top level packages
+    belong to the project so they are always loaded from ``@vendor``.
+    """
+
+    SKIP_DIRS = ("__pycache__",)
+
+    def __init__(self):
+        self.modules: typing.Dict[str, ModuleInfo] = {}
+        self.by_name: typing.Dict[str, ModuleInfo] = {}
+        self.roots: typing.Set[str] = set()
+        self.top_level: typing.Set[str] = set()
+        # files in the order they were found, i.e. what a batch converts
+        self.sources: typing.List[str] = []
+        self._exports: typing.Dict[str, typing.Tuple[str, ...]] = {}
+
+    @classmethod
+    def build(cls, paths: typing.Iterable[str]) -> "PackageIndex":
+        index = cls()
+        for path in paths:
+            if os.path.isdir(path):
+                index._walk(path)
+            else:
+                index.add(path)
+        return index
+
+    def _walk(self, top):
+        top = os.path.abspath(top)
+        # dirpath => (root, dotted prefix) for every directory we descend into
+        packages = {top: _locate_package(top)}
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = sorted(
+                d
+                for d in dirnames
+                if not d.startswith(".") and d not in self.SKIP_DIRS
+            )
+            root, prefix = packages[dirpath]
+            for d in dirnames:
+                subdir = os.path.join(dirpath, d)
+                if os.path.isfile(os.path.join(subdir, "__init__.py")):
+                    packages[subdir] = (root, prefix + (d,))
+                else:
+                    # not a package, so its modules are top level modules
+                    packages[subdir] = (subdir, ())
+            for f in sorted(filenames):
+                if f.endswith(".py"):
+                    self._add(os.path.join(dirpath, f), root, prefix)
+
+    def add(self, filename: str) -> ModuleInfo:
+        path = os.path.abspath(filename)
+        if path in self.modules:
+            return self.modules[path]
+        root, prefix = _locate_package(os.path.dirname(path))
+        return self._add(path, root, prefix)
+
+    def _add(self, path, root, prefix) -> ModuleInfo:
+        stem = os.path.basename(path)[: -len(".py")]
+        is_package = stem == "__init__"
+        parts = prefix if is_package else prefix + (stem,)
+        info = ModuleInfo(path, ".".join(parts), root, is_package)
+        self.modules[path] = info
+        self.by_name.setdefault(info.name, info)
+        self.roots.add(root)
+        if parts:
+            self.top_level.add(parts[0])
+        self.sources.append(path)
+        return info
+
+    def get(self, filename: str) -> typing.Optional[ModuleInfo]:
+        return self.modules.get(os.path.abspath(filename))
+
+    def module_name(self, filename: str) -> typing.Optional[str]:
+        info = self.get(filename)
+        return info.name if info else None
+
+    def is_project_module(self, mod_name: str) -> bool:
+        return bool(mod_name) and mod_name.partition(".")[0] in self.top_level
+
+    def resolve(
+        self, filename: str, level: int, mod_name: str = ""
+    ) -> typing.Optional[str]:
+        """
+        absolute name of ``from <level dots><mod_name> import ...`` inside
+        ``filename``, or None if the file (or the import) is outside the index
+        """
+        info = self.get(filename)
+        if info is None:
+            return None
+        parts = info.name.split(".") if info.name else []
+        if not info.is_package:
+            parts = parts[:-1]
+        if level - 1 > len(parts):
+            return None
+        parts = parts[: len(parts) - (level - 1)]
+        if mod_name:
+            parts.append(mod_name)
+        return ".".join(parts)
+
+    def exports(self, mod_name: str) -> typing.Tuple[str, ...]:
+        """
+        names ``from mod_name import *`` binds: ``__all__`` if it is a literal,
+        otherwise every public top level name.
+        """
+        if mod_name in self._exports:
+            return self._exports[mod_name]
+        info = self.by_name.get(mod_name)
+        names = ()
+        if info is not None:
+            try:
+                with open(info.path, "rb") as f:
+                    tree = ast.parse(f.read(), info.path)
+            except (OSError, SyntaxError, ValueError) as e:
+                logger.debug("%s: cannot collect exports: %s", info.path, e)
+            else:
+                names = _module_exports(tree)
+        self._exports[mod_name] = names
+        return names
+
+
+def _locate_package(dirpath):
+    """ascend from dirpath while there is an __init__.py to find the root"""
+    prefix = []
+    while os.path.isfile(os.path.join(dirpath, "__init__.py")):
+        dirpath, name = os.path.split(dirpath)
+        prefix.append(name)
+    prefix.reverse()
+    return dirpath, tuple(prefix)
+
+
+def _module_exports(tree: ast.Module) -> typing.Tuple[str, ...]:
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets
+        ):
+            try:
+                return tuple(ast.literal_eval(node.value))
+            except ValueError:
+                pass
+        if isinstance(
+            node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+        ):
+            names.append(node.name)
+        elif isinstance(node, ast.Assign):
+            names.extend(
+                t.id for t in node.targets if isinstance(t, ast.Name)
+            )
+        elif isinstance(node, ast.AnnAssign) and isinstance(
+            node.target, ast.Name
+        ):
+            names.append(node.target.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.extend(
+                (a.asname or a.name).partition(".")[0]
+                for a in node.names
+                if a.name != "*"
+            )
+    return tuple(dict.fromkeys(n for n in names if not n.startswith("_")))
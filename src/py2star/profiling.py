@@ -0,0 +1,113 @@
+"""
+cProfile a single larkify transformer, with flamegraph output.
+
+``larkify --profile-transformer NAME`` (or ``all``) runs the
+``transform_module`` of that transformer under :mod:`cProfile` for every
+file and writes, below ``--profile-dir``, mirroring the package layout:
+
+* ``<module>.<Transformer>.pstats``, for ``python -m pstats`` or snakeviz
+* ``<module>.<Transformer>.collapsed``, one ``frame;frame;frame count``
+  line per stack (microseconds), for flamegraph.pl, speedscope or inferno
+
+cProfile keeps caller -> callee edges, not whole stacks, so the stacks are
+rebuilt by walking the callers of every function, splitting its own time
+between them by how much time each edge accounts for (as flameprof does).
+A function called from several places is therefore approximated. A share
+worth less than :data:`MIN_FRACTION` of the profiled time is not split
+off, it goes to the heaviest caller, which keeps the output to a few
+thousand lines at most without losing any time.
+
+Usage:
+
+    python -m py2star.cli larkify mod.py --profile-transformer WhileToForLoop
+    flamegraph.pl mod.WhileToForLoop.collapsed > while.svg
+"""
+import contextlib
+import cProfile
+import os
+import pstats
+from typing import Dict, List, Optional, Tuple
+
+# stacks are cut when they account for less than this part of the time
+MIN_FRACTION = 0.001
+
+Func = Tuple[str, int, str]
+
+
+def frame_name(func: Func) -> str:
+    filename, lineno, name = func
+    if filename == "~":  # builtins
+        return name.strip("<>")
+    module = os.path.splitext(os.path.basename(filename))[0]
+    return f"{module}.py:{lineno}:{name}".replace(";", ":")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> Dict[str, int]:
+    """``root;...;leaf`` => microseconds spent in leaf itself"""
+    raw = stats.stats
+    stacks: Dict[str, int] = {}
+    total_time = sum(tottime for _, _, tottime, _, _ in raw.values())
+    cutoff = max(total_time * 1e6 * MIN_FRACTION, 1)
+
+    def walk(func, weight, path):
+        callers = raw[func][4] if func in raw else {}
+        edges = {
+            caller: edge[3]
+            for caller, edge in callers.items()
+            if caller not in path and caller != func
+        }
+        total = sum(edges.values())
+        if not edges or not total:
+            key = ";".join(frame_name(f) for f in reversed(path + (func,)))
+            stacks[key] = stacks.get(key, 0) + weight
+            return
+        # shares below the cutoff go to the heaviest caller, so the time
+        # is kept but only stacks worth the cutoff branch out
+        heaviest = max(edges, key=edges.get)
+        shares = {heaviest: 0.0}
+        for caller, cumtime in edges.items():
+            share = weight * cumtime / total
+            if share >= cutoff:
+                shares[caller] = shares.get(caller, 0.0) + share
+            else:
+                shares[heaviest] += share
+        for caller, share in shares.items():
+            walk(caller, share, path + (func,))
+
+    for func, (_, _, tottime, _, _) in raw.items():
+        walk(func, tottime * 1e6, ())
+    stacks = {k: round(v) for k, v in stacks.items()}
+    return {k: v for k, v in stacks.items() if v}
+
+
+def write_collapsed(stats: pstats.Stats, path: str) -> None:
+    stacks = collapsed_stacks(stats)
+    with open(path, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+def save(profiler: cProfile.Profile, prefix: str) -> None:
+    """``prefix.pstats`` and ``prefix.collapsed``"""
+    os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+    profiler.dump_stats(f"{prefix}.pstats")
+    write_collapsed(pstats.Stats(profiler), f"{prefix}.collapsed")
+
+
+@contextlib.contextmanager
+def profiled(prefix: str, pending: Optional[List] = None):
+    """
+    profile the block into ``prefix.pstats`` and ``prefix.collapsed``; with
+    pending, (profiler, prefix) is appended to it instead, to :func:`save`
+    later, outside of whatever is timing the block
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if pending is None:
+            save(profiler, prefix)
+        else:
+            pending.append((profiler, prefix))
@@ -0,0 +1,78 @@
+"""
+Read python sources from disk exactly once.
+
+Each file is read (or memory mapped, if it is large) into a single buffer,
+the encoding is detected from the first two lines of that buffer, as
+``tokenize.detect_encoding`` would, and the buffer is decoded once.
+"""
+import dataclasses
+import locale
+import logging
+import mmap
+import os
+import time
+import tokenize
+
+logger = logging.getLogger(__name__)
+
+# files at least this big are memory mapped instead of read into memory.
+MMAP_THRESHOLD = 1 << 20
+
+
+@dataclasses.dataclass
+class SourceStats:
+    files: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (
+            f"read {self.files} files, {self.bytes_read} bytes "
+            f"in {self.seconds:.3f}s"
+        )
+
+
+def _prefix_readline(buf):
+    """readline over the first two lines of buf, all detect_encoding needs"""
+    pos = 0
+    for _ in range(2):
+        end = buf.find(b"\n", pos)
+        end = len(buf) if end == -1 else end + 1
+        line, pos = buf[pos:end], end
+        yield line
+    while True:
+        yield b""
+
+
+def detect_encoding(buf, filename="<unknown>"):
+    readline = _prefix_readline(buf)
+    try:
+        encoding, _ = tokenize.detect_encoding(lambda: next(readline))
+    except SyntaxError as se:
+        logger.exception("%s: SyntaxError: %s", filename, se)
+        return locale.getpreferredencoding(False)
+    return encoding
+
+
+def decode(buf, filename="<unknown>"):
+    text = str(buf, detect_encoding(buf, filename))
+    # match universal newlines mode of open()
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def read_source(filename, stats: SourceStats = None) -> str:
+    started = time.perf_counter()
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                text = decode(buf, filename)
+        else:
+            text = decode(f.read(), filename)
+    if stats is not None:
+        stats.files += 1
+        stats.bytes_read += size
+        stats.seconds += time.perf_counter() - started
+    return text
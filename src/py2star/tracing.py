@@ -0,0 +1,75 @@
+"""
+Chrome trace-event output for larkify runs.
+
+Every file and every stage it goes through (read, reindent, each fixer,
+parse, metadata resolution, each transformer, codegen, write) is recorded
+as a complete ("X") event, tagged with the PID of the process that did the
+work, so a whole-corpus conversion can be opened in chrome://tracing or
+https://ui.perfetto.dev to spot stragglers and idle workers.
+
+Usage:
+
+    python -m py2star.cli larkify src/ -o out/ --jobs 4 --trace out.json
+"""
+import contextlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Tracer:
+    # timestamps are perf_counter() (CLOCK_MONOTONIC on linux), which agrees
+    # between the worker processes
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        name: str,
+        started: float,
+        seconds: float,
+        cat: str = "stage",
+        pid: Optional[int] = None,
+        **args,
+    ) -> None:
+        """a span that started at perf_counter() ``started``"""
+        pid = os.getpid() if pid is None else pid
+        self.events.append(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": started * 1e6,
+                "dur": seconds * 1e6,
+                "pid": pid,
+                "tid": pid,
+                "args": {k: v for k, v in args.items() if v is not None},
+            }
+        )
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "stage", **args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, started, time.perf_counter() - started, cat, **args)
+
+    def save(self, path: str) -> None:
+        main = os.getpid()
+        names = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "py2star" if pid == main else "worker"},
+            }
+            for pid in sorted({e["pid"] for e in self.events} | {main})
+        ]
+        events = sorted(self.events, key=lambda e: (e["ts"], -e["dur"]))
+        with open(path, "w") as f:
+            json.dump(
+                {"traceEvents": names + events, "displayTimeUnit": "ms"}, f
+            )
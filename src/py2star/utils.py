@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import inspect
+import io
 import tokenize
 from lib2to3.pgen2 import token
+from typing import Pattern
 
 try:
     from inspect import Parameter
@@ -179,21 +181,122 @@ def dedent_suite(suite, dedent):
             leaf.prefix = leaf.prefix[:-dedent]
 
 
+# Matches anything ReIndenter would rewrite regardless of indentation levels:
+# tabs (expanded), form feeds and trailing whitespace (stripped).
+_NEEDS_REINDENT: Pattern[str] = re.compile(r"[\t\f]|[ ]$", re.MULTILINE)
+
+# Just enough of a tokenizer to find where logical lines start: strings,
+# comments and escaped newlines are skipped, brackets and newlines are kept.
+_LOGICAL_LINE_SCANNER: Pattern[str] = re.compile(
+    r"""
+      '''(?:[^'\\]+|\\.|'(?!''))*'''
+    | \"\"\"(?:[^"\\]+|\\.|"(?!""))*\"\"\"
+    | '(?:[^'\\\n]+|\\.)*'
+    | "(?:[^"\\\n]+|\\.)*"
+    | \#[^\n]*
+    | \\\n
+    | (?P<open>[(\[{])
+    | (?P<close>[)\]}])
+    | (?P<newline>\n)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_LEADING_SPACES: Pattern[str] = re.compile(r" *")
+
+
+def needs_reindent(source: str) -> bool:
+    """
+    Cheap check that returns False when running :class:`ReIndenter` over
+    ``source`` cannot change it, i.e. it already uses 4-space indentation,
+    has no tabs and no trailing whitespace or trailing blank lines.
+
+    Anything that cannot be proven unchanged returns True.
+    """
+    if not source:
+        return False
+    if not source.endswith("\n") or source.endswith("\n\n") or source == "\n":
+        return True
+    if _NEEDS_REINDENT.search(source):
+        return True
+    return not _indentation_is_normalized(source)
+
+
+def _indentation_is_normalized(source: str) -> bool:
+    """
+    True if every statement is indented by exactly 4 spaces per block level.
+
+    This mirrors what tokenize does with INDENT/DEDENT tokens: only the first
+    line of a logical line counts, blank and comment-only lines are ignored.
+    ReIndenter leaves comments alone when no statement moves.
+    """
+    stack = [0]
+    depth = 0
+    start = 0  # offset of the logical line being scanned
+    for mo in _LOGICAL_LINE_SCANNER.finditer(source):
+        kind = mo.lastgroup
+        if kind is None:
+            continue
+        if kind == "open":
+            depth += 1
+            continue
+        if kind == "close":
+            depth -= 1
+            if depth < 0:
+                return False
+            continue
+        if depth:
+            continue
+        line_start, start = start, mo.end()
+        end = _LEADING_SPACES.match(source, line_start).end()
+        if source[end] in "\n#":
+            continue
+        have = end - line_start
+        if have > stack[-1]:
+            if have != stack[-1] + 4:
+                return False
+            stack.append(have)
+        elif have < stack[-1]:
+            while have < stack[-1]:
+                stack.pop()
+            if have != stack[-1]:
+                return False
+    return depth == 0
+
+
+def reindent(source: str) -> str:
+    """
+    Normalize indentation of ``source`` to 4 spaces, skipping the (expensive)
+    tokenize pass entirely when :func:`needs_reindent` says it is a no-op.
+    """
+    if not needs_reindent(source):
+        return source
+    r = ReIndenter(io.StringIO(source))
+    r.run()
+    return "".join(r.after)
+
+
 # From: https://github.com/python/cpython/blob/3.9/Tools/scripts/reindent.py
+#
+# Unlike the original, this keeps a single list of lines: the rstripped,
+# tab-expanded input is re-indented in place and exposed as ``after`` once
+# ``run()`` returns, instead of holding ``raw``, ``lines`` and ``after``
+# copies of the whole file.
 class ReIndenter:
     def __init__(self, f):
         self.after = []
         self.find_stmt = 1  # next token begins a fresh stmt?
         self.level = 0  # current indent level
-
-        # Raw file lines.
-        self.raw = f.readlines()
+        self.changed = False
 
         # File lines, rstripped & tab-expanded.  Dummy at start is so
         # that we can use tokenize's 1-based line numbering easily.
         # Note that a line is all-blank iff it's "\n".
-        self.lines = [_rstrip(line).expandtabs() + "\n" for line in self.raw]
-        self.lines.insert(0, None)
+        self.lines = [None]
+        for line in f:
+            normalized = _rstrip(line).expandtabs() + "\n"
+            if normalized != line:
+                self.changed = True
+            self.lines.append(normalized)
         self.index = 1  # index into self.lines of next line
 
         # List of (lineno, indentlevel) pairs, one for each stmt and
@@ -212,19 +315,20 @@ class ReIndenter:
             self.tokeneater(*_token)
         # Remove trailing empty lines.
         lines = self.lines
-        while lines and lines[-1] == "\n":
+        while len(lines) > 1 and lines[-1] == "\n":
             lines.pop()
+            self.changed = True
         # Sentinel.
         stats = self.stats
         stats.append((len(lines), 0))
         # Map count of leading spaces to # we want.
         have2want = {}
-        # Program after transformation.
-        # Copy over initial empty lines -- there's nothing to do until
+        # Leading spaces added (or removed, if negative) to the first line of
+        # each stmt, standing in for the original's ``after`` list when
+        # shifting hanging comments.
+        shifted = [0] * len(stats)
+        # Initial empty lines are left alone -- there's nothing to do until
         # we see a line with *something* on it.
-        after = self.after
-        i = stats[0][0]
-        after.extend(lines[1:i])
         for i in range(len(stats) - 1):
             thisstmt, thislevel = stats[i]
             nextstmt = stats[i + 1][0]
@@ -252,10 +356,7 @@ class ReIndenter:
                         for j in range(i - 1, -1, -1):
                             jline, jlevel = stats[j]
                             if jlevel >= 0:
-                                want = have + (
-                                    get_leading_spaces(after[jline - 1])
-                                    - get_leading_spaces(lines[jline])
-                                )
+                                want = have + shifted[j]
                                 break
                     if want < 0:
                         # Still no luck -- leave it alone.
@@ -266,18 +367,24 @@ class ReIndenter:
             have2want[have] = want
             diff = want - have
             if diff == 0 or have == 0:
-                after.extend(lines[thisstmt:nextstmt])
+                continue
+            self.changed = True
+            if diff > 0:
+                shifted[i] = diff
+                for k in range(thisstmt, nextstmt):
+                    if lines[k] != "\n":
+                        lines[k] = " " * diff + lines[k]
             else:
-                for line in lines[thisstmt:nextstmt]:
-                    if diff > 0:
-                        if line == "\n":
-                            after.append(line)
-                        else:
-                            after.append(" " * diff + line)
-                    else:
-                        remove = min(get_leading_spaces(line), -diff)
-                        after.append(line[remove:])
-        return self.raw != self.after
+                shifted[i] = -min(have, -diff)
+                for k in range(thisstmt, nextstmt):
+                    line = lines[k]
+                    remove = min(get_leading_spaces(line), -diff)
+                    lines[k] = line[remove:]
+        # drop the dummy line and hand the (now re-indented) lines over.
+        del lines[0]
+        self.after = lines
+        self.lines = [None]
+        return self.changed
 
     def write(self, f):
         f.writelines(self.after)
@@ -0,0 +1,348 @@
+"""
+Convert the files of a batch in worker processes, with limits.
+
+One pathological input must not hold up the rest of a corpus, so every
+file gets a wall-clock deadline, every worker an RSS ceiling, and workers
+are recycled after a number of files (libcst metadata is not always given
+back to the OS). A file that hits a limit is not retried in the pool, it
+ends up in the list returned by :func:`run`, with the stage it was in and
+how long it ran, to be retried serially.
+"""
+import collections
+import dataclasses
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, Optional, Sequence
+
+from py2star.metrics import FILES_FAILED
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# seconds between two RSS checks of a worker
+RSS_INTERVAL = 0.05
+# times a file goes back to the queue because its worker died before
+# starting it, before it is given up on
+MAX_REQUEUES = 3
+
+DEADLINE = "deadline"
+RSS = "rss"
+ERROR = "error"
+CRASHED = "crashed"
+
+
+@dataclasses.dataclass
+class Limits:
+    deadline: Optional[float] = None  # seconds per file
+    max_rss: Optional[int] = None  # bytes per worker
+    max_files: Optional[int] = None  # files per worker before recycling
+
+    def __bool__(self):
+        return any(dataclasses.astuple(self))
+
+
+@dataclasses.dataclass
+class Retry:
+    filename: str
+    reason: str  # DEADLINE, RSS, ERROR or CRASHED
+    stage: Optional[str]
+    elapsed: float
+    detail: str = ""
+
+    def __str__(self):
+        detail = f": {self.detail}" if self.detail else ""
+        return (
+            f"{self.filename}: {self.reason} in {self.stage or 'startup'} "
+            f"after {self.elapsed:.2f}s{detail}"
+        )
+
+
+def current_rss() -> int:
+    """resident set size of this process in bytes (peak, without /proc)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _watch_rss(lock, current, send, max_rss):
+    # only a file in progress is charged for the RSS, an idle worker may
+    # still be giving memory back
+    while True:
+        with lock:
+            filename = current[0]
+            rss = current_rss() if filename else 0
+            if rss > max_rss:
+                send(RSS, filename, f"{rss >> 20} MiB")
+                os._exit(1)
+        time.sleep(RSS_INTERVAL)
+
+
+def _worker(conn, convert, batch, max_rss):
+    lock = threading.RLock()
+    current = [None]  # the file in progress
+
+    def send(*message):
+        with lock:
+            conn.send(message)
+
+    batch.on_stage = lambda name: send("stage", name)
+    if max_rss:
+        threading.Thread(
+            target=_watch_rss,
+            args=(lock, current, send, max_rss),
+            daemon=True,
+        ).start()
+    while True:
+        filename = conn.recv()
+        if filename is None:
+            return
+        _reset(batch)
+        with lock:
+            current[0] = filename
+        try:
+            out = convert(filename, batch=batch)
+        except Exception as e:
+            logger.debug("%s: failed", filename, exc_info=True)
+            with lock:
+                send(ERROR, f"{type(e).__name__}: {e}", _collected(batch))
+                current[0] = None
+            continue
+        # retire rather than charge what is left to the next file
+        retire = bool(max_rss) and current_rss() > max_rss
+        with lock:
+            send("done", out, _collected(batch), retire)
+            current[0] = None
+
+
+def _reset(batch):
+    # only send back what this file added
+    batch.stats = type(batch.stats)()
+    batch.stage_seconds = {}
+    batch.metrics = type(batch.metrics)()
+    if batch.tracer is not None:
+        batch.tracer.events = []
+
+
+def _collected(batch):
+    events = batch.tracer.events if batch.tracer is not None else []
+    return batch.stats, batch.stage_seconds, batch.metrics, events
+
+
+class _Worker:
+    def __init__(self, context, convert, batch, max_rss):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker,
+            args=(child, convert, batch, max_rss),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.files = 0
+        self.filename = None
+        self.stage = None
+        self.started = 0.0
+
+    def assign(self, filename):
+        self.filename, self.stage = filename, None
+        self.started = time.perf_counter()
+        self.conn.send(filename)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _merge(batch, collected):
+    stats, stage_seconds, metrics, events = collected
+    batch.metrics.merge(metrics)
+    if batch.tracer is not None:
+        batch.tracer.events.extend(events)
+    batch.stats.files += stats.files
+    batch.stats.bytes_read += stats.bytes_read
+    batch.stats.seconds += stats.seconds
+    for name, seconds in stage_seconds.items():
+        batch.stage_seconds[name] = batch.stage_seconds.get(name, 0) + seconds
+
+
+def run(
+    filenames: Sequence[str],
+    convert: Callable,
+    batch,
+    on_result: Callable[[str, str], None],
+    jobs: int = 1,
+    limits: Optional[Limits] = None,
+) -> List[Retry]:
+    """
+    ``convert(filename, batch=batch)`` every file in ``jobs`` worker
+    processes and pass the outputs to ``on_result`` in input order. Returns
+    the files that hit a limit (or failed), to be retried serially.
+    """
+    limits = limits or Limits()
+    context = multiprocessing.get_context()
+    todo = collections.deque(filenames)
+    order = {filename: i for i, filename in enumerate(filenames)}
+    finished: Dict[int, Optional[str]] = {}  # None if it needs a retry
+    next_index = 0
+    workers: List[_Worker] = []
+    retries: List[Retry] = []
+    requeued: Dict[str, int] = collections.Counter()
+
+    def flush():
+        nonlocal next_index
+        while next_index in finished:
+            out = finished.pop(next_index)
+            if out is not None:
+                on_result(filenames[next_index], out)
+            next_index += 1
+
+    def retry(worker, reason, detail=""):
+        retries.append(
+            Retry(
+                worker.filename, reason, worker.stage, worker.elapsed, detail
+            )
+        )
+        logger.warning("%s", retries[-1])
+        if reason != ERROR:
+            # errors are counted by the worker
+            batch.metrics.inc(FILES_FAILED, reason=reason)
+        if batch.tracer is not None and reason != ERROR:
+            # the worker is gone with its spans, keep the time it took
+            batch.tracer.add(
+                worker.filename,
+                worker.started,
+                worker.elapsed,
+                cat=reason,
+                pid=worker.process.pid,
+                file=worker.filename,
+                stage=worker.stage,
+            )
+        finished[order[worker.filename]] = None
+        worker.filename = None
+
+    def replace(worker):
+        worker.kill()
+        workers.remove(worker)
+
+    def requeue(worker):
+        # the worker died before it got to the file, or was not charged
+        filename, worker.filename = worker.filename, None
+        requeued[filename] += 1
+        if requeued[filename] > MAX_REQUEUES:
+            worker.filename = filename
+            retry(worker, CRASHED, "workers keep exiting before it starts")
+        else:
+            todo.appendleft(filename)
+        replace(worker)
+
+    def assign(worker, filename):
+        worker.filename, worker.stage = filename, None
+        worker.started = time.perf_counter()
+        if worker.process.is_alive():
+            try:
+                worker.assign(filename)
+                return
+            except OSError:  # BrokenPipeError
+                pass
+        logger.debug("worker %s exited while idle", worker.process.pid)
+        requeue(worker)
+
+    try:
+        while todo or any(w.filename for w in workers):
+            while todo and len(workers) < jobs:
+                workers.append(
+                    _Worker(context, convert, batch, limits.max_rss)
+                )
+            for worker in list(workers):
+                if worker.filename is None and todo:
+                    assign(worker, todo.popleft())
+            busy = {w.conn: w for w in workers if w.filename}
+            if not busy:
+                continue  # every worker was replaced, start new ones
+
+            timeout = None
+            if limits.deadline:
+                timeout = max(
+                    0.0,
+                    min(
+                        limits.deadline - w.elapsed
+                        for w in workers
+                        if w.filename
+                    ),
+                )
+            busy = {w.conn: w for w in workers if w.filename}
+            for conn in wait(list(busy), timeout):
+                worker = busy[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    retry(worker, CRASHED)
+                    replace(worker)
+                    continue
+                kind, *payload = message
+                if kind == "stage":
+                    worker.stage = payload[0]
+                elif kind == "done":
+                    out, collected, retire = payload
+                    _merge(batch, collected)
+                    finished[order[worker.filename]] = out
+                    worker.filename = None
+                    worker.files += 1
+                    if retire or (
+                        limits.max_files and worker.files >= limits.max_files
+                    ):
+                        worker.stop()
+                        workers.remove(worker)
+                elif kind == ERROR:
+                    detail, collected = payload
+                    _merge(batch, collected)
+                    retry(worker, ERROR, detail)
+                elif kind == RSS:
+                    filename, detail = payload
+                    if filename == worker.filename:
+                        retry(worker, RSS, detail)
+                        replace(worker)
+                    else:
+                        logger.debug("%s: stale RSS message", filename)
+                        requeue(worker)
+
+            if limits.deadline:
+                for worker in list(workers):
+                    if worker.filename and worker.elapsed > limits.deadline:
+                        retry(worker, DEADLINE)
+                        replace(worker)
+            flush()
+    finally:
+        for worker in workers:
+            worker.stop()
+    flush()
+    return retries
@@ -1,13 +1,21 @@
+import ast
+import dataclasses
 import io
 import logging
+import os
+import tempfile
+import textwrap
 import unittest
 
 import astunparse
 import libcst as cst
+import libcst.matchers as m
 import pytest
 from libcst.codemod import CodemodContext, CodemodTest
+from py2star import bench, import_map, module_index
 from py2star.asteez import (
     functionz,
+    matching,
     remove_exceptions,
     remove_types,
     rewrite_class,
@@ -105,6 +113,334 @@ for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
     assert expected.code.strip() == rewritten.code.strip()
 
 
+class TestCountingLoops(CodemodTest):
+    TRANSFORM = rewrite_loopz.WhileToForLoop
+
+    def test_counting_loop_to_range(self):
+        before = """
+        def checksum(data):
+            total = 0
+            n = len(data) // 2
+            # counter
+            i = 0
+            while i < len(data):
+                total += data[i]
+                i += 1
+            j = len(data) - 1
+            while j >= n:
+                data[j] = 0
+                j -= 2
+            return total
+        """
+        after = """
+        def checksum(data):
+            total = 0
+            n = len(data) // 2
+            # counter
+            for i in range(0, len(data)):
+                total += data[i]
+            for j in range(len(data) - 1, n - 1, -2):
+                data[j] = 0
+            return total
+        """
+        self.assertCodemod(before, after)
+
+    def test_other_loops_are_emulated(self):
+        before = """
+        def f(data, n):
+            i = 0
+            while i < n:
+                if data[i]:
+                    i += 2
+                    continue
+                i += 1
+            j = 0
+            while j < len(data):
+                data.append(j)
+                j += 1
+            k = 0
+            while k < n:
+                k += 1
+            return k
+        """
+        after = """
+        def f(data, n):
+            i = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if i >= n:
+                    break
+                if data[i]:
+                    i += 2
+                    continue
+                i += 1
+            j = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if j >= len(data):
+                    break
+                data.append(j)
+                j += 1
+            k = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if k >= n:
+                    break
+                k += 1
+            return k
+        """
+        self.assertCodemod(before, after)
+
+    def test_length_changed_by_slice_or_alias_is_emulated(self):
+        before = """
+        def f(data):
+            i = 0
+            while i < len(data):
+                data[i:i + 1] = []
+                i += 1
+            buf = data
+            j = 0
+            while j < len(data):
+                buf.append(data[j])
+                j += 1
+        """
+        after = """
+        def f(data):
+            i = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if i >= len(data):
+                    break
+                data[i:i + 1] = []
+                i += 1
+            buf = data
+            j = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if j >= len(data):
+                    break
+                buf.append(data[j])
+                j += 1
+        """
+        self.assertCodemod(before, after)
+
+    def test_stop_of_unknown_type_is_emulated(self):
+        before = """
+        def f(data, n):
+            m = 2.5
+            i = 0
+            while i < m:
+                data.append(i)
+                i += 1
+            j = 0
+            while j <= n:
+                data.append(j)
+                j += 1
+        """
+        after = """
+        def f(data, n):
+            m = 2.5
+            i = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if i >= m:
+                    break
+                data.append(i)
+                i += 1
+            j = 0
+            for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):
+                if j > n:
+                    break
+                data.append(j)
+                j += 1
+        """
+        self.assertCodemod(before, after)
+
+
+def test_counter_read_in_else_is_not_moved_to_range():
+    module = cst.parse_module(
+        textwrap.dedent(
+            """
+            def f(data):
+                i = 0
+                while i < len(data):
+                    data[i] = 0
+                    i += 1
+                else:
+                    data.append(i)
+            """
+        )
+    )
+    w2f = rewrite_loopz.WhileToForLoop(CodemodContext())
+    code = w2f.transform_module(module).code
+    # for i in range() would leave i one short in the else clause
+    assert "range(0, len(data))" not in code
+    assert "i = 0" in code
+
+
+def test_counting_loop_runs_faster():
+    timings = bench.bench_while_loop(size=20000)
+    assert timings["for range()"] < timings["while emulation"]
+
+
+def _is_leave_hook(func):
+    return func.name.startswith("leave_") or any(
+        isinstance(d, ast.Call)
+        and isinstance(d.func, ast.Attribute)
+        and d.func.attr == "leave"
+        for d in func.decorator_list
+    )
+
+
+def test_leave_hooks_do_not_deep_replace_themselves():
+    # the node a leave hook replaces is simply returned
+    asteez = os.path.dirname(rewrite_loopz.__file__)
+    offenders = []
+    for name in sorted(os.listdir(asteez)):
+        if not name.endswith(".py"):
+            continue
+        path = os.path.join(asteez, name)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for func in ast.walk(tree):
+            if not isinstance(func, ast.FunctionDef) or not _is_leave_hook(
+                func
+            ):
+                continue
+            for call in ast.walk(func):
+                if (
+                    isinstance(call, ast.Call)
+                    and isinstance(call.func, ast.Attribute)
+                    and call.func.attr == "deep_replace"
+                    and call.args
+                    and ast.dump(call.args[0]) == ast.dump(call.func.value)
+                ):
+                    offenders.append(f"{name}:{call.lineno} {func.name}")
+    assert offenders == []
+
+
+def test_possible_types_of_matchers():
+    assert matching.possible_types(m.Call()) == {"Call"}
+    assert matching.possible_types(
+        m.OneOf(m.Name("a"), m.Attribute())
+    ) == {"Name", "Attribute"}
+    assert matching.possible_types(m.TypeOf(m.Name, m.Call)()) == {
+        "Name",
+        "Call",
+    }
+    assert matching.possible_types(m.MatchIfTrue(bool)) is None
+    assert matching.possible_types(~m.Name()) is None
+
+
+def test_matchers_only_evaluated_on_possible_types():
+    source = 'x = br"\\x00"\ny = f(1, "a") + g.h\n'
+    outputs, stats = [], []
+    for prefilter in (True, False):
+        transformer = remove_exceptions.SwapByteStringPrefixes(
+            CodemodContext()
+        )
+        transformer.prefilter = prefilter
+        with matching.counting() as counted:
+            outputs.append(
+                transformer.transform_module(cst.parse_module(source)).code
+            )
+        (stats_,) = counted.values()
+        stats.append(stats_)
+    assert outputs[0] == outputs[1] == 'x = rb"\\x00"\ny = f(1, "a") + g.h\n'
+    prefiltered, every_node = stats
+    # only the two strings are evaluated
+    assert (prefiltered.evaluations, prefiltered.hits) == (2, 1)
+    assert prefiltered.skipped == every_node.evaluations - 2
+    assert every_node.hits == 1
+
+
+class TestStringAccumulationToJoin(CodemodTest):
+    TRANSFORM = rewrite_loopz.StringAccumulationToJoin
+
+    def test_accumulator_to_join(self):
+        before = """
+        def encode(data, sep):
+            out = ""
+            raw = b"\\x00"
+            for c in data:
+                if c:
+                    out += chr(c); raw += bytes([c])
+                for i in range(c):
+                    out += sep
+            total = 0
+            while data:
+                total += data.pop()
+            return out, raw, total
+        """
+        after = """
+        def encode(data, sep):
+            out = []
+            raw = [b"\\x00"]
+            for c in data:
+                if c:
+                    out.append(chr(c)); raw.append(bytes([c]))
+                for i in range(c):
+                    out.append(sep)
+            out = "".join(out)
+            raw = b"".join(raw)
+            total = 0
+            while data:
+                total += data.pop()
+            return out, raw, total
+        """
+        self.assertCodemod(before, after)
+
+    def test_inner_loop_accumulator(self):
+        before = """
+        def lines(rows):
+            text = ""
+            for row in rows:
+                line = ""
+                for cell in row:
+                    line += cell
+                text += line
+            return text
+        """
+        after = """
+        def lines(rows):
+            text = []
+            for row in rows:
+                line = []
+                for cell in row:
+                    line.append(cell)
+                line = "".join(line)
+                text.append(line)
+            text = "".join(text)
+            return text
+        """
+        self.assertCodemod(before, after)
+
+    def test_read_in_loop_is_flagged(self):
+        before = """
+        def pad(data, n):
+            out = ""
+            for c in data:
+                out += c
+                if len(out) > n:
+                    break
+            closure = ""
+            for c in data:
+                closure += c
+                check(lambda: closure)
+            return out
+        """
+        after = """
+        def pad(data, n):
+            out = ""
+            # PY2LARKY: out += in this loop is quadratic, but it is read in the loop
+            for c in data:
+                out += c
+                if len(out) > n:
+                    break
+            closure = ""
+            # PY2LARKY: closure += in this loop is quadratic, but it is read in the loop
+            for c in data:
+                closure += c
+                check(lambda: closure)
+            return out
+        """
+        self.assertCodemod(before, after)
+
+
 class TestGeneratorAndYieldTransformations(CodemodTest):
     TRANSFORM = functionz.GeneratorToFunction
 
@@ -244,6 +580,27 @@ class TestDesugarDecorators(CodemodTest):
             ),
         )
 
+    def test_methods_keep_their_decorators(self):
+        before = """
+        class Foo(object):
+            @staticmethod
+            def foo(a, b):
+                @decorator
+                def bar():
+                    pass
+                return bar
+        """
+        after = """
+        class Foo(object):
+            @staticmethod
+            def foo(a, b):
+                def bar():
+                    pass
+                bar = decorator(bar)
+                return bar
+        """
+        self.assertCodemod(before, after, desugar_methods=False)
+
     def test_de_decorate_function_with_arguments(self):
         before = """
         @decorator(1)
@@ -323,6 +680,43 @@ class TestDesugarSetSyntax(CodemodTest):
         """
         self.assertCodemod(before, after)
 
+    def test_membership_only_set_to_dict(self):
+        before = """
+        __all__ = ["_EXPORTED"]
+        _ALGORITHMS = {"RS256", "ES256"}
+        PUBLIC = {"RS256"}
+        _EXPORTED = {"a"}
+        _MUTATED = {1, 2}
+        _ITERATED = {1, 2}
+
+        def check(alg, n):
+            seen = {
+                0,
+                1,
+            }
+            if alg not in _ALGORITHMS or alg in PUBLIC or "b" in _EXPORTED:
+                _MUTATED.add(n)
+            return n in seen and n in _MUTATED, [i for i in _ITERATED]
+        """
+        after = """
+        __all__ = ["_EXPORTED"]
+        _ALGORITHMS = {"RS256": True, "ES256": True}
+        PUBLIC = Set(["RS256"])
+        _EXPORTED = Set(["a"])
+        _MUTATED = Set([1, 2])
+        _ITERATED = Set([1, 2])
+
+        def check(alg, n):
+            seen = {
+                0: True,
+                1: True,
+            }
+            if alg not in _ALGORITHMS or alg in PUBLIC or "b" in _EXPORTED:
+                _MUTATED.add(n)
+            return n in seen and n in _MUTATED, [i for i in _ITERATED]
+        """
+        self.assertCodemod(before, after)
+
 
 class TestSubMethodsWithLibraryCallsInstead(MetadataResolvingCodemodTest):
     TRANSFORM = remove_exceptions.SubMethodsWithLibraryCallsInstead
@@ -375,8 +769,7 @@ class TestRewriteImplicitStringConcat(MetadataResolvingCodemodTest):
         """
 
         after = """
-        print(("Attempting to verify a message with a private key. " +
-              "This is not recommended."))
+        print("Attempting to verify a message with a private key. This is not recommended.")
         """
         ctx = self._get_context_override(before)
         self.assertCodemod(before, after, context_override=ctx)
@@ -396,13 +789,34 @@ class TestRewriteImplicitStringConcat(MetadataResolvingCodemodTest):
         )
         """
         after = """
-        regex1 = (r"pack_into requires a buffer of at least 6 " +
-            r"bytes for packing 1 bytes at offset 5 " +
-            r"\(actual buffer size is 1\)")
+        regex1 = (
+            r"pack_into requires a buffer of at least 6 bytes for packing 1 bytes at offset 5 \(actual buffer size is 1\)"
+        )
         
-        regex2 = (r"unpack_from requires a buffer of at least 6 " +
-            r"bytes for unpacking 1 bytes at offset 5 " +
-            r"\(actual buffer size is 1\)")
+        regex2 = (
+            r"unpack_from requires a buffer of at least 6 bytes for unpacking 1 bytes at offset 5 \(actual buffer size is 1\)"
+        )
+        """
+        ctx = self._get_context_override(before)
+        self.assertCodemod(before, after, context_override=ctx)
+
+    def test_keep_concat_around_non_literal_parts(self):
+        before = """
+        a = ("one "
+             "two "
+             f"{three} "
+             "four "
+             r"\d" "five")
+        b = "\\1" "2"
+        c = b"bytes " b"too"
+        """
+        after = """
+        a = ("one two " +
+             f"{three} " +
+             "four " +
+             r"\d" + "five")
+        b = ("\\1" + "2")
+        c = b"bytes too"
         """
         ctx = self._get_context_override(before)
         self.assertCodemod(before, after, context_override=ctx)
@@ -814,6 +1228,123 @@ class TestClassRewriting(MetadataResolvingCodemodTest):
             before, after, remove_decorators=True, use_mutablestruct=True
         )
 
+    def test_class_to_shared_methods(self):
+        before = """
+        class Key(object):
+            \"\"\"A key.\"\"\"
+            SIZES = (16, 32)
+
+            def __init__(self, key, *, size=16):
+                self.key = key
+                self.size = size
+
+            def encrypt(self, data):
+                return data
+
+            @staticmethod
+            def new(key):
+                return Key(key)
+
+            @classmethod
+            def generate(cls):
+                return cls(b"")
+        """
+        after = """
+        _Key_SIZES = (16, 32)
+
+        def _Key___init__(self, key, *, size=16):
+            self.key = key
+            self.size = size
+
+        def _Key_encrypt(self, data):
+            return data
+
+        def _Key_new(key):
+            return Key(key)
+
+        def _Key_generate(cls):
+            return cls(b"")
+
+        def Key(key, *, size=16):
+            \"\"\"A key.\"\"\"
+            self = larky.mutablestruct(__name__='Key', __class__=Key)
+            self.SIZES = _Key_SIZES
+            self.encrypt = larky.partial(_Key_encrypt, self)
+            self.new = _Key_new
+            self.generate = larky.partial(_Key_generate, Key)
+            _Key___init__(self, key, size=size)
+            return self
+        """
+        self.assertCodemod(before, after, class_encoding="shared")
+
+    def test_shared_methods_note_what_is_lost(self):
+        before = """
+        class Key(Base, metaclass=Meta):
+            @property
+            def size(self):
+                return 16
+
+            @cached
+            @staticmethod
+            def new():
+                return Key()
+        """
+        after = """
+        # PY2LARKY: @property decorated a method of Key
+        def _Key_size(self):
+            return 16
+        _Key_size = property(_Key_size)
+
+        # PY2LARKY: @cached decorated a method of Key
+        def _Key_new():
+            return Key()
+        _Key_new = cached(_Key_new)
+
+        # PY2LARKY: Key does not inherit from Base, metaclass=Meta
+        def Key():
+            self = larky.mutablestruct(__name__='Key', __class__=Key)
+            self.size = larky.partial(_Key_size, self)
+            self.new = _Key_new
+            return self
+        """
+        self.assertCodemod(before, after, class_encoding="shared")
+
+    def test_shared_methods_after_desugared_decorators(self):
+        # what DesugarDecorators leaves in a class body
+        before = """
+        class Key(object):
+            SIZES = (16, 32)
+            DEFAULT = SIZES[0]
+
+            def helper(x):
+                return x * 2
+            helper = helper
+
+            def size(self):
+                return self.DEFAULT
+            size = twice(size)
+        """
+        after = """
+        _Key_SIZES = (16, 32)
+        _Key_DEFAULT = _Key_SIZES[0]
+
+        def _Key_helper(x):
+            return x * 2
+
+        def _Key_size(self):
+            return self.DEFAULT
+        _Key_size = twice(_Key_size)
+
+        def Key():
+            self = larky.mutablestruct(__name__='Key', __class__=Key)
+            self.SIZES = _Key_SIZES
+            self.DEFAULT = _Key_DEFAULT
+            self.helper = larky.partial(_Key_helper, self)
+            self.size = larky.partial(_Key_size, self)
+            return self
+        """
+        self.assertCodemod(before, after, class_encoding="shared")
+
 
 def _remove_empty_lines(mystr):
     # "".join([s for s in t.strip().splitlines(True)
@@ -971,6 +1502,55 @@ class TestRewriteImporting(MetadataResolvingCodemodTest):
         # print(rewritten.code.strip())
         # assert dedent(expected).strip() == dedent(rewritten.code).strip()
 
+    def test_rewrite_imports_with_package_index(self):
+        before = """
+        import json
+        from . import utils
+        from .base import Key
+        from ..exceptions import JWKError
+        from .constants import *
+        """
+        after = """
+        load("@stdlib//json", json="json")
+        load("@vendor//jose/backends", utils="utils")
+        load("@vendor//jose/backends/base", Key="Key")
+        load("@vendor//jose/exceptions", JWKError="JWKError")
+        load("@vendor//jose/backends/constants", ALGORITHMS="ALGORITHMS")
+        """
+        with tempfile.TemporaryDirectory() as root:
+            backends = os.path.join(root, "jose", "backends")
+            os.makedirs(backends)
+            for path, source in [
+                ("jose/__init__.py", ""),
+                ("jose/backends/__init__.py", ""),
+                ("jose/backends/rsa.py", ""),
+                ("jose/backends/constants.py", "ALGORITHMS = ()\n"),
+            ]:
+                with open(os.path.join(root, path), "w") as f:
+                    f.write(source)
+            index = module_index.PackageIndex.build([root])
+            ctx = self._get_context_override(before)
+            ctx = dataclasses.replace(
+                ctx,
+                filename=os.path.join(backends, "rsa.py"),
+                scratch={"package_index": index},
+            )
+            self.assertCodemod(before, after, context_override=ctx)
+
+    def test_rewrite_imports_with_import_map(self):
+        before = """
+        import assertpy
+        from six.moves import range
+        """
+        after = """
+        load("@vendor//asserts", assertpy="asserts")
+        load("@vendor//compat/moves", range="range")
+        """
+        imap = import_map.ImportMap().updated({"six": ("vendor", "compat")})
+        ctx = self._get_context_override(before)
+        ctx = dataclasses.replace(ctx, scratch={"import_map": imap})
+        self.assertCodemod(before, after, context_override=ctx)
+
 
 class TestImportSorting(MetadataResolvingCodemodTest):
 
@@ -1202,6 +1782,28 @@ class TestImportSorting(MetadataResolvingCodemodTest):
         ctx = self._get_context_override(before)
         self.assertCodemod(before, after, context_override=ctx)
 
+    def test_loads_of_one_module_sort_by_what_they_load(self):
+        before = """
+        load("@stdlib//re", sub="sub")
+        load("@stdlib//io", io="io")
+        load("@stdlib//re", match="match")
+        load("@stdlib//re", "escape")
+
+        x = 1
+        """
+        after = """
+        load("@stdlib//io", io="io")
+        load("@stdlib//re", "escape")
+        load("@stdlib//re", match="match")
+        load("@stdlib//re", sub="sub")
+
+        x = 1
+        """
+        for _ in range(5):
+            # the same order whatever order the load nodes hash in
+            ctx = self._get_context_override(before)
+            self.assertCodemod(before, after, context_override=ctx)
+
 
 class TestDelKeyword(MetadataResolvingCodemodTest):
 
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from py2star import bench, cli
+
+
+def test_compare_flags_only_real_slowdowns():
+    baseline = bench.summarize(
+        {"parse": [1.0, 1.1, 0.9], "tiny": [0.001] * 3, "noisy": [1, 2, 3]}
+    )
+    current = bench.summarize(
+        {
+            "parse": [1.5, 1.4, 1.6],
+            "tiny": [0.003] * 3,
+            "noisy": [1.5, 2.5, 3.5],
+            "new": [1.0],
+        }
+    )
+    comparisons = {c.stage: c for c in bench.compare(baseline, current)}
+    assert comparisons["parse"].regressed
+    assert comparisons["parse"].ratio == pytest.approx(1.5)
+    # 3x slower, but below min_seconds
+    assert not comparisons["tiny"].regressed
+    # within the dispersion of the runs
+    assert not comparisons["noisy"].regressed
+    assert comparisons["new"].baseline is None
+    assert not comparisons["new"].regressed
+
+
+def test_save_and_compare(tmp_path, capsys):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.py").write_text("x = 1\n")
+    baseline = tmp_path / "baseline.json"
+    common = ["bench", "--corpus", str(corpus), "--repeat", "2"]
+    common += ["--synthetic", "1"]
+    cli.main([*common, "--save", str(baseline)])
+    data = json.loads(baseline.read_text())
+    assert len(data["stages"]["total"]["runs"]) == 2
+    assert "WhileToForLoop" in data["stages"]
+
+    # a baseline that was much faster fails the gate
+    for timing in data["stages"].values():
+        timing["median"] /= 100
+        timing["mad"] = 0
+    baseline.write_text(json.dumps(data))
+    with pytest.raises(SystemExit) as exc:
+        cli.main([*common, "--min-seconds", "0", "--compare", str(baseline)])
+    assert exc.value.code == 1
+    out, err = capsys.readouterr()
+    assert "REGRESSED" in out
+    assert "stages regressed" in err
+
+
+def test_missing_corpus_is_an_error(tmp_path):
+    (tmp_path / "empty").mkdir()
+    for corpus in (tmp_path / "typo", tmp_path / "empty"):
+        with pytest.raises(SystemExit) as exc:
+            cli.main(["bench", "--corpus", str(corpus), "--repeat", "1"])
+        assert str(corpus) in str(exc.value.code)
+
+
+def test_save_over_the_compared_baseline(tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.py").write_text("x = 1\n")
+    baseline = tmp_path / "baseline.json"
+    common = ["bench", "--corpus", str(corpus), "--repeat", "2"]
+    common += ["--synthetic", "1", "--min-seconds", "0"]
+    cli.main([*common, "--save", str(baseline)])
+    data = json.loads(baseline.read_text())
+    for timing in data["stages"].values():
+        timing["median"] /= 100
+        timing["mad"] = 0
+    baseline.write_text(json.dumps(data))
+    # compared with what was there, then replaced
+    with pytest.raises(SystemExit):
+        cli.main(
+            [*common, "--save", str(baseline), "--compare", str(baseline)]
+        )
+    assert json.loads(baseline.read_text()) != data
@@ -1,6 +1,8 @@
 import logging
 from argparse import Namespace
 
+import pytest
+
 from py2star import cli
 
 logger = logging.getLogger(__name__)
@@ -11,3 +13,22 @@ def test_execute(fixture_file):
     assert namespace
     print(namespace)
     cli.execute(namespace)
+
+
+@pytest.mark.parametrize(
+    "value", ["six", "six=", "six=third_party", "not a module=vendor"]
+)
+def test_malformed_stdlib_override_is_a_usage_error(value, capsys):
+    with pytest.raises(SystemExit) as exc:
+        cli.make_parser().parse_args(
+            ["larkify", "mod.py", "--stdlib-override", value]
+        )
+    assert exc.value.code == 2
+    assert "--stdlib-override" in capsys.readouterr().err
+
+
+def test_stdlib_override():
+    args = cli.make_parser().parse_args(
+        ["larkify", "mod.py", "--stdlib-override", "six.moves=stdlib"]
+    )
+    assert args.stdlib_override == [("six.moves", "stdlib")]
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from py2star import cli, definition_index
+
+PACKAGE = {
+    "pkg/__init__.py": "",
+    "pkg/keys.py": '''
+class Key(object):
+    """a key"""
+
+    def __init__(self, n, e=65537):
+        self.n = n
+
+    async def export(self, *, fmt: str = "PEM") -> bytes:
+        def helper():
+            pass
+        return b""
+
+
+if True:
+    def generate(bits):
+        """
+        generate a key
+
+        of bits size
+        """
+        return Key(bits)
+''',
+    "script.py": "def main(argv=None):\n    pass\n",
+}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name, source in PACKAGE.items():
+        path = tmp_path / "src" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+    return tmp_path / "src"
+
+
+def test_definitions(tree):
+    index = definition_index.DefinitionIndex()
+    index.update([str(tree)], jobs=1)
+    assert {d.qualname: d.kind for d in index} == {
+        "pkg.keys.Key": "class",
+        "pkg.keys.Key.__init__": "method",
+        "pkg.keys.Key.export": "method",
+        "pkg.keys.Key.export.<locals>.helper": "function",
+        "pkg.keys.generate": "function",
+        "script.main": "function",
+    }
+    key = index.get("pkg.keys.Key")
+    assert (key.signature, key.docstring) == ("class Key(object)", "a key")
+    export = index.get("pkg.keys.Key.export")
+    # spacing around the default depends on the unparser
+    assert export.signature.replace(" = ", "=") == (
+        "async def export(self, *, fmt: str='PEM') -> bytes"
+    )
+    assert (export.lineno, export.end_lineno) == (8, 11)
+    generate = index.find("generate")[0]
+    assert generate.docstring == "generate a key\n\nof bits size"
+    assert generate.path == str(tree / "pkg" / "keys.py")
+
+
+@pytest.mark.parametrize("filename", ["defs.json", "defs.sqlite"])
+def test_incremental_index(tree, tmp_path, filename):
+    index_path = str(tmp_path / filename)
+    first = definition_index.build_index([str(tree)], index_path, jobs=2)
+    assert len(first.parsed) == 3
+
+    again = definition_index.build_index([str(tree)], index_path, jobs=2)
+    assert again.parsed == []
+    assert list(again) == list(first)
+
+    (tree / "script.py").write_text("def main():\n    pass\n")
+    os.remove(tree / "pkg" / "__init__.py")
+    changed = definition_index.build_index([str(tree)], index_path)
+    # pkg/ is no package anymore, so keys.py is a top level module now
+    assert sorted(os.path.basename(p) for p in changed.parsed) == [
+        "keys.py",
+        "script.py",
+    ]
+    assert changed.get("script.main").signature == "def main()"
+    assert changed.get("keys.Key") is not None
+    loaded = definition_index.DefinitionIndex.load(index_path)
+    assert list(loaded) == list(changed)
+
+
+def test_cli_defs_index(tree, tmp_path, capsys):
+    index_path = str(tmp_path / "defs.json")
+    cli.main(["defs", str(tree), "--index", index_path, "-j", "1"])
+    assert "indexed 6 definitions in 3 files" in capsys.readouterr().err
+    index = definition_index.DefinitionIndex.load(index_path)
+    assert index.get("pkg.keys.generate").lineno == 15
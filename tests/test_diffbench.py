@@ -0,0 +1,49 @@
+import io
+
+from py2star import diffbench
+
+SAMPLE = """
+def count(n):
+    i = 0
+    while i < n:
+        i += 1
+    return i
+
+
+def twice(n):
+    return count(n) * 2
+
+
+def kinds(values):
+    return [isinstance(v, int) for v in values]
+
+
+BENCH_CALLS = ["twice(100)", "kinds([1, 'a'])"]
+"""
+
+
+def test_compare_transpiled_module(tmp_path):
+    path = tmp_path / "sample.py"
+    path.write_text(SAMPLE)
+    with diffbench.DiffBench(str(path), repeat=1) as bench:
+        # a threshold nothing reaches skips attributing slowdowns
+        timings = bench.compare(threshold=1e9)
+    assert [t.call for t in timings] == ["twice(100)", "kinds([1, 'a'])"]
+    for t in timings:
+        assert t.error is None
+        assert t.same
+        assert t.ratio > 0
+        assert not t.flagged
+    out = io.StringIO()
+    diffbench.report(timings, out)
+    assert "twice(100)" in out.getvalue()
+
+
+def test_only_reachable_changes_are_attributed():
+    defs = diffbench._definitions(SAMPLE)
+    assert diffbench._reachable("twice(1)", defs) == {"twice", "count"}
+    assert diffbench._reachable("kinds([])", defs) == {"kinds"}
+    changed = diffbench._changed(
+        defs, diffbench._definitions(SAMPLE.replace("i += 1", "i = i + 1"))
+    )
+    assert changed == {"count"}
@@ -0,0 +1,77 @@
+import io
+import time
+
+import pytest
+
+from py2star import cli, find_pattern
+
+
+def _tree(source):
+    return find_pattern.driver.parse_string(source + "\n")
+
+
+def test_synthesize():
+    tree = _tree("g.throw(E, V, T)")
+    assert find_pattern.synthesize(tree) == (
+        "power< 'g' trailer< '.' 'throw' > "
+        "trailer< '(' arglist< 'E' ',' 'V' ',' 'T' > ')' > >"
+    )
+    assert find_pattern.synthesize(tree, "(E, V, T)") == (
+        "trailer< '(' arglist< 'E' ',' 'V' ',' 'T' > ')' >"
+    )
+    with pytest.raises(LookupError):
+        find_pattern.synthesize(tree, "throw(E")
+
+
+def test_node_paths():
+    tree = _tree("x = g(1)")
+    paths = {
+        find_pattern.format_path(path): str(node).strip()
+        for path, node in find_pattern.candidates(tree)
+    }
+    assert paths["0.0"] == "x = g(1)"
+    assert paths["0.0.2"] == "g(1)"
+    assert str(find_pattern.node_at(tree, "0.0.2")).strip() == "g(1)"
+    with pytest.raises(LookupError):
+        find_pattern.node_at(tree, "0.9")
+
+
+def test_batch_main(capsys):
+    assert find_pattern.main(["find_pattern.py", "--path", "0.0", "g(1)"]) == 0
+    assert capsys.readouterr().out == "power< 'g' trailer< '(' '1' ')' > >\n"
+    cli.main(["fixpattern", "x = g(1)", "--match", "g(1)"])
+    assert capsys.readouterr().out == "power< 'g' trailer< '(' '1' ')' > >\n"
+
+
+def test_profile_patterns(tmp_path):
+    (tmp_path / "test_x.py").write_text(
+        "class T(unittest.TestCase):\n"
+        "    def test(self):\n"
+        "        self.assertEqual(1, 1)\n"
+        "        self.assertTrue(json.loads('1'))\n"
+    )
+    stats = find_pattern.profile_patterns(
+        [str(tmp_path)], ["fix_asserts", "fix_known_imports"]
+    )
+    by_fixer = {s.fixer: s for s in stats}
+    assert set(by_fixer) == {"FixAsserts", "FixKnownImports"}
+    assert by_fixer["FixAsserts"].hits == 2
+    # unittest.TestCase and json.loads
+    assert by_fixer["FixKnownImports"].hits == 2
+    assert by_fixer["FixAsserts"].attempts > 10
+    out = io.StringIO()
+    find_pattern.report(stats, out)
+    assert "FixAsserts" in out.getvalue()
+
+
+def test_compile_seconds_leave_out_tool_setup(tmp_path, monkeypatch):
+    (tmp_path / "x.py").write_text("x = 1\n")
+    tool = find_pattern.refactor.RefactoringTool
+
+    def slow_tool(*args, **kwargs):
+        time.sleep(0.5)
+        return tool(*args, **kwargs)
+
+    monkeypatch.setattr(find_pattern.refactor, "RefactoringTool", slow_tool)
+    (stat,) = find_pattern.profile_patterns([str(tmp_path)], ["fix_asserts"])
+    assert 0 < stat.compile_seconds < 0.5
@@ -0,0 +1,163 @@
+import ast
+import collections
+import os
+
+import pytest
+
+from py2star import fixturepacker
+
+
+@pytest.fixture
+def fixture_dir(tmp_path):
+    root = tmp_path / "data"
+    root.mkdir()
+    (root / "a.bin").write_bytes(bytes(range(256)) * 8)
+    (root / "b.txt").write_bytes(b"hello world\n" * 100)
+    (root / "copy_of_a.bin").write_bytes(bytes(range(256)) * 8)
+    (root / "empty").write_bytes(b"")
+    (root / "subdir").mkdir()
+    return root
+
+
+def test_single_dict_output(fixture_dir, tmp_path):
+    out = tmp_path / "out"
+    fixturepacker.pack_fixture(str(fixture_dir), str(out))
+    path = out / fixturepacker.DEFAULT_FIXTURE_NAME
+    packed = ast.literal_eval(path.read_text())
+    # streamed, but the same as repr()-ing the whole dict
+    assert path.read_text() == repr(packed)
+    assert sorted(packed) == ["a.bin", "b.txt", "copy_of_a.bin", "empty"]
+    for name in packed:
+        assert fixturepacker.load_fixture(str(path), name) == (
+            fixture_dir / name
+        ).read_bytes()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_sharded_output(fixture_dir, tmp_path, compress):
+    out = tmp_path / "out"
+    packer = fixturepacker.pack_fixture(
+        str(fixture_dir), str(out), shard_size=1024, compress=compress
+    )
+    path = out / fixturepacker.DEFAULT_FIXTURE_NAME
+    index = fixturepacker.load_index(str(path))
+    assert index["COMPRESSION"] == ("zlib" if compress else None)
+    assert index["SHARDS"] == packer.shards
+    if not compress:
+        assert len(packer.shards) > 1
+    # identical files share a blob
+    assert index["FIXTURES"]["a.bin"] == index["FIXTURES"]["copy_of_a.bin"]
+    blobs = {}
+    for shard in index["SHARDS"]:
+        blobs.update(fixturepacker.load_index(str(out / shard))["BLOBS"])
+    assert len(blobs) == 3
+    for name in index["FIXTURES"]:
+        assert fixturepacker.load_fixture(str(path), name) == (
+            fixture_dir / name
+        ).read_bytes()
+    assert sorted(os.listdir(out)) == sorted(
+        [
+            fixturepacker.DEFAULT_FIXTURE_NAME,
+            fixturepacker.manifest_name(fixturepacker.DEFAULT_FIXTURE_NAME),
+            *packer.shards,
+        ]
+    )
+
+
+@pytest.mark.parametrize("shard_size", [None, 1024])
+@pytest.mark.parametrize("processes", [False, True])
+def test_incremental_repack(fixture_dir, tmp_path, shard_size, processes):
+    out = str(tmp_path / "out")
+    path = os.path.join(out, fixturepacker.DEFAULT_FIXTURE_NAME)
+
+    def pack():
+        return fixturepacker.pack_fixture(
+            str(fixture_dir),
+            out,
+            shard_size=shard_size,
+            jobs=2,
+            processes=processes,
+        )
+
+    first = pack()
+    if shard_size:
+        # the copy shares the blob of a.bin
+        assert first.encoded == ["a.bin", "b.txt", "empty"]
+    else:
+        assert len(first.encoded) == 4
+    outputs = {n: os.stat(os.path.join(out, n)) for n in os.listdir(out)}
+
+    # a touched file is hashed again, but nothing is encoded or rewritten
+    os.utime(fixture_dir / "b.txt")
+    again = pack()
+    assert again.encoded == [] and again.written == [
+        fixturepacker.manifest_name(fixturepacker.DEFAULT_FIXTURE_NAME)
+    ]
+    for name in os.listdir(out):
+        if not name.endswith(".json"):
+            assert os.stat(os.path.join(out, name)) == outputs[name]
+
+    (fixture_dir / "b.txt").write_bytes(b"changed")
+    (fixture_dir / "new").write_bytes(b"new")
+    (fixture_dir / "empty").unlink()
+    changed = pack()
+    if shard_size:
+        assert sorted(changed.encoded) == ["b.txt", "new"]
+    assert fixturepacker.load_fixture(path, "b.txt") == b"changed"
+    assert fixturepacker.load_fixture(path, "new") == b"new"
+    assert fixturepacker.load_fixture(path, "a.bin") == bytes(range(256)) * 8
+    assert "empty" not in fixturepacker.load_index(path)["FIXTURES"]
+    assert not [n for n in os.listdir(out) if n.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("shard_size", [None, 1024])
+def test_stale_files_are_read_once(
+    fixture_dir, tmp_path, monkeypatch, shard_size
+):
+    out = str(tmp_path / "out")
+    reads = collections.Counter()
+
+    def counting_open(path, mode="r", *args, **kwargs):
+        if mode == "rb":
+            reads[os.path.basename(path)] += 1
+        return open(path, mode, *args, **kwargs)
+
+    def pack():
+        reads.clear()
+        return fixturepacker.pack_fixture(
+            str(fixture_dir), out, shard_size=shard_size, jobs=2
+        )
+
+    monkeypatch.setattr(fixturepacker, "open", counting_open, raising=False)
+    pack()
+    assert set(reads.values()) == {1}
+
+    # one file changed, one only touched
+    (fixture_dir / "b.txt").write_bytes(b"changed")
+    os.utime(fixture_dir / "a.bin")
+    pack()
+    if shard_size:
+        assert reads == {"a.bin": 1, "b.txt": 1}
+    else:
+        assert set(reads.values()) == {1}
+
+    # a file added: the stale ones are hashed as they are encoded
+    (fixture_dir / "new").write_bytes(b"new")
+    os.utime(fixture_dir / "empty")
+    pack()
+    if shard_size:
+        assert reads == {"empty": 1, "new": 1}
+    else:
+        assert set(reads.values()) == {1}
+    path = os.path.join(out, fixturepacker.DEFAULT_FIXTURE_NAME)
+    assert fixturepacker.load_fixture(path, "b.txt") == b"changed"
+    assert fixturepacker.load_fixture(path, "new") == b"new"
+
+
+def test_main(fixture_dir, tmp_path):
+    out = tmp_path / "out"
+    fixturepacker.main([str(fixture_dir), str(out), "vectors.star", "-z"])
+    assert fixturepacker.load_fixture(str(out / "vectors.star"), "b.txt") == (
+        b"hello world\n" * 100
+    )
+    assert (out / "vectors_0.star").is_file()
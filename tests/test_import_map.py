@@ -0,0 +1,74 @@
+import json
+from lib2to3 import refactor
+
+import pytest
+
+from py2star.import_map import DEFAULT_MAPPING, ImportMap
+
+FIXER = "py2star.fixes.fix_known_imports"
+
+
+def _fix(source, import_map=None):
+    options = {"import_map": import_map} if import_map else None
+    tool = refactor.RefactoringTool([FIXER], options)
+    return str(tool.refactor_string(source, "<test>")).strip()
+
+
+def test_resolve_uses_longest_mapped_prefix():
+    imap = ImportMap().updated(
+        {"Crypto": ("vendor", "pycryptodome"), "Crypto.Util": ("stdlib", "u")}
+    )
+    assert imap.resolve("json") == ("stdlib", "json")
+    assert imap.resolve("Crypto.Hash.SHA256") == (
+        "vendor",
+        "pycryptodome/Hash/SHA256",
+    )
+    assert imap.resolve("Crypto.Util.strxor") == ("stdlib", "u/strxor")
+    assert imap.resolve("os") is None
+
+
+def test_load_extends_defaults(tmp_path):
+    path = tmp_path / "imports.json"
+    path.write_text(
+        json.dumps(
+            {
+                "imports": {
+                    "six": ["vendor", "six"],
+                    "json": {"namespace": "vendor", "target": "simplejson"},
+                }
+            }
+        )
+    )
+    imap = ImportMap.load(str(path))
+    assert imap["six"] == ("vendor", "six")
+    assert imap["json"] == ("vendor", "simplejson")
+    assert set(DEFAULT_MAPPING) <= set(imap)
+    assert set(ImportMap.load(str(path), extend_defaults=False)) == {
+        "six",
+        "json",
+    }
+
+
+def test_invalid_namespace():
+    with pytest.raises(ValueError, match="namespace"):
+        ImportMap({"six": ("pypi", "six")})
+
+
+def test_fix_known_imports():
+    assert _fix("import json\n") == 'load("@stdlib//json","json")'
+    assert _fix("from assertpy import assert_that\n") == (
+        'load("@vendor//asserts","asserts")'
+    )
+    assert _fix("import os\n") == "import os"
+
+
+def test_fix_known_imports_keeps_unmapped_names():
+    assert _fix("import os, json\n") == (
+        'import os\nload("@stdlib//json","json")'
+    )
+
+
+def test_fix_known_imports_with_import_map():
+    imap = ImportMap().updated({"six": ("vendor", "six")})
+    assert _fix("import six\n", imap) == 'load("@vendor//six","six")'
+    assert _fix("import six\n") == "import six"
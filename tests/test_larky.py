@@ -0,0 +1,194 @@
+import importlib
+import os
+import sys
+from collections import namedtuple
+
+import pytest
+
+from py2star import larky
+
+
+def test_struct_types_are_interned():
+    a = larky.struct(x=1, y=2)
+    b = larky.struct(x=3, y=4)
+    assert type(a) is type(b)
+    assert type(larky.struct(y=1, x=2)) is not type(a)
+
+
+def test_struct_keeps_namedtuple_semantics():
+    s = larky.struct(x=1, y="a")
+    expected = namedtuple("struct", "x y")(x=1, y="a")
+    assert s == expected
+    assert repr(s) == repr(expected) == "struct(x=1, y='a')"
+    assert s == larky.struct(x=1, y="a")
+    assert s != larky.struct(x=1, y="b")
+    assert (s.x, s.y) == (1, "a")
+    assert larky.struct() == ()
+
+
+@pytest.fixture
+def star_path(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    larky.install()
+    yield tmp_path
+    larky.uninstall()
+    for name in ("star_main", "star_pkg", "star_pkg.util"):
+        sys.modules.pop(name, None)
+
+
+def test_import_star_module(star_path):
+    (star_path / "star_pkg").mkdir()
+    (star_path / "star_pkg" / "__init__.star").write_text("")
+    (star_path / "star_pkg" / "util.star").write_text(
+        'load("@stdlib//larky", "larky")\n'
+        "def point(x, y):\n"
+        "    return larky.struct(x=x, y=y)\n"
+    )
+    (star_path / "star_main.star").write_text(
+        'load("@stdlib//json", json="json")\n'
+        'load("@vendor//star_pkg/util", make="point")\n'
+        "VALUE = json.dumps(make(1, 2))\n"
+    )
+    star_main = importlib.import_module("star_main")
+    assert star_main.VALUE == "[1, 2]"
+    assert star_main.__file__ == str(star_path / "star_main.star")
+    assert os.path.isfile(larky.cache_from_source(star_main.__file__))
+
+
+def test_import_star_module_uses_cache(star_path, monkeypatch):
+    compile_star = larky.compile_star
+    source = star_path / "star_main.star"
+    source.write_text("VALUE = 1\n")
+    assert importlib.import_module("star_main").VALUE == 1
+
+    def fail(*args):
+        raise AssertionError("cached code was not used")
+
+    sys.modules.pop("star_main")
+    with monkeypatch.context() as m:
+        m.setattr(larky, "compile_star", fail)
+        assert importlib.import_module("star_main").VALUE == 1
+
+    # a changed source invalidates the cache, whatever its mtime
+    source.write_text("VALUE = 2\n")
+    sys.modules.pop("star_main")
+    assert importlib.import_module("star_main").VALUE == 2
+
+    # and so do changed SHIMS, which compile_star() maps loads with
+    sys.modules.pop("star_main")
+    compiled = []
+    with monkeypatch.context() as m:
+        m.setitem(larky.SHIMS, "@test", {"a": "b"})
+        m.setattr(
+            larky,
+            "compile_star",
+            lambda *args: compiled.append(args) or compile_star(*args),
+        )
+        assert importlib.import_module("star_main").VALUE == 2
+    assert compiled
+
+
+def test_run_transpiled_module(star_path):
+    (star_path / "star_main.star").write_text(
+        'load("@stdlib//larky", larky="larky")\n'
+        'load("@stdlib//larky", "WHILE_LOOP_EMULATION_ITERATION")\n'
+        'load("@stdlib//builtins", builtins="builtins")\n'
+        'load("@stdlib//codecs", codecs="codecs")\n'
+        'load("@stdlib//operator", operator="operator")\n'
+        'load("@stdlib//sets", Set="Set")\n'
+        'load("@stdlib//types", types="types")\n'
+        'load("@vendor//asserts", asserts="asserts")\n'
+        'load("@vendor//option/result", Error="Error")\n'
+        "def _class_Foo():\n"
+        "    def __init__(self, value):\n"
+        "        self.value = value\n"
+        "    __ns = {'__init__': __init__}\n"
+        "    return types.new_class('Foo', (object,), {},"
+        " lambda x: x.update(__ns))\n"
+        "Foo = _class_Foo()\n"
+        "def Bar(value):\n"
+        "    self = larky.mutablestruct(__name__='Bar', __class__=Bar)\n"
+        "    self.value = value\n"
+        "    return self\n"
+        "def countdown(n):\n"
+        "    for _while_ in range(WHILE_LOOP_EMULATION_ITERATION):\n"
+        "        if n <= 0:\n"
+        "            break\n"
+        "        n -= 1\n"
+        "    return n\n"
+        "def check(x):\n"
+        "    if not builtins.isinstance(x, int):\n"
+        "        return Error('TypeError: not an int')\n"
+        "    fail('ValueError: bad value')\n"
+        "d = {'a': 1, 'b': 2}\n"
+        "operator.delitem(d, 'a')\n"
+        "asserts.assert_that(d).is_equal_to({'b': 2})\n"
+        "asserts.assert_that(Foo(1).value).is_equal_to(1)\n"
+        "asserts.assert_that(Bar(2).value).is_equal_to(2)\n"
+        "asserts.assert_that(countdown(10)).is_equal_to(0)\n"
+        "asserts.assert_that(types.is_callable(Foo)).is_true()\n"
+        "asserts.assert_that(2).is_in(Set([1, 2]))\n"
+        "asserts.assert_that(codecs.decode(codecs.encode('é'), 'utf-8'))"
+        ".is_equal_to('é')\n"
+        "asserts.assert_that(check('x').is_err()).is_true()\n"
+        "asserts.assert_fails(lambda: check(1), '.*?ValueError')\n"
+        "asserts.assert_fails(lambda: check('x').unwrap(), '.*?TypeError')\n"
+    )
+    star_main = importlib.import_module("star_main")
+    assert repr(star_main.Bar(1)).startswith("mutablestruct(__name__='Bar'")
+    with pytest.raises(AssertionError, match="to be equal to"):
+        star_main.asserts.assert_that(1).is_equal_to(2)
+
+
+def test_partial_binds_methods():
+    def method(self, x, y=0):
+        return (self, x, y)
+
+    bound = larky.partial(method, "self")
+    assert bound(1, y=2) == ("self", 1, 2)
+    assert larky.partial(method, "self", 1)() == ("self", 1, 0)
+    assert larky.partial(method, "self", y=3)(1) == ("self", 1, 3)
+
+
+def test_run_larkified_shared_class(star_path, tmp_path):
+    from py2star import cli
+
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "star_main.py").write_text(
+        "def twice(f):\n"
+        "    return lambda *args: f(*args) * 2\n"
+        "class Key(object):\n"
+        "    SIZES = (16, 32)\n"
+        "    DEFAULT = SIZES[0]\n"
+        "    def __init__(self, key):\n"
+        "        self.key = key\n"
+        "    def encrypt(self, data):\n"
+        "        return self.helper(self.key) + data\n"
+        "    @twice\n"
+        "    def size(self):\n"
+        "        return self.DEFAULT\n"
+        "    @staticmethod\n"
+        "    def helper(x):\n"
+        "        return x * 2\n"
+        "    @classmethod\n"
+        "    def make(cls):\n"
+        "        return cls(1)\n"
+    )
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "src" / "star_main.py"),
+            "--class-encoding",
+            "shared",
+            "-o",
+            str(star_path),
+        ]
+    )
+    star_main = importlib.import_module("star_main")
+    # the class is a constructor function, classmethods hang off instances
+    key = star_main.Key(7).make()
+    assert key.key == 1
+    assert key.encrypt(3) == 5
+    assert key.helper(4) == 8
+    assert key.size() == 32
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from py2star import cli, metrics
+
+
+def test_merge_and_prometheus_text():
+    a, b = metrics.Metrics(), metrics.Metrics()
+    a.inc(metrics.FILES_CONVERTED)
+    b.inc(metrics.FILES_CONVERTED, 2)
+    b.inc(metrics.STAGE_SECONDS, 0.5, stage="parse")
+    a.observe(metrics.FILE_SECONDS, 0.02)
+    b.observe(metrics.FILE_SECONDS, 100)
+    a.set(metrics.PEAK_RSS, 10)
+    b.set(metrics.PEAK_RSS, 5)
+    a.merge(b)
+    assert a.get(metrics.FILES_CONVERTED) == 3
+    # gauges keep the largest value
+    assert a.get(metrics.PEAK_RSS) == 10
+    text = a.to_prometheus()
+    assert "# TYPE py2star_file_seconds histogram" in text
+    assert 'py2star_file_seconds_bucket{le="0.025"} 1' in text
+    assert 'py2star_file_seconds_bucket{le="+Inf"} 2' in text
+    assert "py2star_file_seconds_count 2" in text
+    assert 'py2star_stage_seconds_total{stage="parse"} 0.5' in text
+    assert "py2star_files_converted_total 3" in text.splitlines()
+
+
+@pytest.mark.parametrize("jobs", [[], ["--jobs", "2"]])
+def test_larkify_writes_metrics(tmp_path, jobs):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("import os\nimport os.path\n")
+    (tmp_path / "pkg" / "b.py").write_text("import os\nb = 1\n")
+    prom, run = tmp_path / "py2star.prom", tmp_path / "run.json"
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "pkg"),
+            "-o",
+            str(tmp_path / "out"),
+            "--metrics",
+            str(prom),
+            "--metrics",
+            str(run),
+            *jobs,
+        ]
+    )
+    summary = json.loads(run.read_text())["summary"]
+    assert summary["files_converted"] == 2
+    assert summary["files_failed"] == 0
+    assert summary["bytes_read"] == len("import os\nimport os.path\n") + len(
+        "import os\nb = 1\n"
+    )
+    assert summary["bytes_written"] == sum(
+        len(p.read_bytes()) for p in (tmp_path / "out").iterdir()
+    )
+    for stage in ("read", "parse", "codegen", "WhileToForLoop"):
+        assert summary["stage_seconds"][stage] > 0
+    assert 0 < summary["cache_hit_rate"] < 1
+    assert summary["peak_rss_bytes"] > 0
+    assert "py2star_files_converted_total 2" in prom.read_text()
+
+
+def test_retried_files_are_counted_once(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    for name in ("a", "b"):
+        (tmp_path / "pkg" / f"{name}.py").write_text(f"{name} = 1\n")
+    run = tmp_path / "run.json"
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "pkg"),
+            "-o",
+            str(tmp_path / "out"),
+            "--metrics",
+            str(run),
+            # every file hits the limit, then converts serially
+            "--file-timeout",
+            "0.001",
+            "--retry-serially",
+        ]
+    )
+    summary = json.loads(run.read_text())["summary"]
+    assert summary["files_converted"] == 2
+    assert summary["files_failed"] == 0
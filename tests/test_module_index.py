@@ -0,0 +1,80 @@
+import json
+import logging
+
+import pytest
+
+from py2star import module_index
+
+logger = logging.getLogger(__name__)
+
+
+def test_stdlib_index_classifies_top_level_package():
+    index = module_index.StdlibIndex()
+    assert index.is_stdlib("json")
+    assert index.is_stdlib("xml.etree.ElementTree")
+    assert index.is_stdlib("larky")
+    assert index.is_stdlib("sets")
+    assert not index.is_stdlib("Crypto.Hash")
+    assert not index.is_stdlib("")
+    assert index.namespace("Crypto") == module_index.VENDOR
+
+
+def test_stdlib_index_overrides():
+    index = module_index.StdlibIndex(
+        overrides={"Crypto": "stdlib", "Crypto.Util": "vendor", "json": "vendor"}
+    )
+    assert index.is_stdlib("Crypto.Hash.SHA256")
+    assert not index.is_stdlib("Crypto.Util.strxor")
+    assert not index.is_stdlib("json")
+    assert index.is_stdlib("binascii")
+
+
+def test_stdlib_index_is_persisted(tmp_path):
+    path = str(tmp_path / "stdlib.json")
+    index = module_index.StdlibIndex.load(path)
+    assert json.load(open(path))["names"] == sorted(index.names)
+    assert module_index.StdlibIndex.load(path).names == index.names
+
+
+@pytest.fixture()
+def project(tmp_path):
+    pkg = tmp_path / "jose"
+    (pkg / "backends").mkdir(parents=True)
+    (pkg / "__init__.py").write_text("")
+    (pkg / "utils.py").write_text("def b64(x):\n    return x\n")
+    (pkg / "backends" / "__init__.py").write_text("from .base import *\n")
+    (pkg / "backends" / "base.py").write_text(
+        "import json\n\n__all__ = ['Key']\n\n\nclass Key(object):\n    pass\n"
+    )
+    (tmp_path / "scripts").mkdir()
+    (tmp_path / "scripts" / "run.py").write_text("import jose\n")
+    return tmp_path
+
+
+def test_package_index_walks_project(project):
+    index = module_index.PackageIndex.build([str(project)])
+    names = sorted(index.module_name(p) for p in index.sources)
+    assert names == [
+        "jose",
+        "jose.backends",
+        "jose.backends.base",
+        "jose.utils",
+        "run",
+    ]
+    assert index.roots == {str(project), str(project / "scripts")}
+    assert index.is_project_module("jose.utils")
+    assert not index.is_project_module("json")
+    assert index.exports("jose.backends.base") == ("Key",)
+    assert index.exports("jose.utils") == ("b64",)
+
+
+def test_package_index_resolves_relative_imports(project):
+    index = module_index.PackageIndex.build([str(project / "jose" / "backends")])
+    base = str(project / "jose" / "backends" / "base.py")
+    init = str(project / "jose" / "backends" / "__init__.py")
+    assert index.module_name(base) == "jose.backends.base"
+    assert index.resolve(base, 1, "utils") == "jose.backends.utils"
+    assert index.resolve(base, 2, "utils") == "jose.utils"
+    assert index.resolve(init, 1, "base") == "jose.backends.base"
+    assert index.resolve(init, 2) == "jose"
+    assert index.resolve(base, 4, "utils") is None
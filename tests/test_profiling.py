@@ -0,0 +1,113 @@
+import cProfile
+import json
+import pstats
+import time
+
+import pytest
+
+from py2star import cli, profiling
+
+
+def _leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def _branch():
+    return _leaf(20000) + _leaf(20000)
+
+
+def test_collapsed_stacks_follow_callers():
+    profiler = cProfile.Profile()
+    profiler.runcall(_branch)
+    stacks = profiling.collapsed_stacks(pstats.Stats(profiler))
+    leaf_stacks = [s for s in stacks if s.split(";")[-1].endswith(":_leaf")]
+    assert leaf_stacks
+    for stack in leaf_stacks:
+        frames = stack.split(";")
+        assert frames[-2].endswith(":_branch")
+    assert all(count > 0 for count in stacks.values())
+
+
+def _many_callers():
+    for i in range(300):
+        # a distinct caller of _leaf each time
+        exec(f"def caller_{i}(f): return f(50)\ncaller_{i}(_leaf)", globals())
+    _leaf(200000)
+
+
+def test_small_stacks_are_cut():
+    profiler = cProfile.Profile()
+    profiler.runcall(_many_callers)
+    stats = pstats.Stats(profiler)
+    stacks = profiling.collapsed_stacks(stats)
+    leaf = [s for s in stacks if s.split(";")[-1].endswith(":_leaf")]
+    # not a _leaf stack per caller
+    assert len(leaf) < 10
+    # but the time is all there, give or take rounding
+    total = sum(tottime for _, _, tottime, _, _ in stats.stats.values())
+    assert sum(stacks.values()) == pytest.approx(total * 1e6, rel=0.01)
+
+
+def _module(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "mod.py").write_text(
+        "def f(n):\n    i = 0\n    while i < n:\n        i += 1\n    return i\n"
+    )
+
+
+def test_profile_one_transformer(tmp_path):
+    _module(tmp_path)
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "pkg"),
+            "-o",
+            str(tmp_path / "out"),
+            "--profile-transformer",
+            "WhileToForLoop",
+            "--profile-dir",
+            str(tmp_path / "prof"),
+        ]
+    )
+    assert sorted(p.name for p in (tmp_path / "prof").iterdir()) == [
+        "mod.WhileToForLoop.collapsed",
+        "mod.WhileToForLoop.pstats",
+    ]
+    stats = pstats.Stats(str(tmp_path / "prof" / "mod.WhileToForLoop.pstats"))
+    assert any(name == "leave_While" for _, _, name in stats.stats)
+    lines = (tmp_path / "prof" / "mod.WhileToForLoop.collapsed").read_text()
+    stack, count = lines.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert any("rewrite_loopz.py" in line for line in lines.splitlines())
+
+
+def test_profiles_are_saved_outside_the_timings(tmp_path, monkeypatch):
+    _module(tmp_path)
+    save = profiling.save
+
+    def slow_save(profiler, prefix):
+        time.sleep(2)
+        save(profiler, prefix)
+
+    monkeypatch.setattr(profiling, "save", slow_save)
+    run = tmp_path / "run.json"
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "pkg"),
+            "-o",
+            str(tmp_path / "out"),
+            "--profile-transformer",
+            "WhileToForLoop",
+            "--profile-dir",
+            str(tmp_path / "prof"),
+            "--metrics",
+            str(run),
+        ]
+    )
+    assert (tmp_path / "prof" / "mod.WhileToForLoop.collapsed").exists()
+    summary = json.loads(run.read_text())["summary"]
+    assert summary["stage_seconds"]["WhileToForLoop"] < 2
+    metric = json.loads(run.read_text())["metrics"]
+    (file_seconds,) = [m for m in metric if m["name"].endswith("file_seconds")]
+    assert file_seconds["sum"] < 2
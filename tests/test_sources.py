@@ -0,0 +1,31 @@
+import logging
+
+import pytest
+
+from py2star import sources
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.parametrize(
+    "raw,expected",
+    [
+        (b"x = 1\n", "x = 1\n"),
+        (b"\xef\xbb\xbfx = '\xc3\xa9'\n", "x = 'é'\n"),
+        (
+            b"# -*- coding: latin-1 -*-\r\nx = '\xe9'\r\n",
+            "# -*- coding: latin-1 -*-\nx = 'é'\n",
+        ),
+    ],
+)
+def test_read_source(tmp_path, monkeypatch, raw, expected):
+    path = tmp_path / "mod.py"
+    path.write_bytes(raw)
+    stats = sources.SourceStats()
+    assert sources.read_source(str(path), stats) == expected
+    # and again, memory mapped.
+    monkeypatch.setattr(sources, "MMAP_THRESHOLD", 1)
+    assert sources.read_source(str(path), stats) == expected
+    assert stats.files == 2
+    assert stats.bytes_read == 2 * len(raw)
+    assert "read 2 files" in str(stats)
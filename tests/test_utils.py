@@ -0,0 +1,66 @@
+import io
+import logging
+
+import pytest
+
+from py2star import utils
+
+logger = logging.getLogger(__name__)
+
+
+def _full_reindent(source):
+    r = utils.ReIndenter(io.StringIO(source))
+    r.run()
+    return "".join(r.after)
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "def f(a,\n        b):\n    return (a +\n            b)\n",
+        'x = """\n  not indentation\n"""\n# comment\n',
+        "if x:\n    pass\nelse:\n    # dangling\n    y = [\n  1,\n    ]\n",
+        "",
+    ],
+)
+def test_needs_reindent_skips_normalized_source(source):
+    assert not utils.needs_reindent(source)
+    assert _full_reindent(source) == source
+    assert utils.reindent(source) == source
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "if x:\n\tpass\n",
+        "if x:\n  pass\n",
+        "if (a and\n    b):\n        pass\n",
+        "x = 1   \n",
+        "x = 1\n\n\n",
+        "x = 1",
+    ],
+)
+def test_needs_reindent_detects_changes(source):
+    assert utils.needs_reindent(source)
+    assert _full_reindent(source) != source
+
+
+def test_reindent_matches_reindenter(simple_class):
+    source = (
+        "class Foo(object):\n"
+        "  # a comment\n"
+        "  def bar(self):\n"
+        "\treturn [1,\n"
+        "\t        2]\n"
+        "    # hanging comment\n"
+    )
+    assert utils.reindent(source) == _full_reindent(source)
+    assert utils.reindent(source) == (
+        "class Foo(object):\n"
+        "    # a comment\n"
+        "    def bar(self):\n"
+        "        return [1,\n"
+        "                2]\n"
+        "    # hanging comment\n"
+    )
+    assert utils.reindent(simple_class) == _full_reindent(simple_class)
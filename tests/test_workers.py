@@ -0,0 +1,191 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from py2star import cli, workers
+
+
+def convert(filename, batch):
+    batch.enter("read")
+    with open(filename) as f:
+        text = f.read()
+    batch.stats.files += 1
+    if "sleep" in text:
+        batch.enter("sleeping")
+        time.sleep(60)
+    if "grow" in text:
+        batch.enter("growing")
+        hog = bytearray(512 << 20)  # noqa: F841
+        time.sleep(60)
+    if "fail" in text:
+        raise ValueError("no")
+    if "later" in text:
+        # after the result is sent, while the worker is idle
+        threading.Thread(target=_later, args=(text,), daemon=True).start()
+    return f"{os.getpid()} {text}"
+
+
+_hogs = []
+
+
+def _later(text):
+    time.sleep(0.2)
+    if "leak" in text:
+        _hogs.append(bytearray(512 << 20))
+    else:
+        os._exit(1)
+
+
+def _inputs(tmp_path, *texts):
+    filenames = []
+    for i, text in enumerate(texts):
+        path = tmp_path / f"f{i}.py"
+        path.write_text(text)
+        filenames.append(str(path))
+    return filenames
+
+
+def test_results_in_input_order_and_recycled(tmp_path):
+    filenames = _inputs(tmp_path, *(f"x{i}" for i in range(6)))
+    batch = cli.Batch()
+    results = []
+    retries = workers.run(
+        filenames,
+        convert,
+        batch,
+        lambda filename, out: results.append((filename, out)),
+        jobs=2,
+        limits=workers.Limits(max_files=1),
+    )
+    assert retries == []
+    assert [f for f, _ in results] == filenames
+    assert [out.split()[1] for _, out in results] == [
+        f"x{i}" for i in range(6)
+    ]
+    # a fresh worker for every file
+    assert len({out.split()[0] for _, out in results}) == 6
+    assert batch.stats.files == 6
+
+
+def test_limits_go_to_the_retry_list(tmp_path):
+    filenames = _inputs(tmp_path, "ok", "sleep", "fail", "grow", "ok too")
+    results = {}
+    started = time.perf_counter()
+    retries = workers.run(
+        filenames,
+        convert,
+        cli.Batch(),
+        results.__setitem__,
+        jobs=2,
+        limits=workers.Limits(deadline=2, max_rss=256 << 20),
+    )
+    assert time.perf_counter() - started < 30
+    assert sorted(results) == [filenames[0], filenames[4]]
+    by_file = {r.filename: r for r in retries}
+    assert sorted(by_file) == filenames[1:4]
+    assert by_file[filenames[1]].reason == workers.DEADLINE
+    assert by_file[filenames[1]].stage == "sleeping"
+    assert by_file[filenames[1]].elapsed >= 2
+    assert by_file[filenames[2]].reason == workers.ERROR
+    assert "ValueError" in by_file[filenames[2]].detail
+    assert by_file[filenames[3]].reason == workers.RSS
+    assert by_file[filenames[3]].stage == "growing"
+
+
+def test_larkify_with_jobs(tmp_path, capsys):
+    (tmp_path / "pkg").mkdir()
+    for name in ("a", "b"):
+        (tmp_path / "pkg" / f"{name}.py").write_text(f"{name} = 1\n")
+    retry_list = tmp_path / "retries.json"
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "pkg"),
+            "--jobs",
+            "2",
+            "--output-dir",
+            str(tmp_path / "out"),
+            "--retry-list",
+            str(retry_list),
+        ]
+    )
+    assert sorted(os.listdir(tmp_path / "out")) == ["a.star", "b.star"]
+    assert "a = 1" in (tmp_path / "out" / "a.star").read_text()
+    assert "read 2 files" in capsys.readouterr().err
+    # nothing hit a limit
+    assert json.loads(retry_list.read_text()) == []
+
+
+def test_trace_spans_per_worker(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    for name in ("a", "b", "c"):
+        (tmp_path / "pkg" / f"{name}.py").write_text(f"{name} = 1\n")
+    trace = tmp_path / "trace.json"
+    cli.main(
+        [
+            "larkify",
+            str(tmp_path / "pkg"),
+            "--jobs",
+            "2",
+            "--max-files-per-worker",
+            "1",
+            "-o",
+            str(tmp_path / "out"),
+            "--trace",
+            str(trace),
+        ]
+    )
+    events = json.loads(trace.read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    files = [e for e in spans if e["cat"] == "file"]
+    assert len(files) == 3
+    # every file was converted in a worker of its own
+    assert len({e["pid"] for e in files}) == 3
+    names = {e["name"] for e in spans if e["args"]["file"] == files[0]["name"]}
+    for stage in ("read", "reindent", "parse", "metadata", "codegen", "write"):
+        assert stage in names
+    assert "WhileToForLoop" in names
+    assert {e["args"]["name"] for e in events if e["ph"] == "M"} == {
+        "py2star",
+        "worker",
+    }
+
+
+def test_idle_worker_is_not_charged_for_rss(tmp_path):
+    (filename,) = _inputs(tmp_path, "leak later")
+    worker = workers._Worker(
+        multiprocessing.get_context(), convert, cli.Batch(), 256 << 20
+    )
+    try:
+        worker.assign(filename)
+        while True:
+            kind, *payload = worker.conn.recv()
+            if kind == "done":
+                break
+        time.sleep(1)
+        # the RSS went over the cap with no file in progress
+        assert not worker.conn.poll()
+        assert worker.process.is_alive()
+    finally:
+        worker.kill()
+
+
+def test_worker_that_died_while_idle_is_replaced(tmp_path):
+    filenames = _inputs(tmp_path, "exit later", "ok")
+    results = []
+
+    def on_result(filename, out):
+        results.append(filename)
+        time.sleep(0.5)  # the worker exits meanwhile
+
+    retries = workers.run(
+        filenames,
+        convert,
+        cli.Batch(),
+        on_result,
+        limits=workers.Limits(deadline=10),
+    )
+    assert retries == []
+    assert results == filenames